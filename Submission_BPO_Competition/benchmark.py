@@ -0,0 +1,559 @@
+import sys
+import random
+import contextlib
+import cProfile
+import pstats
+import io
+import math
+import os
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from evolution import evolve, WarmStartArchive, Resources, ResourceSnapshot, FitnessPool, OPTIMIZERS
+from main import GAPlanner
+from parallel_simulator import PartitionedHealthcareProblem, ParallelSimulator
+from planners import Planner
+from problems import HealthcareProblem, HealthcareElements, Element, ElementType
+from random_streams import RandomStreams
+from simulator import Simulator, AvailableResources, UnassignedTasks
+
+BASE_TIME = datetime(2018, 1, 1, 0, 0, 0)
+MAX_CAPACITIES = {'OR': 5, 'A_BED': 30, 'B_BED': 40, 'INTAKE': 4, 'ER_PRACTITIONER': 9}
+DIAGNOSES = ["A1", "A2", "A3", "A4", "B1", "B2", "B3", "B4"]
+
+
+def generate_replan_requests(num_requests, seed):
+    """
+    Generates a sequence of replan requests as they are issued by the planner during the regular planning moments.
+    Every fourth request replans a patient that has already been replanned before.
+
+    :param num_requests (int): number of replan requests
+    :param seed (int): random seed
+    :return: list of tuples (cid, current_time, diagnosis, sent_home_counter, first_admission_time, last_replan_time)
+    """
+    rng = random.Random(seed)
+    requests = []
+    for i in range(num_requests):
+        current_time = BASE_TIME + timedelta(hours=18 + 24 * (i // 8), minutes=rng.randint(0, 59))
+        if i >= 4 and i % 4 == 0:
+            cid, _, diagnosis, sent_home_counter, first_admission_time, _ = requests[i - 4]
+            last_replan_time = current_time - timedelta(hours=rng.randint(0, 8))
+            requests.append((cid, current_time, diagnosis, sent_home_counter + 1, first_admission_time, last_replan_time))
+        else:
+            requests.append((i, current_time, rng.choice(DIAGNOSES), 1, current_time, current_time))
+    return requests
+
+
+def run_replan_sequence(requests, warm_start, seed):
+    """
+    Runs evolve() for every replan request and records the convergence curve of each request.
+
+    :return: list of lists: best score per iteration for each request
+    """
+    random.seed(seed)
+    replanned_patients = {}
+    curves = []
+    for cid, current_time, diagnosis, sent_home_counter, first_admission_time, last_replan_time in requests:
+        replanned_patients.pop(cid, None)
+        patients_to_replan = {cid: {
+            "diagnosis": diagnosis,
+            "sent_home_counter": sent_home_counter,
+            "first_admission_time": first_admission_time,
+            "last_replan_time": last_replan_time,
+            "min_replan_time": current_time + timedelta(hours=24, seconds=1),
+            "new_admission_time": current_time + timedelta(hours=24, seconds=1)
+        }}
+        history = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            evolve(patients_to_replan, replanned_patients, [], MAX_CAPACITIES, current_time, warm_start=warm_start, history=history)
+        curves.append(history)
+    return curves
+
+
+def average_curve(curves, iterations=10):
+    """
+    Averages convergence curves; curves that stopped early keep their last best score.
+    """
+    averaged = []
+    for i in range(iterations):
+        values = [min(curve[:i + 1]) for curve in curves]
+        averaged.append(sum(values) / len(values))
+    return averaged
+
+
+def benchmark_warm_start(num_requests=200, seed=42):
+    """
+    Compares the convergence curves of cold-started and warm-started evolutions on the same replan requests.
+    """
+    requests = generate_replan_requests(num_requests, seed)
+    cold_curves = run_replan_sequence(requests, None, seed)
+    warm_curves = run_replan_sequence(requests, WarmStartArchive(), seed)
+    cold = average_curve(cold_curves)
+    warm = average_curve(warm_curves)
+
+    print(f"Convergence over {num_requests} replan requests (average best fitness, lower is better)")
+    print("iteration   cold      warm")
+    for i, (cold_score, warm_score) in enumerate(zip(cold, warm)):
+        print(f"{i + 1:>9}   {cold_score:<8.3f}  {warm_score:<8.3f}")
+    reached = next((i + 1 for i, score in enumerate(warm) if score <= cold[-1]), None)
+    print(f"cold start final fitness after {len(cold)} iterations: {cold[-1]:.3f}")
+    print(f"warm start reaches it after: {reached} iterations")
+    print(f"average iterations run: cold {sum(map(len, cold_curves)) / num_requests:.2f}, warm {sum(map(len, warm_curves)) / num_requests:.2f}")
+
+
+def create_planner(warm_start=False):
+    return GAPlanner("./temp/benchmark_event_log.csv", ["diagnosis"], warm_start=warm_start)
+
+
+def benchmark_checkpoint(warm_up_days=14, evaluation_days=7, seed=42):
+    """
+    Compares planner variants from the same warm simulation state, once by re-simulating the warm-up for every variant
+    and once by forking every variant from a single checkpoint.
+    """
+    variants = {"cold start GA": False, "warm start GA": True}
+    warm_up_time = warm_up_days * 24
+    running_time = (warm_up_days + evaluation_days) * 24
+
+    print(f"Planner variants after {warm_up_days} days warm-up, evaluated for {evaluation_days} days")
+    start = time.perf_counter()
+    for name, warm_start in variants.items():
+        random.seed(seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = Simulator(create_planner(warm_start), HealthcareProblem()).run(running_time)
+        print(f"re-simulated  {name:<14} {result}")
+    resimulation_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    random.seed(seed)
+    simulator = Simulator(create_planner(), HealthcareProblem())
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.run_until(warm_up_time)
+    checkpoint = simulator.checkpoint()
+    for name, warm_start in variants.items():
+        forked_simulator = Simulator.from_checkpoint(checkpoint, create_planner(warm_start))
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = forked_simulator.run(running_time)
+        print(f"forked        {name:<14} {result}")
+    fork_duration = time.perf_counter() - start
+
+    print(f"checkpoint size: {len(checkpoint.data) / 1024:.1f} KiB")
+    print(f"re-simulation: {resimulation_duration:.2f}s, checkpoint + forks: {fork_duration:.2f}s")
+
+
+class DelayPlanner(Planner):
+    """
+    Cheap planner for benchmarks: plans every element at the first working hour that is at least 24 + delay hours ahead.
+    """
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def plan(self, plannable_elements, simulation_time):
+        planned_elements = []
+        for case_id, element_labels in sorted(plannable_elements.items()):
+            time = simulation_time + 24 + self.delay
+            while time // 24 % 7 >= 5 or not (8 <= time % 24 <= 16): # move to the next working hour
+                time += 1
+            for element_label in element_labels:
+                planned_elements.append((case_id, element_label, time))
+        return planned_elements
+
+
+def total_score(result):
+    return sum(result.values())
+
+
+def benchmark_common_random_numbers(replications=6, days=14):
+    """
+    Compares two planners over several replications, once with the global random module and once with common random numbers.
+    With common random numbers the difference between the planners varies much less between the replications.
+    Also compares the cost of drawing single samples.
+    """
+    print(f"Score difference of DelayPlanner(0) and DelayPlanner(24) over {replications} replications of {days} days")
+    for mode in ["global random", "common random numbers"]:
+        differences = []
+        for replication in range(replications):
+            scores = []
+            for delay in [0, 24]:
+                random.seed(replication)
+                random_streams = RandomStreams(replication) if mode == "common random numbers" else None
+                simulator = Simulator(DelayPlanner(delay), HealthcareProblem(random_streams))
+                scores.append(total_score(simulator.run(days * 24)))
+            differences.append(scores[0] - scores[1])
+        mean = sum(differences) / replications
+        std = (sum((d - mean) ** 2 for d in differences) / (replications - 1)) ** 0.5
+        print(f"{mode:<22} mean difference: {mean:9.2f}  std of difference: {std:8.2f}")
+
+    samples = 1000000
+    random_streams = RandomStreams(0)
+    start = time.perf_counter()
+    for _ in range(samples):
+        random.normalvariate(8, 2)
+    global_duration = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(samples):
+        random_streams.normal("processing_nursing", 8, 2)
+    streams_duration = time.perf_counter() - start
+    print(f"{samples} normal samples: random.normalvariate {global_duration:.2f}s, RandomStreams.normal {streams_duration:.2f}s")
+
+
+def create_task_queue(problem, queue_length, seed):
+    """
+    Creates a queue of unassigned tasks with random labels and diagnoses, of which every tenth is an emergency task.
+    """
+    rng = random.Random(seed)
+    unassigned_tasks = UnassignedTasks(problem.assignment_bucket)
+    for case_id in range(queue_length):
+        case_type = "EM" if case_id % 10 == 0 else rng.choice(["A", "B"])
+        problem.case_type[case_id] = case_type
+        problem.case_data[case_id] = {"diagnosis": rng.choice(["A", "B"]) + str(rng.randint(1, 4))}
+        label = rng.choice([HealthcareElements.INTAKE, HealthcareElements.SURGERY, HealthcareElements.NURSING, HealthcareElements.ER_TREATMENT])
+        task = Element(case_id, case_type, problem.get_unique_element_id(), label, ElementType.TASK)
+        unassigned_tasks[task.id] = task
+    return unassigned_tasks
+
+
+def assign_resources_scan(problem, unassigned_tasks, available_resources):
+    """
+    The former assign_resources, which scans all unassigned tasks and intersects the free resources with their pool.
+    """
+    assignments = []
+    resources_to_use = set(available_resources)
+    emergency_tasks = filter(lambda k : k.case_type == 'EM', unassigned_tasks.values())
+    for emergency_task in emergency_tasks:
+        valid_resources = list(resources_to_use & set(problem.resource_pool(emergency_task)))
+        if valid_resources:
+            assignments.append((emergency_task, valid_resources[0]))
+            resources_to_use.remove(valid_resources[0])
+    non_emergency_tasks = filter(lambda k : k.case_type != 'EM', unassigned_tasks.values())
+    for non_emergency_task in non_emergency_tasks:
+        valid_resources = list(resources_to_use & set(problem.resource_pool(non_emergency_task)))
+        if valid_resources:
+            assignments.append((non_emergency_task, valid_resources[0]))
+            resources_to_use.remove(valid_resources[0])
+    return assignments
+
+
+def benchmark_assign_resources(queue_lengths=(100, 1000, 10000), free_resources=(1, 10), calls=200, seed=42):
+    """
+    Compares assign_resources with the scan over all unassigned tasks for long queues, as they occur when the hospital is overloaded.
+    Every call assigns the given number of free resources of each type to the queue.
+    """
+    print(f"Time per assign_resources call, average over {calls} calls")
+    for queue_length in queue_lengths:
+        for free_per_type in free_resources:
+            problem = HealthcareProblem()
+            unassigned_tasks = create_task_queue(problem, queue_length, seed)
+            resources_by_type = dict()
+            for resource in problem.resources:
+                resources_by_type.setdefault(resource.type, []).append(resource)
+            available_resources = AvailableResources(r for resources in resources_by_type.values() for r in resources[:free_per_type])
+
+            durations = dict()
+            results = dict()
+            for name, assign in [("scan", lambda tasks, resources: assign_resources_scan(problem, tasks, resources)), ("buckets", problem.assign_resources)]:
+                start = time.perf_counter()
+                for _ in range(calls):
+                    assignments = assign(unassigned_tasks, available_resources)
+                durations[name] = (time.perf_counter() - start) / calls
+                results[name] = [task.id for (task, resource) in assignments]
+            if results["scan"] != results["buckets"]:
+                raise ValueError("assign_resources and the scan assign different tasks")
+            print(f"queue {queue_length:>6}, {free_per_type:>2} free per type: scan {durations['scan'] * 1000:8.3f}ms, "
+                  f"buckets {durations['buckets'] * 1000:8.3f}ms, speedup {durations['scan'] / durations['buckets']:7.1f}x")
+
+
+def benchmark_event_coalescing(days=60, seed=3):
+    """
+    Runs the same simulation with and without coalescing of ASSIGN_RESOURCES and PLAN_EVENTS events
+    and compares the number of processed events per type and the results.
+    """
+    results = dict()
+    event_counts = dict()
+    for coalesce_events in [False, True]:
+        random.seed(seed)
+        simulator = Simulator(DelayPlanner(0), HealthcareProblem(), coalesce_events=coalesce_events)
+        start = time.perf_counter()
+        results[coalesce_events] = simulator.run(days * 24)
+        duration = time.perf_counter() - start
+        event_counts[coalesce_events] = simulator.event_counts
+        print(f"coalesce_events={coalesce_events!s:<5}: {sum(simulator.event_counts.values())} events in {duration:.2f}s, {results[coalesce_events]}")
+    if results[False] != results[True]:
+        raise ValueError("Coalescing events changed the results")
+    print(f"Processed events over {days} days")
+    for event_type in event_counts[False]:
+        print(f"{event_type.name:<24} {event_counts[False][event_type]:>8} -> {event_counts[True][event_type]:>8}")
+
+
+def benchmark_memory(days=365, seed=3):
+    """
+    Measures the peak memory of a long simulation run and the size of the elements it keeps.
+    """
+    random.seed(seed)
+    tracemalloc.start()
+    simulator = Simulator(DelayPlanner(0), HealthcareProblem())
+    start = time.perf_counter()
+    simulator.run(days * 24)
+    duration = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elements = list(simulator.task_start_end_times.keys()) + list(simulator.event_times.keys())
+    element_size = sum(sys.getsizeof(element) + (sys.getsizeof(element.__dict__) if hasattr(element, "__dict__") else 0) for element in elements) / len(elements)
+    print(f"{days} days in {duration:.2f}s (with tracemalloc): peak memory {peak / 2**20:.1f} MiB, memory at end {current / 2**20:.1f} MiB")
+    print(f"{len(elements)} elements kept by the simulator, {element_size:.0f} bytes per element without its data")
+
+
+def benchmark_intake_load(days=60, seed=3):
+    """
+    Profiles a simulation with high intake load: patients proceed to intake regardless of how many patients are done with intake,
+    so many patients wait for surgery / nursing after intake. Reports the time spent in the methods that track these patients.
+    """
+    random.seed(seed)
+    problem = HealthcareProblem()
+    problem.max_patients_after_intake = float("inf")
+    simulator = Simulator(DelayPlanner(0), problem)
+    max_patients_after_intake = 0
+    profiler = cProfile.Profile()
+    profiler.enable()
+    while simulator.now <= days * 24:
+        simulator.run_until(simulator.now + 1)
+        max_patients_after_intake = max(max_patients_after_intake, len(problem.patients_after_intake))
+    profiler.disable()
+    stats = pstats.Stats(profiler).stats
+    print(f"{days} days with high intake load: up to {max_patients_after_intake} patients after intake")
+    for (filename, line, function), (calls, primitive_calls, total_time, cumulative_time, callers) in stats.items():
+        if filename.endswith("problems.py") and function in ["start_task", "complete_element"]:
+            print(f"{function:<18} {calls:>8} calls, {cumulative_time:.3f}s cumulative, {cumulative_time / calls * 1e6:.2f}us per call")
+
+
+def scores_close(result, other_result):
+    """
+    Compares two results up to floating point error, as the running scores sum the penalties in a different order.
+    """
+    return result.keys() == other_result.keys() and all(math.isclose(result[k], other_result[k], rel_tol=1e-9) for k in result)
+
+
+def benchmark_streaming_scores(days=180, report_every_days=30, seed=3):
+    """
+    Compares the memory of a simulation that retains the history of all elements with one that only keeps the running scores.
+    The scores are evaluated during the run, which the running scores allow at any time.
+    """
+    results = dict()
+    for retain_history in [True, False]:
+        random.seed(seed)
+        tracemalloc.start()
+        simulator = Simulator(DelayPlanner(0), HealthcareProblem(), retain_history=retain_history)
+        memory = []
+        for day in range(report_every_days, days + 1, report_every_days):
+            simulator.run_until(day * 24)
+            memory.append(f"{tracemalloc.get_traced_memory()[0] / 2**20:.1f}")
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[retain_history] = simulator.problem.evaluate()
+        if retain_history and not scores_close(results[retain_history], simulator.problem.evaluate_from_history()):
+            raise ValueError("The running scores differ from the scores evaluated from the history")
+        print(f"retain_history={retain_history!s:<5}: peak {peak / 2**20:.1f} MiB, MiB every {report_every_days} days: {', '.join(memory)}")
+    if results[True] != results[False]:
+        raise ValueError("Dropping the history changed the scores")
+    print(f"scores after {days} days: {results[False]}")
+
+
+def benchmark_metrics(days=60, interval=1, seed=3):
+    """
+    Measures the overhead of sampling metrics every interval hours and writes the samples to ./temp/metrics.csv.
+    """
+    durations = dict()
+    for sample in [False, True]:
+        random.seed(seed)
+        simulator = Simulator(DelayPlanner(0), HealthcareProblem())
+        if sample:
+            simulator.start_metrics(interval=interval)
+        start = time.perf_counter()
+        simulator.run(days * 24)
+        durations[sample] = time.perf_counter() - start
+    os.makedirs("./temp", exist_ok=True)
+    simulator.metrics.to_csv("./temp/metrics.csv")
+    rows = simulator.metrics.rows()
+    longest_queues = {column: int(rows[:, i].max()) for i, column in enumerate(simulator.metrics.columns) if column.startswith("queue_")}
+    print(f"{days} days: {durations[False]:.2f}s without metrics, {durations[True]:.2f}s with {len(simulator.metrics)} samples every {interval}h")
+    print(f"longest queues: {longest_queues}")
+
+
+def benchmark_profiling(days=60, seed=3):
+    """
+    Measures the overhead of the per event type profiling, with and without cProfile capture, and prints the profile.
+    """
+    durations = dict()
+    for capture in ["off", None, "cprofile"]:
+        random.seed(seed)
+        simulator = Simulator(DelayPlanner(0), HealthcareProblem())
+        if capture != "off":
+            simulator.enable_profiling(capture)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.run(days * 24)
+        durations[capture] = time.perf_counter() - start
+        if capture is None:
+            summary = simulator.profiler.summary()
+    print(f"{days} days: {durations['off']:.2f}s without profiling, {durations[None]:.2f}s with per event type timing, {durations['cprofile']:.2f}s with cProfile capture")
+    print(summary)
+
+
+def benchmark_resource_snapshot(patients=300, changes=5, repeat=1000):
+    """
+    Compares populating the planner resources from the full resource list with ISO 8601 start times on every replan
+    with updating a kept ResourceSnapshot by the entries that changed since the last replan.
+    """
+    tasks = ["intake", "ER_treatment", "surgery", "nursing"]
+    def resource(cid, version):
+        return {'cid': cid, 'task': tasks[(cid + version) % len(tasks)], 'start': (BASE_TIME + timedelta(hours=cid * 0.5 + version)).isoformat(),
+                'info': {'diagnosis': "AB"[cid % 2] + "1"}, 'wait': cid % 5 == 0}
+    resource_list = [resource(cid, 0) for cid in range(patients)]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        Resources(MAX_CAPACITIES).populate_resources(resource_list)
+    full_duration = (time.perf_counter() - start) / repeat
+    snapshot = ResourceSnapshot()
+    snapshot.update(resource_list)
+    start = time.perf_counter()
+    for version in range(1, repeat + 1):
+        for cid in range(version * changes % patients, version * changes % patients + changes):
+            snapshot.set(cid, resource(cid, version))
+        Resources(MAX_CAPACITIES).populate_resources(snapshot)
+    snapshot_duration = (time.perf_counter() - start) / repeat
+    print(f"{patients} patients, {changes} changes per replan: {full_duration * 1e6:.1f} us from the full list, {snapshot_duration * 1e6:.1f} us with a snapshot")
+
+
+def benchmark_parallel_simulation(days=365, seeds=(1, 2, 3)):
+    """
+    Compares the sequential simulation of the PartitionedHealthcareProblem with the ParallelSimulator, with the logical processes
+    in separate processes and one after the other in this process. All must give the same scores.
+    The logical processes keep much shorter event lists, so even in one process the parallel simulation is faster,
+    running them in separate processes additionally needs a core per logical process to pay off.
+    """
+    print(f"{days} days, sequential / parallel with processes / parallel in one process")
+    for seed in seeds:
+        durations = []
+        start = time.perf_counter()
+        simulator = Simulator(DelayPlanner(0), PartitionedHealthcareProblem(RandomStreams(seed)), retain_history=False)
+        simulator.run_until(days * 24)
+        result = simulator.problem.evaluate()
+        durations.append(time.perf_counter() - start)
+        for processes in [True, False]:
+            start = time.perf_counter()
+            parallel_simulator = ParallelSimulator(DelayPlanner(0), seed, processes=processes)
+            parallel_result = parallel_simulator.run(days * 24)
+            durations.append(time.perf_counter() - start)
+            if not scores_close(result, parallel_result):
+                raise ValueError("The parallel simulation differs from the sequential simulation", seed, result, parallel_result)
+        print(f"seed {seed}: {' / '.join(f'{duration:.2f}s' for duration in durations)}, "
+              f"{parallel_simulator.rounds} rounds, {parallel_simulator.messages} messages")
+
+
+def create_replan_situation(replanned_count, seed):
+    """
+    Creates a replan request of one patient in a hospital with replanned_count already replanned patients within the next week.
+
+    :return: tuple (patients_to_replan, replanned_patients, resources, current_time)
+    """
+    rng = random.Random(seed)
+    current_time = BASE_TIME + timedelta(days=30, hours=18)
+    replanned_patients = {}
+    for cid in range(replanned_count):
+        admission_time = current_time + timedelta(hours=24 + rng.randint(0, 24 * 6 * 60) / 60)
+        replanned_patients[cid] = {"diagnosis": rng.choice(DIAGNOSES), "sent_home_counter": 1, "first_admission_time": admission_time.isoformat(),
+                                   "last_replan_time": admission_time.isoformat(), "new_admission_time": admission_time.isoformat()}
+    patients_to_replan = {replanned_count: {
+        "diagnosis": "A2",
+        "sent_home_counter": 1,
+        "first_admission_time": current_time,
+        "last_replan_time": current_time,
+        "min_replan_time": current_time + timedelta(hours=24, seconds=1),
+        "new_admission_time": current_time + timedelta(hours=24, seconds=1)
+    }}
+    resources = [{"cid": 10**6 + i, "task": "surgery", "start": 24.0 * 30, "info": {"diagnosis": "A2"}, "wait": i % 2 == 0} for i in range(10)]
+    return patients_to_replan, replanned_patients, resources, current_time
+
+
+def benchmark_fitness_pool(population_sizes=(10, 100, 1000, 10000), processes=None, replanned_count=300, seed=42):
+    """
+    Compares the duration of evolve() with serial fitness evaluation and with a FitnessPool for growing population sizes.
+    Both must choose the same admission time, as the workers compute the same fitness from the shared memory block.
+    """
+    fitness_pool = FitnessPool(processes, min_population=0)
+    print(f"evolve() with {replanned_count} replanned patients, {fitness_pool.processes} worker processes on {os.cpu_count()} cores")
+    try:
+        for population_size in population_sizes:
+            durations = []
+            results = []
+            for pool in [None, fitness_pool]:
+                patients_to_replan, replanned_patients, resources, current_time = create_replan_situation(replanned_count, seed)
+                random.seed(seed)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = evolve(patients_to_replan, replanned_patients, resources, MAX_CAPACITIES, current_time,
+                                    population_size=population_size, fitness_pool=pool)
+                durations.append(time.perf_counter() - start)
+                results.append(result[replanned_count]["new_admission_time"])
+            if results[0] != results[1]:
+                raise ValueError("The fitness pool changed the result of evolve()", population_size, results)
+            print(f"population {population_size:>6}: serial {durations[0] * 1000:9.1f} ms, pool {durations[1] * 1000:9.1f} ms, speedup {durations[0] / durations[1]:.2f}")
+    finally:
+        fitness_pool.close()
+
+
+def benchmark_optimizers(num_requests=200, population_size=10, iterations=10, seed=42):
+    """
+    Compares the optimizers of OPTIMIZERS on the same sequence of replan requests: the latency per request and the fitness
+    of the chosen admission times (lower is better). The replanned patients grow with the choices of each optimizer.
+    """
+    requests = generate_replan_requests(num_requests, seed)
+    print(f"{num_requests} replan requests, population size {population_size}, {iterations} iterations")
+    print("optimizer   latency ms (mean / max)   fitness (mean / max)")
+    for name, optimizer_class in OPTIMIZERS.items():
+        random.seed(seed)
+        replanned_patients = {}
+        latencies = []
+        fitnesses = []
+        for cid, current_time, diagnosis, sent_home_counter, first_admission_time, last_replan_time in requests:
+            replanned_patients.pop(cid, None)
+            patients_to_replan = {cid: {
+                "diagnosis": diagnosis,
+                "sent_home_counter": sent_home_counter,
+                "first_admission_time": first_admission_time,
+                "last_replan_time": last_replan_time,
+                "min_replan_time": current_time + timedelta(hours=24, seconds=1),
+                "new_admission_time": current_time + timedelta(hours=24, seconds=1)
+            }}
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                optimizer = optimizer_class(patients_to_replan, replanned_patients, [], MAX_CAPACITIES, current_time)
+                replan_times = optimizer.optimize(population_size=population_size, iterations=iterations)
+            latencies.append(time.perf_counter() - start)
+            fitnesses.append(optimizer.score(replan_times))
+            replanned_patients[cid] = dict(patients_to_replan[cid], new_admission_time=replan_times[cid])
+        print(f"{name:<10} {sum(latencies) / num_requests * 1000:8.2f} / {max(latencies) * 1000:6.2f}"
+              f"          {sum(fitnesses) / num_requests:7.3f} / {max(fitnesses):7.3f}")
+
+
+BENCHMARKS = {
+    "warm_start": benchmark_warm_start,
+    "checkpoint": benchmark_checkpoint,
+    "crn": benchmark_common_random_numbers,
+    "assign_resources": benchmark_assign_resources,
+    "events": benchmark_event_coalescing,
+    "memory": benchmark_memory,
+    "intake_load": benchmark_intake_load,
+    "streaming_scores": benchmark_streaming_scores,
+    "metrics": benchmark_metrics,
+    "profiling": benchmark_profiling,
+    "resource_snapshot": benchmark_resource_snapshot,
+    "parallel": benchmark_parallel_simulation,
+    "fitness_pool": benchmark_fitness_pool,
+    "optimizers": benchmark_optimizers,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS.keys())
+    for name in names:
+        BENCHMARKS[name]()
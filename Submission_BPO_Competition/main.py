@@ -2,14 +2,18 @@ from simulator import Simulator, EventType
 from planners import Planner
 from problems import HealthcareProblem
 from reporter import EventLogReporter
-from sim2planner_interface import simulate_endpoint, convert_to_iso8601, get_available_resources, convert_to_hours_since_2018
+from evolution import WarmStartArchive, ReplannedPatients, ResourceSnapshot
+from sim2planner_interface import simulate_endpoint, convert_to_iso8601, get_available_resources
 
 class GAPlanner(Planner):
-    def __init__(self, eventlog_file, data_columns):
+    def __init__(self, eventlog_file, data_columns, warm_start=False, optimizer="ga"):
         super().__init__()
         self.eventlog_reporter = EventLogReporter(eventlog_file, data_columns)
-        self.replanned_patients = dict() # cid: sent_home_counter, first_admission_time, last_replan_time, new_admission_time
+        self.replanned_patients = ReplannedPatients() # cid: sent_home_counter, first_admission_time, last_replan_time, new_admission_time
+        self.warm_start = WarmStartArchive() if warm_start else None # warm-start mode: seeds the evolution with recent replans and stops it early
+        self.optimizer = optimizer # name of the optimizer in OPTIMIZERS that chooses the admission times
         self.current_state = dict() 
+        self.resource_snapshot = ResourceSnapshot() # aggregate of current_state, updated on every change of it
         
     def plan(self, plannable_elements, simulation_time):
         print("TIME: ", simulation_time)
@@ -18,21 +22,16 @@ class GAPlanner(Planner):
         
         max_capacities = get_available_resources(self.planner_helper.available_resources())
         
+        # clean up replanned_patients: patients whose admission time has passed are no longer relevant for replanning
+        self.replanned_patients.expire(simulation_time, keep=plannable_elements)
+        
         for case_id, element_labels in sorted(plannable_elements.items()):
             available_info = dict()
             available_info['cid'] = case_id
             available_info['time'] = simulation_time_iso
-            available_info['info'] = simulator.planner.planner_helper.get_case_data(case_id)
-            available_info['resources'] = list(map(lambda el: dict({'cid': el[0]}, **el[1]), self.current_state.items()))
-
-            for resource in available_info['resources']:
-                resource['start'] = convert_to_iso8601(resource['start'])
-            
-            # clean up replanned_patients dictionary
-            for cid in list(self.replanned_patients.keys()):
-                replan_time = convert_to_hours_since_2018(self.replanned_patients[cid]["new_admission_time"])
-                if (replan_time <= simulation_time) and (cid not in plannable_elements.keys()):
-                    del self.replanned_patients[cid]
+            available_info['info'] = self.planner_helper.get_case_data(case_id)
+            available_info['resources'] = self.resource_snapshot # instead of a list of current_state with ISO 8601 start times
+            available_info['optimizer'] = self.optimizer
             
             for cid in plannable_elements.keys():
                 if cid in self.replanned_patients.keys(): # update the replanned_patients dictionary
@@ -47,7 +46,7 @@ class GAPlanner(Planner):
                     available_info['info']['last_replan_time'] = simulation_time_iso
             
             # using an actual server endpoint would take too long, so we simulate the endpoint
-            next_plannable_time, replanned_patients = simulate_endpoint(available_info, self.replanned_patients, max_capacities)
+            next_plannable_time, replanned_patients = simulate_endpoint(available_info, self.replanned_patients, max_capacities, warm_start=self.warm_start)
             
             # update self.replanned_patients
             self.replanned_patients[case_id] = replanned_patients[case_id]
@@ -59,13 +58,16 @@ class GAPlanner(Planner):
     def report(self, case_id, element, timestamp, resource, lifecycle_state):
         if((lifecycle_state != EventType.CASE_ARRIVAL) and (lifecycle_state != EventType.COMPLETE_CASE)):
             if(lifecycle_state == EventType.ACTIVATE_TASK):
-                self.current_state[case_id] = {'cid': case_id, 'task': element.label.value, 'start': timestamp, 'info': simulator.planner.planner_helper.get_case_data(case_id), 'wait': True}
+                self.current_state[case_id] = {'cid': case_id, 'task': element.label.value, 'start': timestamp, 'info': self.planner_helper.get_case_data(case_id), 'wait': True}
+                self.resource_snapshot.set(case_id, self.current_state[case_id])
             elif(lifecycle_state == EventType.START_TASK):
                 self.current_state[case_id]['wait'] = False
-                self.current_state[case_id]['info'] = simulator.planner.planner_helper.get_case_data(case_id)
+                self.current_state[case_id]['info'] = self.planner_helper.get_case_data(case_id)
+                self.resource_snapshot.set(case_id, self.current_state[case_id])
             elif(lifecycle_state == EventType.COMPLETE_TASK):
                 if(self.current_state[case_id]['task'] == element.label.value):
                     self.current_state.pop(case_id)
+                    self.resource_snapshot.remove(case_id)
                 else:
                     pass
             else:
@@ -74,8 +76,9 @@ class GAPlanner(Planner):
         self.eventlog_reporter.callback(case_id, element, timestamp, resource, lifecycle_state)
         
 
-planner = GAPlanner("./temp/event_log.csv", ["diagnosis", "sent_home_counter", "first_admission_time", "last_admission_time"])
-problem = HealthcareProblem()
-simulator = Simulator(planner, problem)
-result = simulator.run(365*24)
-print(result)
\ No newline at end of file
+if __name__ == '__main__':
+    planner = GAPlanner("./temp/event_log.csv", ["diagnosis", "sent_home_counter", "first_admission_time", "last_admission_time"])
+    problem = HealthcareProblem()
+    simulator = Simulator(planner, problem)
+    result = simulator.run(365*24)
+    print(result)
\ No newline at end of file
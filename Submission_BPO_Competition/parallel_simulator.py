@@ -0,0 +1,400 @@
+import heapq
+import math
+import multiprocessing
+from planners import Planner
+from problems import HealthcareProblem, HealthcareElements, ResourceType, Element, ElementType, PROCESSING_TIMES
+from problems import ER_TREATMENT_DURATION_FACTOR, SENT_HOME_FACTOR, PROCESSED_FACTOR
+from random_streams import RandomStreams
+from simulator import Simulator, SimulationEvent, EventType
+
+
+MINIMUM_PROCESSING_TIMES = {label: 0.25 for label in PROCESSING_TIMES}  # hours, the lookahead of the logical processes
+# logical process -> (resource type, label of the tasks it performs)
+PARTITIONS = {
+	"intake": (ResourceType.INTAKE, HealthcareElements.INTAKE),
+	"er": (ResourceType.ER_PRACTITIONER, HealthcareElements.ER_TREATMENT),
+	"or": (ResourceType.OR, HealthcareElements.SURGERY),
+	"a_ward": (ResourceType.A_BED, HealthcareElements.NURSING),
+	"b_ward": (ResourceType.B_BED, HealthcareElements.NURSING),
+}
+PARTITION_OF_RESOURCE_TYPE = {resource_type: partition for partition, (resource_type, label) in PARTITIONS.items()}
+WARDS = ["a_ward", "b_ward"]
+ARRIVALS = {"intake": ["A", "B"], "er": ["EM"]}  # case types that arrive at a logical process
+# logical process -> logical processes that can transfer tasks to it: after intake patients go to surgery or nursing,
+# after ER treatment to surgery or the B ward, after surgery to nursing, and after a complication in nursing back to surgery
+TRANSFER_SENDERS = {
+	"intake": [],
+	"er": [],
+	"or": ["intake", "er", "a_ward", "b_ward"],
+	"a_ward": ["intake", "or"],
+	"b_ward": ["intake", "er", "or"],
+}
+STARTED_SENDERS = ["or", "a_ward", "b_ward"]  # logical processes that report the start of surgery / nursing of patients after intake to the intake
+TRANSFER = "transfer"  # message kind: a task of a case is activated in the receiving logical process
+STARTED = "started"  # message kind: surgery / nursing of a patient after intake has started
+
+
+class PartitionedHealthcareProblem(HealthcareProblem):
+	"""
+	The HealthcareProblem in the form that the ParallelSimulator can split into logical processes. It differs in three ways:
+	- processing times are at least MINIMUM_PROCESSING_TIMES, which bounds how soon a task can be passed on and gives the lookahead,
+	- the nursing times and complications of the A and the B ward are drawn from separate random streams, so that the wards share no stream,
+	- plannable elements are planned as soon as they become plannable, instead of at the next activation of any element.
+	Simulated with the sequential Simulator, it gives the same scores as the ParallelSimulator with the same seed.
+	"""
+	def __init__(self, random_streams):
+		self.arriving_case_types = None  # case types of the cases returned by next_case, None for all
+		super().__init__(random_streams)
+
+	def minimum_processing_time(self, task):
+		return MINIMUM_PROCESSING_TIMES[task.label]
+
+	def random_purpose(self, purpose, task):
+		if task.label == HealthcareElements.NURSING:
+			return purpose + "_" + self.resource_pool_type(task)
+		return purpose
+
+	def add_can_plan(self, case_id, element_label):
+		super().add_can_plan(case_id, element_label)
+		self.simulator.request_planning()
+
+	def next_case(self):
+		"""
+		Returns the next case of the arriving case types. The cases of the other types are drawn as well, so that case ids stay the same.
+		"""
+		(arrival_time, element) = super().next_case()
+		while self.arriving_case_types is not None and element.case_type not in self.arriving_case_types:
+			del self.case_type[element.case_id]
+			del self.case_data[element.case_id]
+			(arrival_time, element) = super().next_case()
+		return arrival_time, element
+
+
+class NoPlanner(Planner):
+	"""
+	The planner of the logical processes other than the intake, which have nothing to plan.
+	"""
+	def plan(self, plannable_elements, simulation_time):
+		return []
+
+
+class LogicalProcess(Simulator):
+	"""
+	The part of the simulation that performs the tasks of one resource type (see PARTITIONS), with its own events, resources and random streams.
+	Tasks of other resource types are sent to their logical process as timestamped transfer messages instead of being activated.
+	The intake has the planner, which only gets the reports of the intake, and is told when surgery / nursing of its patients after intake starts,
+	which it needs to decide at a time for intake whether the patient can proceed to intake.
+	"""
+	def __init__(self, partition, planner, seed):
+		self.partition = partition
+		(self.resource_type, self.task_label) = PARTITIONS[partition]
+		self.outbox = []  # messages sent since the last step, (time, order, sender, sequence number, destination, kind, content)
+		self.sent = 0  # number of sent messages, orders messages that are otherwise equal
+		self.transfers = dict()  # id of a received task that is not yet activated -> (diagnosis, after intake, end of ER treatment or None)
+		self.after_intake = set()  # received cases after intake whose surgery / nursing has not yet started
+		self.started = dict()  # intake only: case_id -> moment at which surgery / nursing of the patient after intake started
+		self.completing_start = None  # moment at which the task that is being completed started, orders the transfers it causes
+		problem = PartitionedHealthcareProblem(RandomStreams(seed))
+		problem.arriving_case_types = ARRIVALS.get(partition, [])
+		super().__init__(planner if partition == "intake" else NoPlanner(), problem, retain_history=False)
+
+	def init_simulation(self):
+		for resource in self.problem.resources:
+			if resource.type == self.resource_type:
+				self.available_resources.add(resource)
+		self.problem.restart()
+		if self.partition in ARRIVALS:
+			(t, task) = self.problem.next_case()
+			self.events.append((t, SimulationEvent(EventType.CASE_ARRIVAL, t, task)))
+		if self.partition == "intake":
+			next_planning_moment = self.problem.next_regular_planning_moment(0)
+			self.events.append((next_planning_moment, SimulationEvent(EventType.REGULAR_PLANNING_MOMENT, next_planning_moment, None)))
+		self.events.append((0, SimulationEvent(EventType.SCHEDULE_RESOURCES, 0, None)))
+		self.sort_events()
+
+	def activate(self, element):
+		if element.is_task():
+			destination = PARTITION_OF_RESOURCE_TYPE[self.problem.resource_pool_type(element)]
+			if destination != self.partition:
+				self.send_transfer(destination, element)
+				return
+		super().activate(element)
+
+	def send(self, destination, kind, content, order):
+		self.outbox.append((self.now, order, self.partition, self.sent, destination, kind, content))
+		self.sent += 1
+
+	def send_transfer(self, destination, element):
+		"""
+		Passes the task on to its logical process, together with the data of the case that it needs.
+		Transfers of the same moment are received in the order in which the tasks that caused them started, as in the sequential simulation.
+		"""
+		case_id = element.case_id
+		content = (case_id, element.case_type, self.problem.get_case_data(case_id)["diagnosis"], element.label,
+				   case_id in self.problem.patients_after_intake, self.problem.scores.er_waiting.pop(case_id, None))
+		self.send(destination, TRANSFER, content, self.completing_start)
+
+	def deliver(self, messages):
+		for (time, order, sender, sequence_number, destination, kind, content) in messages:
+			if kind == STARTED:
+				self.started[content] = time
+			else:
+				(case_id, case_type, diagnosis, label, after_intake, er_treatment_end) = content
+				element = Element(case_id, case_type, self.problem.get_unique_element_id(), label, ElementType.TASK)
+				self.transfers[element.id] = (diagnosis, after_intake, er_treatment_end)
+				self.events.append((time, SimulationEvent(EventType.ACTIVATE_TASK, time, element)))
+		self.sort_events()
+
+	def receive_transfer(self, element):
+		(diagnosis, after_intake, er_treatment_end) = self.transfers.pop(element.id)
+		case_id = element.case_id
+		if case_id not in self.busy_cases:
+			self.problem.case_type[case_id] = element.case_type
+			self.problem.case_data[case_id] = {"diagnosis": diagnosis}
+			self.case_start_times[case_id] = self.now
+			self.busy_cases[case_id] = []
+		if after_intake:
+			self.after_intake.add(case_id)
+		if er_treatment_end is not None:
+			self.problem.scores.er_treatment_finished(case_id, er_treatment_end)
+		self.activate(element)
+
+	def apply_started(self, time):
+		"""
+		Removes the patients whose surgery / nursing started at or before time from the patients after intake.
+		"""
+		for case_id in list(self.problem.patients_after_intake):
+			if self.started.get(case_id, math.inf) <= time:
+				del self.problem.patients_after_intake[case_id]
+				del self.started[case_id]
+
+	def waits_for_started(self, event, started_bound):
+		"""
+		Returns whether the event is a time for intake that can only be decided once all starts of surgery / nursing up to its moment are known.
+		That is only the case if too many patients after intake are known, as further starts can only lower their number.
+		"""
+		if event.event_type != EventType.COMPLETE_EVENT or event.element.label != HealthcareElements.TIME_FOR_INTAKE:
+			return False
+		self.apply_started(event.moment)
+		return len(self.problem.patients_after_intake) >= self.problem.max_patients_after_intake and started_bound <= event.moment
+
+	def handle_event(self, event):
+		if event.event_type == EventType.ACTIVATE_TASK:
+			self.receive_transfer(event.element)
+			return
+		if event.event_type == EventType.COMPLETE_TASK:
+			self.completing_start = self.busy_resources[event.resource][1]
+		super().handle_event(event)
+		if event.event_type == EventType.START_TASK and event.element.case_id in self.after_intake:
+			self.after_intake.remove(event.element.case_id)
+			self.send("intake", STARTED, event.element.case_id, self.now)
+
+	def next_completion_time(self):
+		for (moment, event) in self.events:
+			if event.event_type == EventType.COMPLETE_TASK:
+				return moment
+		return math.inf
+
+	def step(self, messages, bound, started_bound, until):
+		"""
+		Receives the messages and processes the events before bound, up to and including until.
+		:return: (sent messages, moment of the next event, moment of the next task completion, number of processed events)
+		"""
+		self.deliver(messages)
+		processed = 0
+		while len(self.events) > 0 and self.events[0][0] < bound and self.events[0][0] <= until:
+			if self.partition == "intake" and self.waits_for_started(self.events[0][1], started_bound):
+				break
+			(self.now, event) = self.events.pop(0)
+			self.handle_event(event)
+			self.sort_events()
+			processed += 1
+		(outbox, self.outbox) = (self.outbox, [])
+		next_time = self.events[0][0] if len(self.events) > 0 else math.inf
+		return outbox, next_time, self.next_completion_time(), processed
+
+	def partial_scores(self, until):
+		"""
+		Returns the parts of the scores that this logical process accumulated until the given moment.
+		"""
+		return {
+			'cases_started': self.event_counts[EventType.CASE_ARRIVAL],
+			'er_treatment_excessive': self.problem.scores.er_treatment_excessive_until(until),
+			'sent_home': self.problem.scores.sent_home_count,
+			'released': self.problem.scores.released
+		}
+
+
+def execute(logical_process, command):
+	(name, arguments) = command
+	if name == "step":
+		return logical_process.step(*arguments)
+	elif name == "scores":
+		return logical_process.partial_scores(*arguments)
+	raise ValueError("Unknown command", name)
+
+
+def run_logical_process(connection, partition, planner, seed):
+	logical_process = LogicalProcess(partition, planner, seed)
+	while True:
+		command = connection.recv()
+		if command[0] == "stop":
+			break
+		connection.send(execute(logical_process, command))
+
+
+class LocalHandle:
+	"""
+	Runs a logical process in the current process, one after the other, e.g. for debugging or on a single core.
+	"""
+	def __init__(self, partition, planner, seed):
+		self.logical_process = LogicalProcess(partition, planner, seed)
+		self.result = None
+
+	def send(self, command):
+		self.result = execute(self.logical_process, command)
+
+	def recv(self):
+		return self.result
+
+	def close(self):
+		pass
+
+
+class ProcessHandle:
+	"""
+	Runs a logical process in a separate process, commands are sent through a pipe, so that all logical processes run at the same time.
+	"""
+	def __init__(self, partition, planner, seed):
+		(self.connection, child_connection) = multiprocessing.Pipe()
+		self.process = multiprocessing.Process(target=run_logical_process, args=(child_connection, partition, planner, seed), daemon=True)
+		self.process.start()
+
+	def send(self, command):
+		self.connection.send(command)
+
+	def recv(self):
+		return self.connection.recv()
+
+	def close(self):
+		if self.process.is_alive():
+			self.connection.send(("stop", ()))
+		self.process.join()
+
+
+class ParallelSimulator:
+	"""
+	Experimental conservative parallel discrete event simulation of the PartitionedHealthcareProblem.
+	The simulation is split into the logical processes of PARTITIONS, each with its own event list, which exchange timestamped messages.
+	In every round each logical process gets a bound below which no more messages can arrive for it and processes its events before that bound.
+	The bounds follow from the lookahead: a task can only be passed on when it completes, which is at least its minimum processing time after
+	it starts, and nursing only completes at the release times. Only planners that plan every element as soon as it is offered and that do not need
+	the reports of the other logical processes give the same results as the sequential simulation.
+	"""
+	def __init__(self, planner, seed, processes=True):
+		self.planner = planner  # planner of the intake
+		self.seed = seed  # seed of the random streams of all logical processes
+		self.processes = processes  # if True, every logical process runs in its own process, otherwise all run in this process
+		self.model = PartitionedHealthcareProblem(RandomStreams(seed))  # for the release times of the wards
+		self.rounds = 0  # number of rounds of the last run
+		self.messages = 0  # number of messages of the last run
+
+	def earliest_completion(self, partition, time):
+		"""
+		Returns the earliest moment at which a task of the logical process that starts at or after time can complete.
+		"""
+		if time == math.inf:
+			return math.inf
+		completion = time + MINIMUM_PROCESSING_TIMES[PARTITIONS[partition][1]]
+		if partition in WARDS:
+			return self.model.next_release_time(completion)
+		return completion
+
+	def input_bounds(self, next_times, next_completions):
+		"""
+		Computes for each logical process the bound below which no more transfers can arrive for it. A logical process sends no transfer
+		before its next task completion, or before the earliest completion of a task it starts at its next event or at its own bound.
+		As the OR and the wards transfer to each other, the bounds are lowered until they no longer change,
+		which happens after a few iterations, as every cycle of transfers takes at least one minimum processing time.
+		:return: (dictionary of logical process -> bound, bound of the start of surgery / nursing reported to the intake)
+		"""
+		bounds = {partition: math.inf for partition in PARTITIONS}
+		while True:
+			earliest_transfers = {partition: min(next_completions[partition], self.earliest_completion(partition, min(next_times[partition], bounds[partition])))
+								  for partition in PARTITIONS}
+			new_bounds = {partition: min([earliest_transfers[sender] for sender in TRANSFER_SENDERS[partition]], default=math.inf)
+						  for partition in PARTITIONS}
+			if new_bounds == bounds:
+				break
+			bounds = new_bounds
+		started_bound = min(min(next_times[partition], bounds[partition]) for partition in STARTED_SENDERS)
+		return bounds, started_bound
+
+	def run(self, running_time=24*365):
+		"""
+		Simulates up to and including running_time and returns the scores, which are the same as those of the sequential Simulator
+		after run_until(running_time) with a PartitionedHealthcareProblem of the same seed.
+		"""
+		handle_class = ProcessHandle if self.processes else LocalHandle
+		handles = dict()
+		try:
+			for partition in PARTITIONS:
+				handles[partition] = handle_class(partition, self.planner, self.seed)
+			self.rounds = 0
+			self.messages = 0
+			# messages that are not yet delivered, as heap per destination; a transfer is only delivered once it is before the bound of
+			# its destination, so that the event lists stay short even if a logical process, like the ER, runs far ahead
+			pending = {partition: [] for partition in PARTITIONS}
+			bounds = {partition: -math.inf for partition in PARTITIONS}
+			started_bound = -math.inf
+			next_times = dict()
+			next_completions = dict()
+			while True:
+				for partition, handle in handles.items():
+					messages = []
+					while len(pending[partition]) > 0 and (pending[partition][0][5] == STARTED or pending[partition][0][0] < bounds[partition]):
+						messages.append(heapq.heappop(pending[partition]))
+					handle.send(("step", (messages, bounds[partition], started_bound, running_time)))
+				processed = 0
+				sent = []
+				for partition, handle in handles.items():
+					(messages, next_times[partition], next_completions[partition], count) = handle.recv()
+					processed += count
+					sent += messages
+				for message in sent:
+					(time, order, sender, sequence_number, destination, kind, content) = message
+					if kind == TRANSFER and sender not in TRANSFER_SENDERS[destination]:
+						raise ValueError("Transfer from " + sender + " to " + destination + " is not in TRANSFER_SENDERS.")
+					heapq.heappush(pending[destination], message)
+				self.messages += len(sent)
+				for partition in PARTITIONS:
+					transfers = [message for message in pending[partition][:1] if message[5] == TRANSFER]  # a reported start is no event of the intake
+					if len(transfers) > 0:
+						next_times[partition] = min(next_times[partition], transfers[0][0])
+				if all(next_time > running_time for next_time in next_times.values()):
+					break
+				if self.rounds > 0 and processed == 0 and len(sent) == 0:
+					raise RuntimeError("No logical process can advance at time " + str(min(next_times.values())) + ".")
+				(bounds, started_bound) = self.input_bounds(next_times, next_completions)
+				self.rounds += 1
+			for handle in handles.values():
+				handle.send(("scores", (running_time,)))
+			partial_scores = [handle.recv() for handle in handles.values()]
+		finally:
+			for handle in handles.values():
+				handle.close()
+		return self.evaluate(partial_scores)
+
+	def evaluate(self, partial_scores):
+		"""
+		Combines the partial scores of the logical processes into the scores of HealthcareProblem.evaluate.
+		"""
+		cases_started = sum(scores['cases_started'] for scores in partial_scores)
+		if cases_started == 0:
+			return {'er_treatment_score' : 0, 'sent_home_score' : 0, 'processed_score' : 0}
+		released = sum(scores['released'] for scores in partial_scores)
+		return {
+			'er_treatment_score' : sum(scores['er_treatment_excessive'] for scores in partial_scores) / cases_started * ER_TREATMENT_DURATION_FACTOR,
+			'sent_home_score' : sum(scores['sent_home'] for scores in partial_scores) / cases_started * SENT_HOME_FACTOR,
+			'processed_score' : (cases_started - released) * PROCESSED_FACTOR / cases_started
+		}
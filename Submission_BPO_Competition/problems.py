@@ -1,8 +1,9 @@
 from enum import Enum, auto, StrEnum
-import random
 import pickle
 from abc import ABC, abstractmethod
 import collections
+from bisect import bisect_right
+from random_streams import GlobalRandom
 
 
 class ElementType(Enum):
@@ -10,6 +11,24 @@ class ElementType(Enum):
 	EVENT = auto()
 
 
+class NoData(dict):
+    """
+    The empty data of all elements without data of their own.
+    It is read-only, as data must be added via Problem.add_data, and it stays a single instance when pickled.
+    """
+    def __setitem__(self, key, value):
+        raise TypeError("Data must be added via Problem.add_data.")
+
+    def update(self, *args, **kwargs):
+        raise TypeError("Data must be added via Problem.add_data.")
+
+    def __reduce__(self):
+        return "NO_DATA"
+
+
+NO_DATA = NoData()
+
+
 class Element:
     """
     An element is either a task or an event of a process.
@@ -22,14 +41,17 @@ class Element:
     - element_type: the type of the element, which is either a task or an event.
     - data: a dictionary of data that is associated with the element; the dictionary keys are the data types and the values are the data values.
     - occurrence_time: the time when the event should occur in absolute simulation time; used for events only and must be set for each event.
+    Elements use __slots__, as a long simulation run keeps hundreds of thousands of them.
     """
+    __slots__ = ("id", "case_id", "label", "case_type", "element_type", "data", "occurrence_time")
+
     def __init__(self, case_id, case_type, element_id, label, element_type, occurrence_time=None):
         self.id = element_id
         self.case_id = case_id
         self.label = label
         self.case_type = case_type
         self.element_type = element_type
-        self.data = dict()
+        self.data = NO_DATA
         self.occurrence_time = occurrence_time  # used for time-based events only, represents the time when the event should occur
         if self.is_event() and self.occurrence_time is None:
             raise ValueError("The occurrence time of an event must be set.")
@@ -63,6 +85,38 @@ class Resource:
     def __str__(self):
         return str(self.id)
 
+class ResourceCalendar:
+    """
+    The working times of a week, from which the moments at which resources come and leave are computed,
+    so that the simulator only checks the availability of resources at these moments instead of every hour.
+    Time is in hours since Monday 00:00.
+    """
+    def __init__(self, working_days=5, start_hour=8, end_hour=17):
+        self.working_days = working_days  # working days are the first working_days days of the week
+        self.start_hour = start_hour  # first hour of working time
+        self.end_hour = end_hour  # last hour of working time, inclusive
+        # availability is checked on whole hours, so resources come at start_hour and leave at the first whole hour after end_hour
+        self.changes = []  # sorted hours of the week at which the availability of resources changes
+        for day in range(working_days):
+            self.changes.append(24 * day + start_hour)
+            self.changes.append(24 * day + end_hour + 1)
+
+    def is_working_time(self, time):
+        week_day = time // 24 % 7
+        time_of_day = time % 24
+        return week_day < self.working_days and time_of_day >= self.start_hour and time_of_day <= self.end_hour
+
+    def next_change(self, time):
+        """
+        Returns the first moment after time at which the availability of resources changes.
+        """
+        week_start = time // (24 * 7) * (24 * 7)
+        i = bisect_right(self.changes, time - week_start)
+        if i < len(self.changes):
+            return week_start + self.changes[i]
+        return week_start + 24 * 7 + self.changes[0]
+
+
 class Problem(ABC):
 
     def __init__(self):
@@ -152,6 +206,15 @@ class Problem(ABC):
         """
         raise NotImplementedError
 
+    def complete_case(self, case_id):
+        """
+        Reports when a case has completed, i.e. none of its elements is active anymore.
+        If the simulator does not retain history, the type and data of the case are forgotten.
+        """
+        if not self.simulator.retain_history:
+            del self.case_type[case_id]
+            del self.case_data[case_id]
+
     @abstractmethod
     def data_sample(self, element):
         """
@@ -165,6 +228,21 @@ class Problem(ABC):
 
         return unique_id
     
+    def next_availability_change(self, time):
+        """
+        Returns the next moment after time at which the availability of resources must be checked.
+        By default that is every hour.
+        """
+        return time + 1
+
+    def assignment_bucket(self, task):
+        """
+        Returns the key (priority, resource type) under which an unassigned task is kept by the simulator.
+        Tasks of a bucket can all be performed by the available resources of the resource type; lower priorities are assigned first.
+        By default all tasks have the same priority and the type of the first resource of their pool.
+        """
+        return (0, self.resource_pool(task)[0].type)
+
     def assign_resources(self, unassigned_tasks, available_resources):
         """
         Assigns tasks to resources
@@ -206,11 +284,13 @@ class Problem(ABC):
         Adds the given data to the given element and updates the case data as well.
         This method should be used to add data to the element. Data should not be added directly to the element, otherwise the case data will not be updated.
         """
-        element.data = data
         if element.case_id not in self.case_data:
             self.case_data[element.case_id] = data
+            element.data = data
         else:
             self.case_data[element.case_id].update(data)
+            if len(data) > 0:  # elements without data of their own share NO_DATA instead of keeping an empty dictionary each
+                element.data = data
 
     def get_case_type(self, case_id):
         """
@@ -263,17 +343,87 @@ class HealthcareElements(StrEnum):
     RELEASING = "releasing"
 
 
+# processing times as task label -> diagnosis -> (mean, std) of the normal distribution, diagnosis None if it does not matter
+PROCESSING_TIMES = {
+    HealthcareElements.INTAKE: {None: (1, 1/8)},
+    HealthcareElements.ER_TREATMENT: {None: (2, 1/2)},
+    HealthcareElements.SURGERY: {"A2": (1, 1/4), "A3": (2, 1/2), "A4": (4, 1/2), "B3": (4, 1/2), "B4": (4, 1)},
+    HealthcareElements.NURSING: {"A1": (4, 1/2), "A2": (8, 2), "A3": (16, 2), "A4": (16, 2),
+                                 "B1": (8, 2), "B2": (16, 2), "B3": (16, 4), "B4": (16, 4)},
+}
+DIAGNOSIS_INDEPENDENT_PROCESSING_TIMES = {label for label, times in PROCESSING_TIMES.items() if None in times}
+PROCESSING_TIME_PURPOSES = {label: "processing_" + label for label in PROCESSING_TIMES} # random stream per task label
+# probability of a complication after nursing per diagnosis
+COMPLICATION_PROBABILITIES = {"A1": 0.01, "A2": 0.01, "B2": 0.01,
+                              "A3": 0.02, "A4": 0.02, "B3": 0.02, "B4": 0.02,
+                              "B1": 0.001,
+                              "EM": 0}
+# weights of the scores
+ER_TREATMENT_DURATION_FACTOR = 20
+SENT_HOME_FACTOR = 500
+PROCESSED_FACTOR = 5000
+
+
+class HealthcareScores:
+    """
+    Running accumulators of the scores of the HealthcareProblem, updated as elements start and complete,
+    so that the scores are available at any time without keeping the history of all elements in the simulator.
+    """
+    def __init__(self):
+        self.er_treatment_excessive = 0  # sum of excessive waiting times after ER treatment of patients whose surgery / nursing has started
+        self.er_waiting = dict()  # dictionary of case_id to time when ER treatment has finished, for patients whose surgery / nursing has not yet started
+        self.intake_counts = dict()  # dictionary of case_id to number of completed times for intake, for cases that have not yet completed
+        self.sent_home_count = 0  # number of completed times for intake of cases that had more than one
+        self.released = 0  # number of completed releases
+
+    @staticmethod
+    def excessive_waiting(waiting_time):
+        # penalty for patients that wait longer than 4 hours after ER treatment
+        return 0 if waiting_time < 4 else (waiting_time - 4)**2
+
+    def er_treatment_finished(self, case_id, time):
+        self.er_waiting[case_id] = time
+
+    def surgery_nursing_started(self, case_id, time):
+        if case_id in self.er_waiting:
+            self.er_treatment_excessive += self.excessive_waiting(time - self.er_waiting.pop(case_id))
+
+    def time_for_intake_completed(self, case_id):
+        count = self.intake_counts.get(case_id, 0) + 1
+        self.intake_counts[case_id] = count
+        if count == 2:  # the first time for intake of a case counts as soon as the case has a second one
+            self.sent_home_count += 2
+        elif count > 2:
+            self.sent_home_count += 1
+
+    def release_completed(self):
+        self.released += 1
+
+    def case_completed(self, case_id):
+        self.intake_counts.pop(case_id, None)
+
+    def er_treatment_excessive_until(self, time):
+        """
+        Returns the sum of excessive waiting times after ER treatment, where patients that are still waiting count until the given time.
+        """
+        return self.er_treatment_excessive + sum(self.excessive_waiting(time - finished) for finished in self.er_waiting.values())
+
+
 class HealthcareProblem(Problem):
     
-    def __init__(self):
+    def __init__(self, random_streams=None):
         super().__init__()
+        self.rng = random_streams if random_streams is not None else GlobalRandom() # source of all random samples, RandomStreams for common random numbers
         self.case_types = ["A", "B", "EM"]
+        self.calendar = ResourceCalendar(working_days=5, start_hour=8, end_hour=17)  # working times of the intake and the ORs other than OR1
         self.__create_resources()
         self.planning_slot_usage = dict()  # (time, resource_type) -> list of planned element ids; time is in hours from Monday 2018-01-01 00:00 multiplied by 10 to avoid floating point errors
         self.planned_in_slot = dict()  # (case_id, element_label) -> (time, resource_type)
-        self.patients_after_intake = [] # list of patients  having completed intake but no surgery / nursing has yet started
-        self.er_treatment_finished = dict() # dictionary of case_id to time when ER treatment has finished
-        self.er_surgery_nursing_started = dict() # dictionary of case_id to time when surgery or nursing has started
+        self.patients_after_intake = dict() # patients having completed intake but no surgery / nursing has yet started, case_id -> None, used as ordered set
+        self.max_patients_after_intake = 2 # patients only proceed to intake while fewer patients than this are done with intake
+        self.er_treatment_finished = dict() # dictionary of case_id to time when ER treatment has finished, only kept if the simulator retains history
+        self.er_surgery_nursing_started = dict() # dictionary of case_id to time when surgery or nursing has started, only kept if the simulator retains history
+        self.scores = HealthcareScores()
         self.restart()
 
     def __create_resources(self):
@@ -283,35 +433,44 @@ class HealthcareProblem(Problem):
         self.__INTAKEs = [Resource(ResourceType.INTAKE, "INTAKE" + str(i)) for i in range(1, 5)]
         self.__ER_PRACTITIONERs = [Resource(ResourceType.ER_PRACTITIONER, "ER_PRACTITIONER" + str(i)) for i in range(1,10)]
         self.resources = self.__ORs + self.__A_BEDs + self.__B_BEDs + self.__INTAKEs + self.__ER_PRACTITIONERs
+        self.__resource_pools = {ResourceType.OR: self.__ORs, ResourceType.A_BED: self.__A_BEDs, ResourceType.B_BED: self.__B_BEDs,
+                                 ResourceType.INTAKE: self.__INTAKEs, ResourceType.ER_PRACTITIONER: self.__ER_PRACTITIONERs}
 
     def restart(self):
+        self.rng.reset()
         super().restart()
         self.planning_slot_usage = dict()
         self.planned_in_slot = dict()
+        self.scores = HealthcareScores()
 
-    def resource_pool(self, element):
+    def resource_pool_type(self, element):
         if element.label == HealthcareElements.SURGERY:
-            return self.__ORs
+            return ResourceType.OR
         elif element.label == HealthcareElements.NURSING and self.get_case_data(element.case_id)['diagnosis'].startswith("A"):
-            return self.__A_BEDs
+            return ResourceType.A_BED
         elif element.label == HealthcareElements.NURSING and self.get_case_data(element.case_id)['diagnosis'].startswith("B"):
-            return self.__B_BEDs
+            return ResourceType.B_BED
         elif element.label == HealthcareElements.INTAKE:
-            return self.__INTAKEs
+            return ResourceType.INTAKE
         elif element.label == HealthcareElements.ER_TREATMENT:
-            return self.__ER_PRACTITIONERs
+            return ResourceType.ER_PRACTITIONER
         else:
             raise ValueError("Unknown task label", element.label)
+
+    def resource_pool(self, element):
+        return self.__resource_pools[self.resource_pool_type(element)]
+
+    def assignment_bucket(self, task):
+        """
+        Emergency tasks have priority 0 and are assigned before all other tasks.
+        """
+        return (0 if task.case_type == 'EM' else 1, self.resource_pool_type(task))
     
     def is_working_time(self, simulator_time):
-        week_day = simulator_time // 24 % 7
-        time_of_day = simulator_time % 24
-        working_day = week_day < 5 #monday-friday
-        working_time = time_of_day >= 8 and time_of_day <= 17
-        if working_day and working_time:
-            return True
-        else:
-            return False
+        return self.calendar.is_working_time(simulator_time)
+
+    def next_availability_change(self, time):
+        return self.calendar.next_change(time)
 
     def next_regular_planning_moment(self, previous_planning_moment):
         if previous_planning_moment == 0:
@@ -357,31 +516,25 @@ class HealthcareProblem(Problem):
         if not self.resource_type_available(resource_type, simulator_time):
             return False
         
-        for resource in self.simulator.available_resources:
-            if resource.type == resource_type:
-                return True
-        return False
+        return len(self.simulator.available_resources.of_type(resource_type)) > 0
 
 
     def assign_resources(self, unassigned_tasks, available_resources):
         """
         assign emergency tasks first, i.e., prioritize them
+        unassigned_tasks and available_resources are the UnassignedTasks and AvailableResources of the simulator,
+        so each free resource is matched against the bucket of its type, which costs O(assignments) instead of O(tasks x pool size).
+        Assignments are returned by priority, then by the order in which the tasks became unassigned.
         """
         assignments = []
-        resources_to_use = set(available_resources)
-        emergency_tasks = filter(lambda k : k.case_type == 'EM', unassigned_tasks.values())
-        for emergency_task in emergency_tasks:
-            valid_resources = list(resources_to_use & set(self.resource_pool(emergency_task)))
-            if valid_resources:
-                assignments.append((emergency_task, valid_resources[0]))
-                resources_to_use.remove(valid_resources[0])
-        
-        non_emergency_tasks = filter(lambda k : k.case_type != 'EM', unassigned_tasks.values())
-        for non_emergency_task in non_emergency_tasks:
-            valid_resources = list(resources_to_use & set(self.resource_pool(non_emergency_task)))
-            if valid_resources:
-                assignments.append((non_emergency_task, valid_resources[0]))
-                resources_to_use.remove(valid_resources[0])
+        for resource_type, free_resources in available_resources.by_type.items():
+            if len(free_resources) == 0:
+                continue
+            free_resources = iter(free_resources)  # shared by both priorities, so emergency tasks take the first resources
+            for priority in (0, 1):
+                for (task, resource) in zip(unassigned_tasks.bucket((priority, resource_type)).values(), free_resources):
+                    assignments.append((task, resource))
+        assignments.sort(key=lambda k : (0 if k[0].case_type == 'EM' else 1, unassigned_tasks.sequence_number(k[0].id)))
         return assignments
 
     def plan(self, case_id, element_label, time):
@@ -391,28 +544,29 @@ class HealthcareProblem(Problem):
             raise ValueError("The element " + element_label + " cannot be planned for case " + str(case_id) + ".")
         if element_label == HealthcareElements.TIME_FOR_INTAKE and time < self.simulator.now + 24:
             raise ValueError("The time for intake must be at least one day (24 hours) after the current time.")
+        element_label = HealthcareElements(element_label)  # planners may pass plain strings, all elements share the enum members as labels
         e = super().plan(case_id, element_label, time)[0]
         return [e]
 
     def data_sample(self, element):
         if element.label == HealthcareElements.PATIENT_REFERAL or element.label == HealthcareElements.EMERGENCY_PATIENT:
             if element.case_type == "A":
-                return {"diagnosis": random.choices(["A1", "A2", "A3", "A4"], weights=[50, 25, 12.5, 12.5], k=1)[0]}
+                return {"diagnosis": self.rng.choice("diagnosis_A", ["A1", "A2", "A3", "A4"], weights=[50, 25, 12.5, 12.5])}
             elif element.case_type == "B":
-                return {"diagnosis": random.choices(["B1", "B2", "B3", "B4"], weights=[50, 25, 12.5, 12.5], k=1)[0]}
+                return {"diagnosis": self.rng.choice("diagnosis_B", ["B1", "B2", "B3", "B4"], weights=[50, 25, 12.5, 12.5])}
             elif element.case_type == "EM":
-                if random.random() > 0.5:
-                    return {"diagnosis": random.choices(["B1", "B2", "B3", "B4"], weights=[50, 25, 12.5, 12.5], k=1)[0]}
+                if self.rng.random("diagnosis_EM_needed") > 0.5:
+                    return {"diagnosis": self.rng.choice("diagnosis_EM", ["B1", "B2", "B3", "B4"], weights=[50, 25, 12.5, 12.5])}
                 else:
                     return {"diagnosis" : None}
         return dict()
 
     def interarrival_time_sample(self, case_type, is_first_arrival=False):
         if case_type == "EM":
-            return random.expovariate(1)
+            return self.rng.exponential("interarrival_EM", 1)
         elif case_type == "A" or case_type == "B":
             current_time = self.next_case_arrival_time[case_type] if not is_first_arrival else 0
-            ia_time = random.uniform(0, 1)  # A/B patients only arrive between 9-17 on weekdays
+            ia_time = self.rng.uniform("interarrival_" + case_type, 0, 1)  # A/B patients only arrive between 9-17 on weekdays
             time_in_week = current_time % (24 * 7) + ia_time
             if time_in_week % 24 > 17:  # if the case arrives after 17:00, it is postponed to the next day
                 time_in_week += 7
@@ -425,60 +579,42 @@ class HealthcareProblem(Problem):
             raise ValueError("Unknown case type")
 
     def processing_time_sample(self, resource, task, simulation_time):
-        if task.label == HealthcareElements.INTAKE:
-            return max(0, random.normalvariate(1, 1/8))
-        elif task.label == HealthcareElements.ER_TREATMENT:
-            return max(0, random.normalvariate(2, 1/2))
-        elif task.label == HealthcareElements.SURGERY:
-            diagnosis = self.get_case_data(task.case_id)["diagnosis"]
-            if diagnosis == "A2":
-                return max(0, random.normalvariate(1, 1/4))
-            elif diagnosis == "A3":
-                return max(0, random.normalvariate(2, 1/2))
-            elif diagnosis == "A4":
-                return max(0, random.normalvariate(4, 1/2))
-            elif diagnosis == "B3":
-                return max(0, random.normalvariate(4, 1/2))
-            elif diagnosis == "B4":
-                return max(0, random.normalvariate(4, 1))
-        elif task.label == HealthcareElements.NURSING:
+        if task.label not in PROCESSING_TIMES:
+            raise ValueError("Unknown task label", task.element_label)
+        if task.label in DIAGNOSIS_INDEPENDENT_PROCESSING_TIMES:
+            mean, std = PROCESSING_TIMES[task.label][None]
+        else:
             diagnosis = self.get_case_data(task.case_id)["diagnosis"]
-            if diagnosis == "A1":
-                duration = random.normalvariate(4, 1/2)
-            elif diagnosis == "A2":
-                duration = random.normalvariate(8, 2)
-            elif diagnosis == "A3":
-                duration = random.normalvariate(16, 2)
-            elif diagnosis == "A4":
-                duration = random.normalvariate(16, 2)
-            elif diagnosis == "B1":
-                duration = random.normalvariate(8, 2)
-            elif diagnosis == "B2":
-                duration = random.normalvariate(16, 2)
-            elif diagnosis == "B3":
-                duration = random.normalvariate(16, 4)
-            elif diagnosis == "B4":
-                duration = random.normalvariate(16, 4)
-            nursing_finish_time = simulation_time + max(0, duration)
+            if diagnosis not in PROCESSING_TIMES[task.label]:
+                raise ValueError("Unknown Diagnosis", diagnosis)
+            mean, std = PROCESSING_TIMES[task.label][diagnosis]
+        duration = max(self.minimum_processing_time(task), self.rng.normal(self.random_purpose(PROCESSING_TIME_PURPOSES[task.label], task), mean, std))
+        if task.label == HealthcareElements.NURSING:
+            nursing_finish_time = simulation_time + duration
             release_time = self.next_release_time(nursing_finish_time)
             duration_until_release = release_time - simulation_time
             return duration_until_release
-        else:
-            raise ValueError("Unknown task label", task.element_label)
+        return duration
+
+    def minimum_processing_time(self, task):
+        """
+        Returns the minimum processing time of the task, samples below it are raised to it.
+        """
+        return 0
+
+    def random_purpose(self, purpose, task):
+        """
+        Returns the purpose of the random stream from which a sample of the given purpose is drawn for the task.
+        By default that is the same stream for all tasks.
+        """
+        return purpose
         
     def complication(self, task):
         diagnosis = self.get_case_data(task.case_id)["diagnosis"]
-        r = random.random()
-        if diagnosis in ["A1", "A2", "B2"]:
-            return r < 0.01
-        elif diagnosis in ["A3", "A4", "B3", "B4"]:
-            return r < 0.02
-        elif diagnosis in ["B1"]:
-            return r < 0.001
-        elif diagnosis == "EM":
-            return False
-        else:
+        r = self.rng.random(self.random_purpose("complication", task))
+        if diagnosis not in COMPLICATION_PROBABILITIES:
             raise ValueError("Unknown Diagnosis", diagnosis)
+        return r < COMPLICATION_PROBABILITIES[diagnosis]
         
     def next_release_time(self, current_time):
         release_times = [8, 13, 18]
@@ -520,12 +656,13 @@ class HealthcareProblem(Problem):
             next_element_occurrence_time = simulator_time + 7*24
 
         elif element.label == HealthcareElements.TIME_FOR_INTAKE:
-            # Only proceed to intake when there are no more than 2 persons done with intake
+            # Only proceed to intake when there are fewer than max_patients_after_intake persons done with intake
             # and the intake is staffed
             # else: replan
+            self.scores.time_for_intake_completed(element.case_id)
 
             if self.resources_idle(ResourceType.INTAKE, simulator_time) \
-               and len(self.patients_after_intake) < 2:
+               and len(self.patients_after_intake) < self.max_patients_after_intake:
                 next_label = HealthcareElements.INTAKE
                 next_element_type = ElementType.TASK
                 self.simulator.cancel(element.case_id, HealthcareElements.PATIENT_LEFT_DUE_TO_LONG_WAIT)
@@ -545,7 +682,7 @@ class HealthcareProblem(Problem):
             self.simulator.cancel(element.case_id, HealthcareElements.PATIENT_LEFT_DUE_TO_LONG_WAIT)
             self.simulator.cancel(element.case_id, HealthcareElements.TIME_FOR_INTAKE)
 
-            self.patients_after_intake.append(element.case_id)
+            self.patients_after_intake[element.case_id] = None
             diagnosis = self.get_case_data(element.case_id)["diagnosis"]
             if diagnosis in ["A2", "A3", "A4", "B3", "B4"]:
                 next_label = HealthcareElements.SURGERY
@@ -577,7 +714,9 @@ class HealthcareProblem(Problem):
                 next_element_type = ElementType.EVENT
                 next_element_occurrence_time = simulator_time
             else:
-                self.er_treatment_finished[element.case_id] = simulator_time
+                self.scores.er_treatment_finished(element.case_id, simulator_time)
+                if self.simulator.retain_history:
+                    self.er_treatment_finished[element.case_id] = simulator_time
                 if diagnosis in ["A2", "A3", "A4", "B3", "B4"]:
                     next_label = HealthcareElements.SURGERY
                     next_element_type = ElementType.TASK
@@ -604,6 +743,7 @@ class HealthcareProblem(Problem):
                 next_element_occurrence_time = self.next_release_time(simulator_time)
 
         elif element.label == HealthcareElements.RELEASING:
+            self.scores.release_completed()
             next_label = None
 
         if next_label is not None:
@@ -619,19 +759,17 @@ class HealthcareProblem(Problem):
         # the times when surgery/nurisng of er patients has started (used for evaluation)
         if element.label == HealthcareElements.SURGERY or \
             element.label == HealthcareElements.NURSING:
-            if element.case_id in self.patients_after_intake:
-                self.patients_after_intake.remove(element.case_id)
-            if element.case_type == 'EM' and element.case_id not in self.er_surgery_nursing_started:
-                self.er_surgery_nursing_started[element.case_id] = self.simulator.now
+            self.patients_after_intake.pop(element.case_id, None)
+            if element.case_type == 'EM':
+                self.scores.surgery_nursing_started(element.case_id, self.simulator.now)
+                if self.simulator.retain_history and element.case_id not in self.er_surgery_nursing_started:
+                    self.er_surgery_nursing_started[element.case_id] = self.simulator.now
 
-    def evaluate(self):
-        """
-        Evaluates the performance of the planning algorithm
-        """
-        er_treatment_duration_factor = 20
-        sent_home_factor = 500
-        processed_factor = 5000
+    def complete_case(self, case_id):
+        super().complete_case(case_id)
+        self.scores.case_completed(case_id)
 
+    def cases_started(self):
         unfinished_cases = 0
         for busy_case in self.simulator.busy_cases:  
             if busy_case in self.simulator.case_start_times:
@@ -639,7 +777,35 @@ class HealthcareProblem(Problem):
                 if start_time <= self.simulator.now:
                     unfinished_cases += 1
         
-        cases_started = self.simulator.finalized_cases + unfinished_cases
+        return self.simulator.finalized_cases + unfinished_cases
+
+    def evaluate(self):
+        """
+        Evaluates the performance of the planning algorithm from the running scores, which can be done at any time
+        """
+        cases_started = self.cases_started()
+        if cases_started == 0:
+            return {'er_treatment_score' : 0, 'sent_home_score' : 0, 'processed_score' : 0}
+        er_treatment_score = self.scores.er_treatment_excessive_until(self.simulator.now) / cases_started * ER_TREATMENT_DURATION_FACTOR
+        sent_home_score = self.scores.sent_home_count / cases_started * SENT_HOME_FACTOR
+        processed_score = (cases_started - self.scores.released) * PROCESSED_FACTOR / cases_started
+        return {
+            'er_treatment_score' : er_treatment_score,
+            'sent_home_score' : sent_home_score,
+            'processed_score' : processed_score
+        }
+
+    def evaluate_from_history(self):
+        """
+        Evaluates the performance of the planning algorithm from the history of all elements, which the simulator must retain
+        """
+        if not self.simulator.retain_history:
+            raise ValueError("The simulator does not retain the history of the elements.")
+        er_treatment_duration_factor = ER_TREATMENT_DURATION_FACTOR
+        sent_home_factor = SENT_HOME_FACTOR
+        processed_factor = PROCESSED_FACTOR
+
+        cases_started = self.cases_started()
 
         # Penality for patients that wait longer than 5 hours after ER treatment
         # until they get processed with Nursing/Surgery
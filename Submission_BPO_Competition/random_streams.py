@@ -0,0 +1,102 @@
+import random
+import zlib
+from bisect import bisect
+from itertools import accumulate
+import numpy as np
+
+
+class RandomStream:
+    """
+    A stream of random numbers of one distribution.
+    The numbers are generated in batches with NumPy and consumed through a cursor.
+    """
+    def __init__(self, generator, distribution, batch_size):
+        self.generator = generator  # numpy Generator that is used only by this stream
+        self.distribution = distribution  # "uniform", "normal" or "exponential"
+        self.batch_size = batch_size
+        self.batch = []  # current batch as list of python floats, which are faster to index than numpy scalars
+        self.cursor = 0  # index of the next number in the batch
+
+    def next(self):
+        if self.cursor >= len(self.batch):
+            self.refill()
+        value = self.batch[self.cursor]
+        self.cursor += 1
+        return value
+
+    def refill(self):
+        if self.distribution == "uniform":
+            batch = self.generator.random(self.batch_size)
+        elif self.distribution == "normal":
+            batch = self.generator.standard_normal(self.batch_size)
+        elif self.distribution == "exponential":
+            batch = self.generator.standard_exponential(self.batch_size)
+        else:
+            raise ValueError("Unknown distribution", self.distribution)
+        self.batch = batch.tolist()
+        self.cursor = 0
+
+
+class RandomStreams:
+    """
+    Seeded random streams, one per purpose (e.g. "interarrival_EM", "processing_surgery").
+    As every purpose has its own stream, two runs with the same seed use the same random numbers for the same purpose,
+    even if the planners of the runs cause a different order of sampling (common random numbers).
+    """
+    def __init__(self, seed, batch_size=4096):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.streams = dict()  # purpose -> RandomStream
+
+    def reset(self):
+        """
+        Restarts all streams from the beginning.
+        """
+        self.streams = dict()
+
+    def stream(self, purpose, distribution):
+        if purpose not in self.streams:
+            # crc32 instead of hash(), as the hash of a string differs between python processes
+            generator = np.random.default_rng([self.seed, zlib.crc32(purpose.encode())])
+            self.streams[purpose] = RandomStream(generator, distribution, self.batch_size)
+        return self.streams[purpose]
+
+    def random(self, purpose):
+        return self.stream(purpose, "uniform").next()
+
+    def uniform(self, purpose, a, b):
+        return a + (b - a) * self.stream(purpose, "uniform").next()
+
+    def normal(self, purpose, mu, sigma):
+        return mu + sigma * self.stream(purpose, "normal").next()
+
+    def exponential(self, purpose, lambd):
+        return self.stream(purpose, "exponential").next() / lambd
+
+    def choice(self, purpose, population, weights):
+        cum_weights = list(accumulate(weights))
+        return population[bisect(cum_weights, self.random(purpose) * cum_weights[-1])]
+
+
+class GlobalRandom:
+    """
+    Same interface as RandomStreams, but draws from the global random module and ignores the purpose.
+    This is the default of the problem and behaves exactly like sampling with the random module directly.
+    """
+    def reset(self):
+        pass
+
+    def random(self, purpose):
+        return random.random()
+
+    def uniform(self, purpose, a, b):
+        return random.uniform(a, b)
+
+    def normal(self, purpose, mu, sigma):
+        return random.normalvariate(mu, sigma)
+
+    def exponential(self, purpose, lambd):
+        return random.expovariate(lambd)
+
+    def choice(self, purpose, population, weights):
+        return random.choices(population, weights=weights, k=1)[0]
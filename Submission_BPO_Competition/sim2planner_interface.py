@@ -52,11 +52,12 @@ def get_available_resources(resources):
         resource_counts[resource.type] += 1
     return resource_counts
 
-def simulate_endpoint(available_info, replanned_patients, max_capacities):
+def simulate_endpoint(available_info, replanned_patients, max_capacities, warm_start=None):
     """
     Function to simulate the endpoint
     
-    :param: available_info (dictionary): dictionary with keys 'cid', 'time', 'info', 'resources'
+    :param: available_info (dictionary): dictionary with keys 'cid', 'time', 'info', 'resources' and optionally 'optimizer' (name in OPTIMIZERS, default "ga")
+    :param: warm_start (WarmStartArchive, optional): archive of recent replans to warm-start the evolution with
     :return: float: Hours since 01.01.2018 0:00
     """
     current_time_iso = available_info['time']
@@ -73,7 +74,8 @@ def simulate_endpoint(available_info, replanned_patients, max_capacities):
         "new_admission_time": (current_time_dt + timedelta(hours=24, seconds=1))
     }
     
-    replanned_patients = evolve(patients_to_replan, replanned_patients, available_info['resources'], max_capacities, current_time_dt)
+    replanned_patients = evolve(patients_to_replan, replanned_patients, available_info['resources'], max_capacities, current_time_dt, warm_start=warm_start,
+                                optimizer=available_info.get('optimizer', "ga"))
     
     replan_time_iso = replanned_patients[available_info['cid']]["new_admission_time"]
     replan_time_rel = convert_to_hours_since_2018(replan_time_iso)
@@ -1,4 +1,11 @@
 from enum import Enum, auto
+import pickle
+import random
+import sys
+from collections import Counter
+sys.path.append('../')
+from common.metrics import MetricsBuffer
+from common.profiling import EventProfiler, timed
 from plannerhelper import PlannerHelper
 
 
@@ -17,6 +24,8 @@ class EventType(Enum):
 
 
 class SimulationEvent:
+	__slots__ = ("event_type", "moment", "element", "resource")
+
 	def __init__(self, event_type, moment, element, resource=None):
 		self.event_type = event_type
 		self.moment = moment
@@ -30,13 +39,119 @@ class SimulationEvent:
 		return str(self.event_type) + "\t(" + str(round(self.moment, 2)) + ")\t" + str(self.element) + "," + str(self.resource)
 
 
+class Checkpoint:
+	"""
+	A snapshot of the complete simulation state (simulator, problem and random number generator) at a moment in simulation time.
+	The planner is not part of the checkpoint, so that different planners can be forked from the same state.
+	"""
+	def __init__(self, moment, data):
+		self.moment = moment  # simulation time at which the checkpoint was taken
+		self.data = data  # pickled tuple of (simulator state, problem, random state)
+
+	@classmethod
+	def from_file(cls, filename):
+		with open(filename, 'rb') as handle:
+			instance = pickle.load(handle)
+		return instance
+
+	def save(self, filename):
+		with open(filename, 'wb') as handle:
+			pickle.dump(self, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class AvailableResources:
+	"""
+	The set of available resources, kept in one free list per resource type.
+	Behaves like a set of resources; of_type returns the free list of a type, ordered by the moment the resources became available.
+	"""
+	def __init__(self, resources=()):
+		self.by_type = dict()  # dictionary of resource type -> dictionary of available resources of that type, used as ordered set
+		for resource in resources:
+			self.add(resource)
+
+	def add(self, resource):
+		if resource.type not in self.by_type:
+			self.by_type[resource.type] = dict()
+		self.by_type[resource.type][resource] = None
+
+	def remove(self, resource):
+		del self.by_type[resource.type][resource]
+
+	def of_type(self, resource_type):
+		return self.by_type.get(resource_type, {})
+
+	def __contains__(self, resource):
+		return resource in self.of_type(resource.type)
+
+	def __len__(self):
+		return sum(len(resources) for resources in self.by_type.values())
+
+	def __iter__(self):
+		for resources in self.by_type.values():
+			yield from resources
+
+
+class UnassignedTasks:
+	"""
+	The unassigned tasks, bucketed by the key that the problem returns for each task (see Problem.assignment_bucket).
+	Behaves like a dictionary of task id -> task. Within a bucket, and in iteration, tasks are in the order in which they were added.
+	"""
+	def __init__(self, bucket_key):
+		self.bucket_key = bucket_key  # function task -> bucket key
+		self.tasks = dict()  # dictionary of task id -> (task, bucket key, sequence number)
+		self.buckets = dict()  # dictionary of bucket key -> dictionary of task id -> task
+		self.next_sequence_number = 0
+
+	def __setitem__(self, task_id, task):
+		if task_id in self.tasks:
+			del self[task_id]
+		key = self.bucket_key(task)
+		self.tasks[task_id] = (task, key, self.next_sequence_number)
+		self.next_sequence_number += 1
+		if key not in self.buckets:
+			self.buckets[key] = dict()
+		self.buckets[key][task_id] = task
+
+	def __getitem__(self, task_id):
+		return self.tasks[task_id][0]
+
+	def __delitem__(self, task_id):
+		(task, key, sequence_number) = self.tasks.pop(task_id)
+		del self.buckets[key][task_id]
+
+	def __contains__(self, task_id):
+		return task_id in self.tasks
+
+	def __len__(self):
+		return len(self.tasks)
+
+	def __iter__(self):
+		return iter(self.tasks)
+
+	def bucket(self, key):
+		return self.buckets.get(key, {})
+
+	def sequence_number(self, task_id):
+		return self.tasks[task_id][2]
+
+	def keys(self):
+		return self.tasks.keys()
+
+	def values(self):
+		return [task for (task, key, sequence_number) in self.tasks.values()]
+
+	def items(self):
+		return [(task_id, task) for task_id, (task, key, sequence_number) in self.tasks.items()]
+
+
 class Simulator:
-	def __init__(self, planner, problem):
+	def __init__(self, planner, problem, coalesce_events=True, retain_history=True):
 		self.events = []  # list of tuples (planned moment, simulationevent)
-		self.unassigned_tasks = dict()  # dictionary of unassigned tasks id -> task
+		self.unassigned_tasks = UnassignedTasks(problem.assignment_bucket)  # dictionary of unassigned tasks id -> task, bucketed for assignment
 		self.assigned_tasks = dict()  # dictionary of assigned tasks id -> (task, resource, moment of assignment)
-		self.available_resources = set()  # set of available resources
-		self.away_resources = []  # list of resources that are unavailable, because they are away
+		self.activation_times = dict()  # dictionary of active tasks id -> moment the task was activated
+		self.available_resources = AvailableResources()  # set of available resources, kept per resource type
+		self.away_resources = dict()  # resources that are unavailable, because they are away, resource -> None, used as ordered set
 		self.busy_resources = dict()  # dictionary of busy resources resource -> (task they are busy on, moment they started on the task)
 		self.busy_cases = dict()  # dictionary of busy cases case_id -> list of ids of elements that are planned in self.events for the case
 		self.now = 0  # current moment in the simulation
@@ -47,6 +162,16 @@ class Simulator:
 		self.event_times = dict()
 		self.problem = problem  # the problem to be simulated
 		self.planner = planner  # the planner to be used for planning events
+		self.coalesce_events = coalesce_events  # if True, at most one ASSIGN_RESOURCES and one PLAN_EVENTS event is pending at a time
+		self.assignment_pending = False  # whether an ASSIGN_RESOURCES event is in self.events
+		self.planning_pending = False  # whether a PLAN_EVENTS event is in self.events
+		self.event_counts = Counter()  # number of processed events per event type
+		self.retain_history = retain_history  # if False, the start and end times of elements and the start times of completed cases are not kept, so that memory stays flat
+		self.metrics = None  # MetricsBuffer with the samples of sample_metrics, None if metrics are not sampled
+		self.metrics_interval = None  # simulation time between two metric samples
+		self.next_metrics_sample = None  # simulation time of the next metric sample
+		self.profiler = None  # EventProfiler if profiling is enabled
+		self.random_state = None  # state of the random module of a forked simulator while it does not run, None if it uses the global state
 
 		planner.set_planner_helper(PlannerHelper(problem, self))
 		problem.set_simulator(self)
@@ -54,10 +179,11 @@ class Simulator:
 
 	def restart(self):
 		self.events = []
-		self.unassigned_tasks = dict()
+		self.unassigned_tasks = UnassignedTasks(self.problem.assignment_bucket)
 		self.assigned_tasks = dict()
-		self.available_resources = set()
-		self.away_resources = []
+		self.activation_times = dict()
+		self.available_resources = AvailableResources()
+		self.away_resources = dict()
 		self.busy_resources = dict()
 		self.busy_cases = dict()
 		self.now = 0
@@ -66,10 +192,59 @@ class Simulator:
 		self.case_start_times = dict()
 		self.task_start_end_times = dict()
 		self.event_times = dict()
+		self.assignment_pending = False
+		self.planning_pending = False
+		self.event_counts = Counter()
 
 		self.problem.restart()
 		self.init_simulation()
 
+	def checkpoint(self):
+		"""
+		Takes a checkpoint of the current simulation state.
+		The simulator state and the problem are pickled together, so that elements shared between them stay shared after restoring.
+		"""
+		state = {k: v for k, v in self.__dict__.items() if k not in ["planner", "problem", "profiler", "random_state"]}
+		random_state = random.getstate() if self.random_state is None else self.random_state
+		self.problem.simulator = None
+		try:
+			data = pickle.dumps((state, self.problem, random_state), protocol=pickle.HIGHEST_PROTOCOL)
+		finally:
+			self.problem.simulator = self
+		return Checkpoint(self.now, data)
+
+	@classmethod
+	def from_checkpoint(cls, checkpoint, planner):
+		"""
+		Creates a new simulator that continues from the given checkpoint with the given planner.
+		The checkpoint can be used for any number of forks. Tasks that are active at the checkpoint are reported to the planner,
+		so that its view on the current state is the same as if it had run from the start.
+		The fork keeps the random state of the checkpoint as its own and only loads it into the random module while it runs,
+		so the caller, e.g. the simulator the checkpoint was taken from, continues with its own random sequence.
+		"""
+		(state, problem, random_state) = pickle.loads(checkpoint.data)
+		simulator = cls.__new__(cls)
+		simulator.__dict__.update(state)
+		simulator.problem = problem
+		simulator.planner = planner
+		simulator.profiler = None
+		planner.set_planner_helper(PlannerHelper(problem, simulator))
+		problem.set_simulator(simulator)
+		simulator.random_state = random_state
+		simulator.report_active_tasks()
+		return simulator
+
+	def report_active_tasks(self):
+		"""
+		Reports the activation and start of all tasks that are currently active to the planner.
+		"""
+		for task in self.unassigned_tasks.values():
+			self.planner.report(task.case_id, task, self.activation_times[task.id], None, EventType.ACTIVATE_TASK)
+		for (task, resource, moment) in self.assigned_tasks.values():
+			self.planner.report(task.case_id, task, self.activation_times[task.id], None, EventType.ACTIVATE_TASK)
+			if resource in self.busy_resources:
+				self.planner.report(task.case_id, task, self.busy_resources[resource][1], resource, EventType.START_TASK)
+
 	def sort_events(self):
 		"""
 		First start tasks (i.e. use resources) before another COMPLETE_EVENT comes into action
@@ -124,6 +299,23 @@ class Simulator:
 		day_of_week = True
 		return hour_of_day_x_10 >= 80 and hour_of_day_x_10 <= 150 and day_of_week < 5 and hour_of_day_x_10 % 5 == 0
 
+	def request_assignment(self):
+		"""
+		Schedules the assignment of resources for now. If an assignment is already pending, it is processed after the current event,
+		so it also covers the changes of the current event and no further assignment is scheduled.
+		"""
+		if not (self.coalesce_events and self.assignment_pending):
+			self.assignment_pending = True
+			self.events.append((self.now, SimulationEvent(EventType.ASSIGN_RESOURCES, self.now, None)))
+
+	def request_planning(self):
+		"""
+		Schedules the planning of events for now, coalesced in the same way as request_assignment.
+		"""
+		if not (self.coalesce_events and self.planning_pending):
+			self.planning_pending = True
+			self.events.append((self.now, SimulationEvent(EventType.PLAN_EVENTS, self.now, None)))
+
 	def activate(self, element):
 		"""
 		Activates an element.
@@ -137,123 +329,219 @@ class Simulator:
 		elif element.is_task():
 			self.planner.report(element.case_id, element, self.now, None, EventType.ACTIVATE_TASK)
 			self.unassigned_tasks[element.id] = element
-			self.events.append((self.now, SimulationEvent(EventType.ASSIGN_RESOURCES, self.now, None)))
-		self.events.append((self.now, SimulationEvent(EventType.PLAN_EVENTS, self.now, None)))
+			self.activation_times[element.id] = self.now
+			self.request_assignment()
+		self.request_planning()
 
 	def run(self, running_time=24*365):
 		"""
 		Runs the simulation for the specified amount of time.
 		"""
-		while self.now <= running_time:
-			(self.now, event) = self.events.pop(0)
-
-			if event.event_type == EventType.CASE_ARRIVAL:				
-				self.planner.report(event.element.case_id, None, self.now, None, EventType.CASE_ARRIVAL)  # report CASE_ARRIVAL
-				# create the case
-				self.case_start_times[event.element.case_id] = self.now
-				self.busy_cases[event.element.case_id] = []
-				# activate the first element
-				self.activate(event.element)
-				# schedule the next case arrival
-				(t, task) = self.problem.next_case()
-				self.events.append((t, SimulationEvent(EventType.CASE_ARRIVAL, t, task)))
-
-			elif event.event_type == EventType.START_TASK:
+		self.swap_random_state()
+		try:
+			while self.now <= running_time:
+				self.sample_metrics_before(self.events[0][0])
+				(self.now, event) = self.events.pop(0)
+				timed(self.profiler, event.event_type.name, self.handle_event, event)
+				self.sort_events()
+		finally:
+			self.swap_random_state()
+
+		score = self.problem.evaluate()
+		if self.profiler is not None:
+			self.profiler.stop_capture()
+			print(self.profiler.summary())
+		return score
+
+	def run_until(self, time):
+		"""
+		Processes all events that happen up to and including the given time, e.g. to warm up the simulation before a checkpoint.
+		"""
+		self.swap_random_state()
+		try:
+			while len(self.events) > 0 and self.events[0][0] <= time:
+				self.sample_metrics_before(self.events[0][0])
+				(self.now, event) = self.events.pop(0)
+				timed(self.profiler, event.event_type.name, self.handle_event, event)
+				self.sort_events()
+			self.sample_metrics_before(time)
+		finally:
+			self.swap_random_state()
+		self.now = time
+
+	def swap_random_state(self):
+		"""
+		Exchanges the state of the random module with the own random state of a forked simulator, before and after it runs.
+		"""
+		if self.random_state is not None:
+			caller_state = random.getstate()
+			random.setstate(self.random_state)
+			self.random_state = caller_state
+
+	def enable_profiling(self, capture=None):
+		"""
+		Records the wall time and number of calls per event type, planner.plan call and problem.complete_element call.
+		run prints a summary table at its end; otherwise it is available via self.profiler.summary().
+		:param capture: None, or "cprofile" / "pyinstrument" to also capture the run with that profiler
+		"""
+		self.profiler = EventProfiler(capture)
+		self.profiler.start_capture()
+
+	def start_metrics(self, interval=24, capacity=10000):
+		"""
+		Starts sampling metrics every interval hours of simulation time into a ring buffer of the given capacity, which is available as self.metrics.
+		A sample at time t shows the state after all events before t. The columns are:
+		time, patients_in_system, queue_<resource type> and utilization_<resource type> for each resource type, and the running scores of the problem.
+		"""
+		self.resource_types = list(dict.fromkeys(resource.type for resource in self.problem.resources))
+		columns = ["time", "patients_in_system"]
+		columns += ["queue_" + str(resource_type) for resource_type in self.resource_types]
+		columns += ["utilization_" + str(resource_type) for resource_type in self.resource_types]
+		columns += list(self.problem.evaluate().keys())
+		self.metrics = MetricsBuffer(columns, capacity)
+		self.metrics_interval = interval
+		self.next_metrics_sample = self.now
+
+	def sample_metrics_before(self, moment):
+		"""
+		Takes the metric samples that are due before the given moment.
+		"""
+		if self.metrics is None:
+			return
+		while self.next_metrics_sample < moment:
+			self.now = self.next_metrics_sample  # nothing happens between the last event and the next one, so the state is the same at the sample time
+			self.metrics.append(self.metrics_sample())
+			self.next_metrics_sample += self.metrics_interval
+
+	def metrics_sample(self):
+		queue_lengths = Counter()
+		for (priority, resource_type), tasks in self.unassigned_tasks.buckets.items():
+			queue_lengths[resource_type] += len(tasks)
+		busy = Counter(resource.type for resource in self.busy_resources)
+		utilization = []
+		for resource_type in self.resource_types:
+			present = busy[resource_type] + len(self.available_resources.of_type(resource_type))  # away resources do not count
+			utilization.append(busy[resource_type] / present if present > 0 else None)
+		scores = list(self.problem.evaluate().values())
+		return [self.now, len(self.busy_cases)] + [queue_lengths[resource_type] for resource_type in self.resource_types] + utilization + scores
+
+	def handle_event(self, event):
+		"""
+		Processes a single simulation event that happens at the current moment.
+		"""
+		self.event_counts[event.event_type] += 1
+		if event.event_type == EventType.CASE_ARRIVAL:				
+			self.planner.report(event.element.case_id, None, self.now, None, EventType.CASE_ARRIVAL)  # report CASE_ARRIVAL
+			# create the case
+			self.case_start_times[event.element.case_id] = self.now
+			self.busy_cases[event.element.case_id] = []
+			# activate the first element
+			self.activate(event.element)
+			# schedule the next case arrival
+			(t, task) = self.problem.next_case()
+			self.events.append((t, SimulationEvent(EventType.CASE_ARRIVAL, t, task)))
+
+		elif event.event_type == EventType.START_TASK:
+			if self.retain_history:
 				self.task_start_end_times[event.element] = [self.now, 0]
-				self.planner.report(event.element.case_id, event.element, self.now, event.resource, EventType.START_TASK) # report START_TASK
-				self.problem.start_task(event.element)
-				# start the task
-				self.busy_resources[event.resource] = (event.element, self.now)
-				# schedule the completion of the task
-				t = self.now + self.problem.processing_time_sample(event.resource, event.element, self.now)
-				self.events.append((t, SimulationEvent(EventType.COMPLETE_TASK, t, event.element, event.resource)))				
-
-			elif event.event_type == EventType.COMPLETE_EVENT \
-			  		or event.event_type == EventType.COMPLETE_TASK:
-				self.planner.report(event.element.case_id, event.element, self.now, event.resource, event.event_type) # report COMPLETE_EVENT or COMPLETE_TASK
-				# for tasks, process the resource that performed the task
-				if event.event_type == EventType.COMPLETE_TASK:
+			self.planner.report(event.element.case_id, event.element, self.now, event.resource, EventType.START_TASK) # report START_TASK
+			self.problem.start_task(event.element)
+			# start the task
+			self.busy_resources[event.resource] = (event.element, self.now)
+			# schedule the completion of the task
+			t = self.now + self.problem.processing_time_sample(event.resource, event.element, self.now)
+			self.events.append((t, SimulationEvent(EventType.COMPLETE_TASK, t, event.element, event.resource)))				
+
+		elif event.event_type == EventType.COMPLETE_EVENT \
+		  		or event.event_type == EventType.COMPLETE_TASK:
+			self.planner.report(event.element.case_id, event.element, self.now, event.resource, event.event_type) # report COMPLETE_EVENT or COMPLETE_TASK
+			# for tasks, process the resource that performed the task
+			if event.event_type == EventType.COMPLETE_TASK:
+				if self.retain_history:
 					self.task_start_end_times[event.element][1] = self.now
-					del self.busy_resources[event.resource]
-					if self.problem.resources_available(event.resource, self.now):
-						self.available_resources.add(event.resource)
-						self.events.append((self.now, SimulationEvent(EventType.ASSIGN_RESOURCES, self.now, None)))  # if a resource becomes available, it can be assigned, so we schedule the assignment of resources
-					else:
-						self.away_resources.append(event.resource)
-					del self.assigned_tasks[event.element.id]
+				del self.busy_resources[event.resource]
+				if self.problem.resources_available(event.resource, self.now):
+					self.available_resources.add(event.resource)
+					self.request_assignment()  # if a resource becomes available, it can be assigned, so we schedule the assignment of resources
 				else:
-					self.event_times[event.element] = self.now
-
-				# complete the element
-				self.busy_cases[event.element.case_id] = list(filter(
-					lambda k : k.id != event.element.id,
-					self.busy_cases[event.element.case_id]
-				))
-				next_elements = self.problem.complete_element(event.element)
-				# activate the next elements
-				for next_element in next_elements:  
-					self.activate(next_element)
-				# if the case is done, complete the case
-				if len(self.busy_cases[event.element.case_id]) == 0:					
-					self.events.append((self.now, SimulationEvent(EventType.COMPLETE_CASE, self.now, event.element)))
-
-			elif event.event_type == EventType.SCHEDULE_RESOURCES:
-				# check if resources become available again and make them available if that is the case
-				resources_to_add = []
-				for resource in self.away_resources:
-					if self.problem.resources_available(resource, self.now):
-						resources_to_add.append(resource)
-				for resource in resources_to_add:
-					self.away_resources.remove(resource)
-					self.available_resources.add(resource)
-				if len(resources_to_add) > 0:
-					self.events.append((self.now, SimulationEvent(EventType.ASSIGN_RESOURCES, self.now, None)))  # if a resource becomes available, it can be assigned, so we schedule the assignment of resources
-				# check if resources leave and send them away if that is the case
-				resources_to_remove = []
-				for resource in self.available_resources:
-					if not self.problem.resources_available(resource, self.now):
-						resources_to_remove.append(resource)
-				for resource in resources_to_remove:
+					self.away_resources[event.resource] = None
+				del self.assigned_tasks[event.element.id]
+				del self.activation_times[event.element.id]
+			elif self.retain_history:
+				self.event_times[event.element] = self.now
+
+			# complete the element
+			self.busy_cases[event.element.case_id] = list(filter(
+				lambda k : k.id != event.element.id,
+				self.busy_cases[event.element.case_id]
+			))
+			next_elements = timed(self.profiler, "problem.complete_element", self.problem.complete_element, event.element)
+			# activate the next elements
+			for next_element in next_elements:  
+				self.activate(next_element)
+			# if the case is done, complete the case
+			if len(self.busy_cases[event.element.case_id]) == 0:					
+				self.events.append((self.now, SimulationEvent(EventType.COMPLETE_CASE, self.now, event.element)))
+
+		elif event.event_type == EventType.SCHEDULE_RESOURCES:
+			# check if resources become available again and make them available if that is the case
+			resources_to_add = []
+			for resource in self.away_resources:
+				if self.problem.resources_available(resource, self.now):
+					resources_to_add.append(resource)
+			for resource in resources_to_add:
+				del self.away_resources[resource]
+				self.available_resources.add(resource)
+			if len(resources_to_add) > 0:
+				self.request_assignment()  # if a resource becomes available, it can be assigned, so we schedule the assignment of resources
+			# check if resources leave and send them away if that is the case
+			resources_to_remove = []
+			for resource in self.available_resources:
+				if not self.problem.resources_available(resource, self.now):
+					resources_to_remove.append(resource)
+			for resource in resources_to_remove:
+				self.available_resources.remove(resource)
+				self.away_resources[resource] = None
+			# schedule the next resource check at the next moment the availability of resources changes according to the problem's calendar
+			next_change = self.problem.next_availability_change(self.now)
+			self.events.append((next_change, SimulationEvent(EventType.SCHEDULE_RESOURCES, next_change, None)))
+
+		elif event.event_type == EventType.ASSIGN_RESOURCES:
+			self.assignment_pending = False
+			# assign resources to tasks
+			if len(self.unassigned_tasks) > 0 and len(self.available_resources) > 0:
+				assignments = self.problem.assign_resources(self.unassigned_tasks, self.available_resources)
+				for (task, resource) in assignments:
+					self.events.append((self.now, SimulationEvent(EventType.START_TASK, self.now, task, resource)))
+					del self.unassigned_tasks[task.id]
+					self.assigned_tasks[task.id] = (task, resource, self.now)
 					self.available_resources.remove(resource)
-					self.away_resources.append(resource)
-				# schedule the next resource check
-				self.events.append((self.now + 1, SimulationEvent(EventType.SCHEDULE_RESOURCES, self.now + 1, None)))
-
-			elif event.event_type == EventType.ASSIGN_RESOURCES:
-				# assign resources to tasks
-				if len(self.unassigned_tasks) > 0 and len(self.available_resources) > 0:
-					assignments = self.problem.assign_resources(self.unassigned_tasks, self.available_resources)
-					for (task, resource) in assignments:
-						self.events.append((self.now, SimulationEvent(EventType.START_TASK, self.now, task, resource)))
-						del self.unassigned_tasks[task.id]
-						self.assigned_tasks[task.id] = (task, resource, self.now)
-						self.available_resources.remove(resource)
-
-			elif event.event_type == EventType.REGULAR_PLANNING_MOMENT:
-				# schedule event planning for now
-				self.events.append((self.now, SimulationEvent(EventType.PLAN_EVENTS, self.now, None)))
-				# schedule the next regular planning moment
-				next_planning_moment = self.problem.next_regular_planning_moment(self.now)
-				self.events.append((next_planning_moment, SimulationEvent(EventType.REGULAR_PLANNING_MOMENT, next_planning_moment, None)))
-
-			elif event.event_type == EventType.PLAN_EVENTS:			
-				# plan events
-				# is done each time an element is activated and there are events to plan
-				if len(self.problem.can_plan)>0:
-					planned_events = self.planner.plan(self.problem.can_plan, self.now)
-					for planned_element in planned_events:
-						created_events = self.problem.plan(planned_element[0], planned_element[1], planned_element[2])
-						for created_event in created_events:
-							if not created_event.is_event():
-								raise ValueError("At this stage, we only allow for planning of events.")
-							self.activate(created_event)
-
-			elif event.event_type == EventType.COMPLETE_CASE:
-				self.planner.report(event.element.case_id, None, self.now, None, EventType.COMPLETE_CASE)  # report COMPLETE_CASE
-				self.total_cycle_time += self.now - self.case_start_times[event.element.case_id]
-				self.finalized_cases += 1
-				del self.busy_cases[event.element.case_id]
-			self.sort_events()
 
-		score = self.problem.evaluate()
-		return score
\ No newline at end of file
+		elif event.event_type == EventType.REGULAR_PLANNING_MOMENT:
+			# schedule event planning for now
+			self.request_planning()
+			# schedule the next regular planning moment
+			next_planning_moment = self.problem.next_regular_planning_moment(self.now)
+			self.events.append((next_planning_moment, SimulationEvent(EventType.REGULAR_PLANNING_MOMENT, next_planning_moment, None)))
+
+		elif event.event_type == EventType.PLAN_EVENTS:			
+			# plan events
+			# is done each time an element is activated and there are events to plan
+			self.planning_pending = False
+			if len(self.problem.can_plan)>0:
+				planned_events = timed(self.profiler, "planner.plan", self.planner.plan, self.problem.can_plan, self.now)
+				for planned_element in planned_events:
+					created_events = self.problem.plan(planned_element[0], planned_element[1], planned_element[2])
+					for created_event in created_events:
+						if not created_event.is_event():
+							raise ValueError("At this stage, we only allow for planning of events.")
+						self.activate(created_event)
+
+		elif event.event_type == EventType.COMPLETE_CASE:
+			self.planner.report(event.element.case_id, None, self.now, None, EventType.COMPLETE_CASE)  # report COMPLETE_CASE
+			self.total_cycle_time += self.now - self.case_start_times[event.element.case_id]
+			self.finalized_cases += 1
+			del self.busy_cases[event.element.case_id]
+			if not self.retain_history:
+				del self.case_start_times[event.element.case_id]
+			self.problem.complete_case(event.element.case_id)
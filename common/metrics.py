@@ -0,0 +1,66 @@
+import csv
+import numpy as np
+
+
+class MetricsBuffer:
+    """
+    A ring buffer of metric samples, one row of floats per sample.
+    When the buffer is full, the oldest samples are overwritten, so long simulations can be sampled with bounded memory.
+    """
+    def __init__(self, columns, capacity=10000):
+        self.columns = list(columns)  # names of the metrics, the first one is usually the time of the sample
+        self.capacity = capacity
+        self.data = np.full((capacity, len(self.columns)), np.nan)
+        self.count = 0  # number of samples appended in total, including overwritten ones
+
+    def append(self, values):
+        """
+        Appends a sample.
+
+        :param values (list): one value per column, None for missing values
+        """
+        self.data[self.count % self.capacity] = [np.nan if value is None else value for value in values]
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def rows(self):
+        """
+        :return: numpy array of the samples in the buffer, oldest first
+        """
+        if self.count <= self.capacity:
+            return self.data[:self.count]
+        cursor = self.count % self.capacity
+        return np.concatenate((self.data[cursor:], self.data[:cursor]))
+
+    def latest(self):
+        """
+        :return: dict: column -> value of the most recent sample, None if there is none
+        """
+        if self.count == 0:
+            return None
+        return dict(zip(self.columns, self.data[(self.count - 1) % self.capacity].tolist()))
+
+    def to_csv(self, file):
+        """
+        Writes the samples as CSV with a header.
+
+        :param file: file name or text file object
+        """
+        if isinstance(file, str):
+            with open(file, 'w', newline='') as handle:
+                self.to_csv(handle)
+            return
+        writer = csv.writer(file)
+        writer.writerow(self.columns)
+        writer.writerows(self.rows().tolist())
+
+    def to_parquet(self, file):
+        """
+        Writes the samples as Parquet, which needs pandas and a Parquet engine (pyarrow or fastparquet).
+
+        :param file: file name or binary file object
+        """
+        import pandas as pd  # only needed for the export
+        pd.DataFrame(self.rows(), columns=self.columns).to_parquet(file, index=False)
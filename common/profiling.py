@@ -0,0 +1,77 @@
+import io
+import time
+from collections import Counter, defaultdict
+
+
+def timed(profiler, key, function, *args):
+    """
+    Calls function(*args), timed under key if profiling is enabled, i.e. if profiler is an EventProfiler and not None.
+
+    :return: the result of the function
+    """
+    if profiler is None:
+        return function(*args)
+    return profiler.timed(key, function, *args)
+
+
+class EventProfiler:
+    """
+    Records the wall time and the number of calls per key, e.g. per event type of a simulation loop.
+    Times are inclusive: the time of an event type also contains the time of the calls that are recorded while handling it.
+    Optionally the run is also captured with cProfile or pyinstrument, whose report is added to the summary.
+    """
+    def __init__(self, capture=None):
+        if capture not in [None, "cprofile", "pyinstrument"]:
+            raise ValueError("Unknown capture mode", capture)
+        self.capture = capture
+        self.calls = Counter()  # key -> number of calls
+        self.times = defaultdict(float)  # key -> total wall time in seconds
+        self.capture_profiler = None
+
+    def timed(self, key, function, *args):
+        """
+        Calls function(*args) and records its wall time under key.
+
+        :return: the result of the function
+        """
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.times[key] += time.perf_counter() - start
+            self.calls[key] += 1
+
+    def start_capture(self):
+        if self.capture == "cprofile":
+            import cProfile
+            self.capture_profiler = cProfile.Profile()
+            self.capture_profiler.enable()
+        elif self.capture == "pyinstrument":
+            import pyinstrument  # optional, only needed for this capture mode
+            self.capture_profiler = pyinstrument.Profiler()
+            self.capture_profiler.start()
+
+    def stop_capture(self):
+        if self.capture_profiler is None:
+            return
+        if self.capture == "cprofile":
+            self.capture_profiler.disable()
+        else:
+            self.capture_profiler.stop()
+
+    def summary(self, capture_lines=20):
+        """
+        :return: str: table of the calls, total and average time per key, slowest first, followed by the captured profile if any
+        """
+        lines = [f"{'key':<32} {'calls':>10} {'total s':>10} {'avg us':>10}"]
+        for key, total in sorted(self.times.items(), key=lambda k: -k[1]):
+            lines.append(f"{key:<32} {self.calls[key]:>10} {total:>10.3f} {total / self.calls[key] * 1e6:>10.1f}")
+        if self.capture_profiler is not None:
+            if self.capture == "cprofile":
+                import pstats
+                stream = io.StringIO()
+                pstats.Stats(self.capture_profiler, stream=stream).sort_stats("cumulative").print_stats(capture_lines)
+                lines.append(stream.getvalue())
+            else:
+                lines.append(self.capture_profiler.output_text())
+        return "\n".join(lines)
@@ -0,0 +1,117 @@
+import base64
+import json
+import struct
+import sys
+import time
+from datetime import datetime, timedelta
+
+BASE_TIME = datetime(2018, 1, 1, 0, 0, 0)
+
+JSON = "json" # resources as JSON list with ISO 8601 start times, the default
+PACKED = "packed" # resources as packed binary records with start times in hours since 01.01.2018 0:00
+ENCODINGS = [PACKED, JSON]
+ENCODING_HEADER = "X-Resources-Encoding" # encoding of the resources field of a replan request, JSON if missing
+ACCEPT_HEADER = "X-Accept-Resources-Encoding" # encodings the planner accepts, sent with its replan responses
+
+MAGIC = b"RS1"
+HEADER = struct.Struct("<3sHI") # magic, number of strings, number of records
+RECORD = struct.Struct("<IHdH?") # cid, task string, start hours, diagnosis string, wait
+
+def encode_resources(resources):
+    """
+    Packs the resources into a string table of the tasks and diagnoses followed by one fixed size record per resource.
+
+    :param resources (list): [{"cid", "task", "start", "info", "wait"}] with start in hours since 01.01.2018 0:00
+    :return: bytes
+    :raises ValueError: if a cid is not a non negative integer, a task or diagnosis is no string of at most 255 bytes
+                        or there are too many of them, the resources have to be sent as JSON then
+    """
+    strings = {} # string -> index in the string table
+    records = []
+    for resource in resources:
+        task_index = strings.setdefault(resource["task"], len(strings))
+        diagnosis_index = strings.setdefault(resource["info"]["diagnosis"], len(strings))
+        wait = resource["wait"].lower() == "true" if isinstance(resource["wait"], str) else bool(resource["wait"])
+        try:
+            records.append(RECORD.pack(int(resource["cid"]), task_index, float(resource["start"]), diagnosis_index, wait))
+        except struct.error as error:
+            raise ValueError("Resource can not be packed", resource) from error
+    try:
+        parts = [HEADER.pack(MAGIC, len(strings), len(records))]
+    except struct.error as error:
+        raise ValueError("Too many resources or strings to be packed", len(strings), len(records)) from error
+    for string in strings:
+        if not isinstance(string, str):
+            raise ValueError("Task or diagnosis can not be packed", string)
+        encoded = string.encode("utf-8")
+        if len(encoded) > 255:
+            raise ValueError("Task or diagnosis is too long to be packed", string)
+        parts.append(struct.pack("<B", len(encoded)) + encoded)
+    return b"".join(parts + records)
+
+def decode_resources(data):
+    """
+    :param data (bytes): resources packed by encode_resources
+    :return: list: [{"cid", "task", "start", "info", "wait"}] with cid as str and start in hours since 01.01.2018 0:00
+    """
+    magic, string_count, record_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Unknown resources encoding")
+    offset = HEADER.size
+    strings = []
+    for _ in range(string_count):
+        length = data[offset]
+        strings.append(data[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    records = data[offset:offset + record_count * RECORD.size]
+    return [{"cid": str(cid), "task": strings[task_index], "start": start, "info": {"diagnosis": strings[diagnosis_index]}, "wait": wait}
+            for cid, task_index, start, diagnosis_index, wait in RECORD.iter_unpack(records)]
+
+def encode_form_field(resources):
+    """
+    :return: str: the packed resources as URL safe base64, to be sent as form field
+    """
+    return base64.urlsafe_b64encode(encode_resources(resources)).decode("ascii")
+
+def decode_form_field(text):
+    return decode_resources(base64.urlsafe_b64decode(text))
+
+def convert_to_iso8601(simulation_time):
+    return (BASE_TIME + timedelta(hours=simulation_time)).isoformat()
+
+def encode_resources_json(resources):
+    """
+    The JSON encoding as sent by the simulator, with start times converted to ISO 8601.
+    """
+    return json.dumps([dict(resource, start=convert_to_iso8601(resource["start"])) for resource in resources])
+
+def decode_resources_json(text):
+    """
+    The JSON decoding including the conversion of the start times back to datetimes, as done by the planner.
+    """
+    resources = json.loads(text)
+    for resource in resources:
+        resource["start"] = datetime.fromisoformat(resource["start"])
+    return resources
+
+def benchmark(resource_count=100, repeat=1000):
+    """
+    Compares the size and the serialization and parse time of one replan request of both encodings.
+    """
+    tasks = ["intake", "er_treatment", "surgery", "nursing_a", "nursing_b"]
+    resources = [{"cid": str(1000 + i), "task": tasks[i % len(tasks)], "start": 24.0 * 30 + i * 0.37, "info": {"diagnosis": "AB"[i % 2] + str(1 + i % 4)}, "wait": i % 3 == 0}
+                 for i in range(resource_count)]
+    for encoding, encode, decode in [(JSON, encode_resources_json, decode_resources_json), (PACKED, encode_form_field, decode_form_field)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            encoded = encode(resources)
+        encode_time = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decode(encoded)
+        decode_time = (time.perf_counter() - start) / repeat
+        print(f"{encoding:>6}: {len(encoded):>6} bytes, serialize {encode_time * 1e6:8.1f} us, parse {decode_time * 1e6:8.1f} us per replan with {resource_count} resources")
+
+if __name__ == '__main__':
+    # usage: python3 common/wire_format.py [resource_count]
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
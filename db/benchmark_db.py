@@ -0,0 +1,43 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from db_util import get_db, initialize_resources
+
+def benchmark_initialize_resources(capacity=2000, db_file='resources/resources.db', repeat=5):
+    """
+    Measures the initialization for a pool with capacity instances per resource type, on a copy of the resource db,
+    and the lookup of a free resource afterwards, with the index on (resource_type, available_at) and without it.
+    """
+    with open('resources/resource_config.json', 'r') as file:
+        config = json.load(file)
+    for resource_type in config['resources']:
+        resource_type['capacity'] = capacity
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = os.path.join(directory, 'resource_config.json')
+        with open(config_file, 'w') as file:
+            json.dump(config, file)
+        copy = os.path.join(directory, 'resources.db')
+        shutil.copy(db_file, copy)
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            initialize_resources(config_file=config_file, db_file=copy)
+            durations.append(time.perf_counter() - start)
+        print(f"initialize_resources: {min(durations) * 1000:.1f} ms for {capacity * len(config['resources'])} resources")
+        for indexed in [True, False]:
+            conn = get_db(copy)
+            if not indexed:
+                conn.execute("DROP INDEX IF EXISTS resources_type_available_at")
+            start = time.perf_counter() # lookup of a free resource as in helpers.get_next_available_resource
+            for i in range(repeat * 100):
+                conn.execute("SELECT resource_name, available_at FROM Resources WHERE resource_type = ? and available_at <= ? ORDER BY available_at LIMIT 1", ("nursing_a", float(i))).fetchone()
+            lookup_duration = (time.perf_counter() - start) / (repeat * 100)
+            conn.close()
+            print(f"{'with' if indexed else 'without'} index: {lookup_duration * 1e6:.1f} us per free resource lookup")
+
+if __name__ == '__main__':
+    # usage (from the db directory): python3 benchmark_db.py [capacity per resource type]
+    benchmark_initialize_resources(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
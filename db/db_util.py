@@ -1,39 +1,64 @@
+import os
 import sqlite3
 import json
 
-DATABASE_RESOURCES = '../db/resources/resources.db'
-DATABASE_PATIENTS = '../db/patients/patient.db'
+# can be overridden per process, e.g. for the hospitals of the sharded mode (router.py)
+DATABASE_RESOURCES = os.environ.get('SIMULATOR_RESOURCES_DB', '../db/resources/resources.db')
+DATABASE_PATIENTS = os.environ.get('SIMULATOR_PATIENTS_DB', '../db/patients/patient.db')
+# index and number of the hospitals in the sharded mode, a single simulator is hospital 0 of 1
+HOSPITAL = int(os.environ.get('SIMULATOR_HOSPITAL', 0))
+HOSPITALS = int(os.environ.get('SIMULATOR_HOSPITALS', 1))
 
 def get_db(db_path):
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     return conn
 
+def insert_patient(cursor, patient_type, admission_time):
+    """
+    Inserts a new patient into the patient db and returns its id. The ids of a hospital are HOSPITAL modulo HOSPITALS, so that
+    in the sharded mode they are unique over all hospitals and the router finds the hospital of a patient by its id alone.
+    """
+    cursor.execute(
+        "INSERT INTO Patient (id, patient_type, diagnosis, admission_time) SELECT (COALESCE(MAX(id), 0) / ? + 1) * ? + ?, ?, ?, ? FROM Patient",
+        (HOSPITALS, HOSPITALS, HOSPITAL, patient_type, patient_type, admission_time)
+    )
+    return cursor.lastrowid
+
+def resource_rows(config):
+    """
+    Yields the rows (resource_name, resource_type, available_at) of a resource config: capacity instances per resource type,
+    named <resource_type>_<index>. The availability of single instances can be overridden by name in resource_planning,
+    entries of instances that do not exist are ignored, so that they do not change the capacities.
+    """
+    overrides = {item['resource_name']: item for item in config.get('resource_planning', [])}
+    for resource_type in config['resources']: # default resource initialization
+        for resource_index in range(resource_type['capacity']):
+            resource_name = f"{resource_type['resource_type']}_{resource_index}"
+            override = overrides.pop(resource_name, None)
+            if override is None:
+                yield (resource_name, resource_type['resource_type'], resource_type['available_at'])
+            elif override['resource_type'] != resource_type['resource_type']:
+                raise Exception("Invalid resource type in resource_planning for " + resource_name)
+            else: # override specific resources
+                yield (resource_name, resource_type['resource_type'], override['available_at'])
+    if len(overrides) > 0:
+        print("Ignoring resource_planning entries of unknown resources: ", list(overrides.keys()))
+
 def initialize_resources(config_file='../db/resources/resource_config.json', db_file='../db/resources/resources.db'):
+    """
+    (Re)initializes the resources of the config in one transaction and empties the queue.
+    Also creates the index on (resource_type, available_at), so that the lookup of a free resource stays fast for large pools.
+    """
     with open(config_file, 'r') as file:
         config = json.load(file)
     
     conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM Resources
-    ''')
-    # show all column names
-    for resource_type in config['resources']: # default resource initialization
-        for resource_index in range(resource_type['capacity']):
-            resource_name = f"{resource_type['resource_type']}_{resource_index}"
-            cursor.execute('''
-                INSERT OR REPLACE INTO Resources (resource_name, resource_type, available_at)
-                VALUES (?, ?, ?)
-            ''', (resource_name, resource_type['resource_type'], resource_type['available_at']))
-    # for resource_item in config['resource_planning']: # override specific resources
-    #     cursor.execute('''
-    #             INSERT OR REPLACE INTO Resources (resource_name, resource_type, available_at)
-    #             VALUES (?, ?, ?)
-    #         ''', (resource_item['resource_name'], resource_item['resource_type'], resource_item['available_at']))
-    # reset queue table
-    cursor.execute('''
-        DELETE FROM Queue
-    ''')
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with conn: # one transaction, committed at the end
+        conn.execute("DELETE FROM Resources")
+        conn.executemany("INSERT OR REPLACE INTO Resources (resource_name, resource_type, available_at) VALUES (?, ?, ?)", resource_rows(config))
+        # lookups of a free resource per type stay fast for large pools
+        conn.execute("CREATE INDEX IF NOT EXISTS resources_type_available_at ON Resources (resource_type, available_at)")
+        # reset queue table
+        conn.execute("DELETE FROM Queue")
+    conn.close()
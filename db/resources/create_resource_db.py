@@ -13,6 +13,11 @@ def create_resource_db():
         )
     ''')
 
+    # lookups of a free resource per type stay fast for large pools
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS resources_type_available_at ON Resources (resource_type, available_at)
+    ''')
+
     # Create the queue table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS Queue (
@@ -1,13 +1,35 @@
+import abc
 import random
 import json
+import math
+import multiprocessing
+import os
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
 from datetime import datetime, timedelta
+from multiprocessing import resource_tracker, shared_memory
 
 PATIENT_CONFIG_PATH = "./patient_types.json"
+BASE_TIME = datetime(2018, 1, 1, 0, 0, 0)
+AVERAGE_INTAKE_TIME = 1.125 # hours, an admission collides with the admissions during this time before it
+SHARED_QUEUES = ["ER_PRACTITIONER", "OR", "A_BED", "B_BED"] # queue lengths the fitness function needs, in the order of the shared memory block
 
 def load_patient_types(path):
     with open(path, 'r') as file:
         return json.load(file)['patient_types']
 
+def convert_to_hours(time):
+    """
+    Convert a datetime or ISO 8601 datetime string to hours since 01.01.2018 0:00.
+
+    :param time (datetime or str): point in time
+    :return: float: Hours since 01.01.2018 0:00
+    """
+    if isinstance(time, str):
+        time = datetime.fromisoformat(time)
+    return (time - BASE_TIME).total_seconds() / 3600
+
 def is_within_time_interval(subject_time, start_time, time_interval):
     """
     Check if genome[1]["new_admission_time"] is within the specified time interval of patient["new_admission_time"].
@@ -88,6 +110,25 @@ def generate_evenly_distributed_times(first_admission_time, now, current_time, n
         timestamps = [now for i in range(num_times)]
     return timestamps
 
+def shift_into_interval(time, earliest_time, latest_time):
+    """
+    Shifts a timestamp by whole days so that it is not earlier than earliest_time while keeping its time of day.
+
+    :param time (datetime): timestamp to shift
+    :param earliest_time (datetime): earliest allowed timestamp
+    :param latest_time (datetime): latest allowed timestamp
+
+    :return: datetime: shifted timestamp or None if it does not fit into the interval
+    """
+    if time < earliest_time:
+        days = (earliest_time - time).days + 1
+        time = time + timedelta(days=days)
+        if time - timedelta(days=1) >= earliest_time:
+            time = time - timedelta(days=1)
+    if time > latest_time:
+        return None
+    return time
+
 def generate_new_admission_time(now, last_possible_time):
     """
     Creates a new random admission time for a patient within a given time interval.
@@ -119,56 +160,504 @@ class Resources:
     
     def populate_resources(self, resources):
         """
-        :param: resources (list) e.g. [{'cid': 1, 'task': 'intake', 'start': 0, 'info': {'diagnosis': 'A1'}, 'wait': False}]
+        :param: resources (ResourceSnapshot or list) e.g. [{'cid': 1, 'task': 'intake', 'start': 0, 'info': {'diagnosis': 'A1'}, 'wait': False}]
+                A snapshot that is kept between replans only costs O(number of resource types) here.
+        """
+        if not isinstance(resources, ResourceSnapshot):
+            snapshot = ResourceSnapshot()
+            snapshot.update(resources)
+            resources = snapshot
+        for resource_name, count in resources.occupations.items():
+            self.occupations[resource_name] = self.occupations.get(resource_name, 0) + count
+        for resource_name, count in resources.queues.items():
+            self.queues[resource_name] = self.queues.get(resource_name, 0) + count
+        for key in self.average_nursing_start_time.keys():
+            self.average_nursing_start_time[key] = resources.average_nursing_start_time(key)
+
+class ResourceSnapshot:
+    """
+    Rolling aggregate of the resources sent with successive replan requests: the occupations and queue lengths per
+    resource and the sum of the nursing start times. set and remove ingest single changes in O(1), which the BPO planner
+    does on every change of its state. update takes a full resource list, so it still visits every patient, but only
+    parses and aggregates the entries that differ from the last list.
+    """
+    RESOURCE_MAPPING = { # task names of the BPO simulator and of the simulator server
+        "intake": "INTAKE",
+        "ER_treatment": "ER_PRACTITIONER",
+        "er_treatment": "ER_PRACTITIONER",
+        "surgery": "OR",
+        "nursing": "BED",
+        "nursing_a": "A_BED",
+        "nursing_b": "B_BED",
+    }
+
+    def __init__(self):
+        self.entries = {} # cid -> ((task, start, diagnosis, wait) as received, (resource_name, in_queue, nursing start hours or None))
+        self.occupations = {} # {resource_name: number of current occupations}
+        self.queues = {} # {resource_name: number of patients waiting in queue}
+        self.nursing_start_sums = {"A_BED": [0.0, 0], "B_BED": [0.0, 0]} # {resource_name: [sum of start hours, count]}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def set(self, cid, resource):
+        """
+        Ingests the current resource entry of a patient, if it differs from the last one.
+
+        :param: resource (dict): {"task", "start", "info", "wait"}, start in ISO 8601 or hours since 01.01.2018 0:00
+        """
+        raw = (resource['task'], resource['start'], resource['info'].get('diagnosis'), resource['wait'])
+        if cid in self.entries:
+            if self.entries[cid][0] == raw:
+                return
+            self.remove(cid)
+        task, start, diagnosis, wait = raw
+        resource_name = self.RESOURCE_MAPPING[task]
+        nursing_start = None
+        # handle nursing types
+        if resource_name == "BED":
+            if diagnosis[0] == "A":
+                resource_name = "A_BED"
+            elif diagnosis[0] == "B":
+                resource_name = "B_BED"
+            else:
+                print("UNKOWN DIAGNOSIS")
+        if resource_name in self.nursing_start_sums:
+            nursing_start = start if isinstance(start, (int, float)) else convert_to_hours(start)
+            self.nursing_start_sums[resource_name][0] += nursing_start
+            self.nursing_start_sums[resource_name][1] += 1
+        # handle wait boolean
+        resource_in_queue = wait.lower() == "true" if isinstance(wait, str) else wait
+        # fill up queues and occupations
+        counts = self.queues if resource_in_queue else self.occupations
+        counts[resource_name] = counts.get(resource_name, 0) + 1
+        self.entries[cid] = (raw, (resource_name, resource_in_queue, nursing_start))
+
+    def remove(self, cid):
+        _, (resource_name, resource_in_queue, nursing_start) = self.entries.pop(cid)
+        counts = self.queues if resource_in_queue else self.occupations
+        counts[resource_name] -= 1
+        if nursing_start is not None:
+            self.nursing_start_sums[resource_name][0] -= nursing_start
+            self.nursing_start_sums[resource_name][1] -= 1
+
+    def update(self, resources):
+        """
+        Ingests a full resource list: unchanged entries are only compared, patients that are no longer listed are removed.
+
+        :param: resources (list): [{"cid", "task", "start", "info", "wait"}]
         """
-        resource_mapping = {
-            "intake": "INTAKE",
-            "ER_treatment": "ER_PRACTITIONER",
-            "surgery": "OR",
-            "nursing": "BED",
-        }
-        timestamps_a = []
-        timestamps_b = []
+        cids = set()
         for resource in resources:
-            resource_name = resource_mapping[resource['task']]
-            # handle nursing types
-            if resource_name == "BED":
-                if resource['info']['diagnosis'][0] == "A":
-                    resource_name = "A_BED"
-                    timestamps_a.append(datetime.fromisoformat(resource['start']).timestamp)
-                elif resource['info']['diagnosis'][0] == "B":
-                    resource_name = "B_BED"
-                    timestamps_b.append(datetime.fromisoformat(resource['start']).timestamp)
-                else:
-                    print("UNKOWN DIAGNOSIS")
-                
-            # handle wait boolean
-            if isinstance(resource['wait'], str):
-                resource_in_queue = resource['wait'].lower() == "true"
+            cids.add(resource['cid'])
+            self.set(resource['cid'], resource)
+        for cid in [cid for cid in self.entries if cid not in cids]:
+            self.remove(cid)
+
+    def average_nursing_start_time(self, resource_name):
+        """
+        :return: datetime: average start time of the patients in nursing on the given bed type, None if there are none
+        """
+        total, count = self.nursing_start_sums[resource_name]
+        if count == 0:
+            return None
+        return BASE_TIME + timedelta(hours=total / count)
+
+class WarmStartArchive:
+    """
+    Keeps the results of recent replans per diagnosis, so that the next evolve() call can seed part of its
+    population from them instead of starting from scratch.
+    The elites are stored as offsets relative to the replan time, as the resource situation between two
+    successive replans only changes slightly.
+    """
+    def __init__(self, max_elites=10, seed_ratio=0.3, patience=3):
+        self.max_elites = max_elites # number of recent replans kept per diagnosis
+        self.seed_ratio = seed_ratio # share of the population seeded from the archive
+        self.patience = patience # stop evolving after this many iterations without improvement of the best score
+        self.elites = {} # {diagnosis: deque of timedelta offsets (new_admission_time - replan time)}
+
+    def add(self, diagnosis, current_time, new_admission_time):
+        """
+        Stores the admission time chosen by a replan.
+
+        :param diagnosis (str): diagnosis of the replanned patient
+        :param current_time (datetime): point in time at which replanning was performed
+        :param new_admission_time (datetime): chosen admission time
+        """
+        if diagnosis not in self.elites:
+            self.elites[diagnosis] = deque(maxlen=self.max_elites)
+        self.elites[diagnosis].appendleft(new_admission_time - current_time)
+
+    def get_seed_times(self, content, current_time, num_times):
+        """
+        Returns admission times to seed the population of a patient with. The patient's previous plan comes first,
+        followed by the most recent elites of the same diagnosis. All times are shifted by whole days into the
+        valid replan interval of the patient.
+
+        :param content (dict): patient content {diagnosis, sent_home_counter, first_admission_time, last_replan_time, min_replan_time, new_admission_time}
+        :param current_time (datetime): point in time at which replanning is performed
+        :param num_times (int): maximum number of seed times
+
+        :return: list of datetime: seed times without duplicates
+        """
+        candidates = []
+        if content["sent_home_counter"] > 1: # last_replan_time holds the previous plan of the patient
+            candidates.append(content["last_replan_time"])
+        for offset in self.elites.get(content["diagnosis"], []):
+            candidates.append(current_time + offset)
+        last_possible_time = content["first_admission_time"] + timedelta(days=7)
+        seed_times = []
+        for candidate in candidates:
+            seed_time = shift_into_interval(candidate, content["min_replan_time"], last_possible_time)
+            if seed_time is not None and seed_time not in seed_times:
+                seed_times.append(seed_time)
+            if len(seed_times) >= num_times:
+                break
+        return seed_times
+
+class ReplannedPatients:
+    """
+    Store of the patients that are already replanned, kept sorted by their new admission time (hours since 01.01.2018 0:00).
+    It can be used like the replanned_patients dictionary (key: cid, value: {diagnosis, sent_home_counter, first_admission_time, new_admission_time}),
+    but additionally offers cheap expiry of past admissions and window queries on the admission times.
+    Expiry only advances an offset into the sorted list and compacts the list once the offset passes half of its length,
+    i.e. it costs amortized O(log n) plus O(1) per expired patient. Inserting and removing a single patient shifts the
+    tail of the list (O(n) memmove), which is cheap for the few thousand patients of a planning horizon.
+    """
+    def __init__(self, patients=None):
+        self.patients = {} # {cid: content}
+        self.index_keys = {} # {cid: (new admission time in hours, insertion number)}
+        self.index = [] # sorted list of tuples (new admission time in hours, insertion number, cid), valid from head on
+        self.head = 0 # entries before head are expired
+        self.insertions = 0 # insertion counter, breaks ties between equal admission times
+        if patients is not None:
+            for cid, content in patients.items():
+                self[cid] = content
+
+    def __setitem__(self, cid, content):
+        if cid in self.patients:
+            self.remove_from_index(cid)
+        index_key = (convert_to_hours(content["new_admission_time"]), self.insertions)
+        self.insertions += 1
+        self.patients[cid] = content
+        self.index_keys[cid] = index_key
+        insort(self.index, index_key + (cid,), lo=self.head)
+
+    def __getitem__(self, cid):
+        return self.patients[cid]
+
+    def __delitem__(self, cid):
+        self.remove_from_index(cid)
+        del self.patients[cid]
+
+    def __contains__(self, cid):
+        return cid in self.patients
+
+    def __len__(self):
+        return len(self.patients)
+
+    def __iter__(self):
+        return iter(self.patients)
+
+    def keys(self):
+        return self.patients.keys()
+
+    def values(self):
+        return self.patients.values()
+
+    def items(self):
+        return self.patients.items()
+
+    def remove_from_index(self, cid):
+        position = bisect_left(self.index, self.index_keys.pop(cid), lo=self.head)
+        del self.index[position]
+
+    def expire(self, current_hour, keep=()):
+        """
+        Removes all patients whose admission time is not after current_hour.
+
+        :param current_hour (float): current time in hours since 01.01.2018 0:00
+        :param keep (collection): cids that are not removed even if their admission time has passed
+        """
+        end = bisect_right(self.index, (current_hour, float("inf")), lo=self.head)
+        kept = []
+        for position in range(self.head, end):
+            cid = self.index[position][2]
+            if cid in keep:
+                kept.append(self.index[position])
             else:
-                resource_in_queue = resource['wait']
-            # fill up queues and occupations
-            if resource_in_queue:
-                self.queues[resource_name] += 1
+                del self.patients[cid]
+                del self.index_keys[cid]
+        self.head = end - len(kept)
+        self.index[self.head:end] = kept # kept entries are the earliest ones, so they stay sorted directly before end
+        if self.head > len(self.index) // 2:
+            del self.index[:self.head]
+            self.head = 0
+
+    def count_in_window(self, start_hour, end_hour):
+        """
+        Returns the number of patients with an admission time within [start_hour, end_hour].
+        """
+        return (bisect_right(self.index, (end_hour, float("inf")), lo=self.head)
+                - bisect_left(self.index, (start_hour, float("-inf")), lo=self.head))
+
+    def admission_hours(self):
+        """
+        Returns the new admission times of all patients in hours since 01.01.2018 0:00, sorted.
+        """
+        return [self.index[position][0] for position in range(self.head, len(self.index))]
+
+def calculate_fitness(genome, queues, replanned_patients):
+    """
+    Function to calculate the fitness function score for a given genome.
+
+    :param: genome (tuple list): (case_id, fitness_score, {diagnosis, sent_home_counter, first_admission_time, new_admission_time})
+    :param: queues (dict): number of patients waiting per resource, at least for SHARED_QUEUES
+    :param: replanned_patients (ReplannedPatients or SharedEvaluationData): answers count_in_window on the admission times of the replanned patients
+
+    :return: Double: fitness_value
+    """
+    pen_sent_home = 0
+    average_intake_time = AVERAGE_INTAKE_TIME
+    pen_er_treatment = 0
+    pen_processed = 0
+
+    er_treatment_duration_factor = 10
+    sent_home_factor = 10
+    processed_factor = 10
+
+    # ----- er treatment waiting time -----        
+    # Penality for patients that wait longer than 4 hours after ER treatment until they get processed with Nursing/Surgery
+    # only patients A2, A3, A4, B3, B4 need surgery
+    # er_diagnosis takes 2,5 hours on average
+    # waiting time determined by:
+    # queue length for surgery and nursing + average time left for nursing and surgery
+    replan_delta = genome[2]["new_admission_time"] - genome[2]["last_replan_time"]
+    if (replan_delta < timedelta(hours=36)):
+        if queues["ER_PRACTITIONER"] > 0:
+            if genome[2]["diagnosis"] in ["A2", "A3"]:
+                pen_er_treatment += 2
+            if genome[2]["diagnosis"] in ["A4", "B3", "B4"]:
+                pen_er_treatment += 2
             else:
-                self.occupations[resource_name] += 1
-        
-        for key in self.average_nursing_start_time.keys():
-            if self.average_nursing_start_time[key] is not None:
-                self.average_nursing_start_time[key] = sum(self.average_nursing_start_time[key]) / len(self.average_nursing_start_time[key])
-                self.average_nursing_start_time[key] = datetime.fromtimestamp(self.average_nursing_start_time[key])
+                pen_er_treatment += 1
+        if queues["OR"] > 0:
+            if genome[2]["diagnosis"] in ["A2", "A3"]:
+                pen_er_treatment += 1
+            if genome[2]["diagnosis"] in ["A4", "B3", "B4"]:
+                pen_er_treatment += 2
+        if queues[genome[2]["diagnosis"][0] + "_BED"] > 0: # A_BED or B_BED
+            if genome[2]["diagnosis"] == "A1":
+                pen_er_treatment += 1
+            if genome[2]["diagnosis"] in ["A2", "B1"]:
+                pen_er_treatment += 2
+            if genome[2]["diagnosis"] in ["A3", "A4", "B2", "B3", "B4"]:
+                pen_er_treatment += 3
+            # avg_nursing_start_time = self.resources.average_nursing_start_time[genome[2]["diagnosis"][0] + "_BED"]
+            # if avg_nursing_start_time is not None:
+            #     # if the average nursing start time is less than 5 hours from the current time, add a penalty
+            #     # -> avg nursing time left is > 5 hours
+            #     if (genome[2]["new_admission_time"] - avg_nursing_start_time) > timedelta(hours=5):
+            #         pen_er_treatment += 1
+    pen_er_treatment *= er_treatment_duration_factor
+
+    # ----- patients sent home -----
+    # intake takes norm(1, 0.125) hours
+    # check if at new_admission_time there are already other patients rescheduled or up to 1 hour before
+    admission_hour = convert_to_hours(genome[2]["new_admission_time"])
+    pen_sent_home += replanned_patients.count_in_window(admission_hour - average_intake_time, admission_hour)
+    # check if the new_admission_time is within working hours
+    if not is_working_time(genome[2]["new_admission_time"]):
+        pen_sent_home += 2
+    pen_sent_home *= sent_home_factor
+
+    # ----- patients processed -----        
+    # Penality for patients if their replan_time is not within the time interval 7 days after first_admission_time
+    if not is_within_time_interval(genome[2]["new_admission_time"], genome[2]["first_admission_time"], timedelta(days=7)):
+        pen_processed += 4
+    # Penalty for each hour that the replan_time gets closer to the last_possible_time
+    hours_until_deadline = ((genome[2]["first_admission_time"] + timedelta(days=7)) - genome[2]["new_admission_time"]).total_seconds() / 3600
+    days_until_deadline = hours_until_deadline / 24 # TODO: add abs()?
+    pen_processed += (1 / days_until_deadline) # the smaller the days_until_deadline, the higher the penalty
+    # if hours_until_deadline < 36:
+    #     pen_processed += 1
+
+    pen_processed *= processed_factor
+
+    fitness = (pen_er_treatment + pen_sent_home + pen_processed) / 3
+    return fitness
+
+class SharedEvaluationData:
+    """
+    Read-only view of a shared memory block written by FitnessPool.share, with the queue lengths and the sorted admission
+    times of the replanned patients. It answers count_in_window like ReplannedPatients, so calculate_fitness can use either.
+    """
+    def __init__(self, name):
+        self.shared_memory = shared_memory.SharedMemory(name=name)
+        self.values = self.shared_memory.buf.cast('d') # number of admission times, SHARED_QUEUES, admission times
+        self.queues = {queue: int(self.values[1 + i]) for i, queue in enumerate(SHARED_QUEUES)}
+        start = 1 + len(SHARED_QUEUES)
+        self.admission_hours = self.values[start:start + int(self.values[0])]
+
+    def count_in_window(self, start_hour, end_hour):
+        """
+        Returns the number of patients with an admission time within [start_hour, end_hour].
+        """
+        return bisect_right(self.admission_hours, end_hour) - bisect_left(self.admission_hours, start_hour)
+
+    def close(self):
+        self.admission_hours.release()
+        self.values.release()
+        self.shared_memory.close()
+
+shared_evaluation_data = None # SharedEvaluationData a worker of a FitnessPool is attached to
+
+def evaluate_genomes(arguments):
+    """
+    Evaluates a chunk of genomes in a worker of a FitnessPool. The worker stays attached to the shared memory block
+    until a chunk of the next evolve() call names another one.
+
+    :param arguments (tuple): (name of the shared memory block, list of genomes)
+    :return: list of float: fitness of each genome
+    """
+    global shared_evaluation_data
+    name, genomes = arguments
+    if shared_evaluation_data is None or shared_evaluation_data.shared_memory.name != name:
+        if shared_evaluation_data is not None:
+            shared_evaluation_data.close()
+        shared_evaluation_data = SharedEvaluationData(name)
+    return [calculate_fitness(genome, shared_evaluation_data.queues, shared_evaluation_data) for genome in genomes]
+
+class FitnessPool:
+    """
+    Persistent pool of worker processes that evaluates the genomes of a generation in parallel.
+    The data that stays the same during an evolve() call, the queue lengths and the admission times of the replanned patients,
+    is written once per call into a shared memory block that the workers attach to, so that per generation only the genomes are sent.
+    """
+    def __init__(self, processes=None, min_population=1000):
+        self.processes = processes if processes is not None else os.cpu_count() # number of worker processes
+        self.min_population = min_population # smaller populations are evaluated serially, as sending the genomes costs more than it saves
+        resource_tracker.ensure_running() # the workers share the tracker of the shared memory blocks, so that they do not unlink them on exit
+        self.pool = multiprocessing.Pool(self.processes)
+        self.shared_memory = None # block of the current evolve() call
+
+    def share(self, queues, replanned_patients):
+        """
+        Writes the data of an evolve() call into a new shared memory block, which replaces the block of the previous call.
+
+        :param queues (dict): number of patients waiting per resource
+        :param replanned_patients (ReplannedPatients): patients that are already replanned
+        """
+        self.release()
+        admission_hours = replanned_patients.admission_hours()
+        values = array('d', [len(admission_hours)] + [queues[queue] for queue in SHARED_QUEUES] + admission_hours)
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=len(values) * values.itemsize)
+        self.shared_memory.buf[:len(values) * values.itemsize] = values.tobytes()
+
+    def evaluate(self, genomes):
+        """
+        :return: list of float: fitness of each genome, in the order of the genomes
+        """
+        chunk_size = math.ceil(len(genomes) / self.processes)
+        chunks = [(self.shared_memory.name, genomes[i:i + chunk_size]) for i in range(0, len(genomes), chunk_size)]
+        return [fitness for chunk in self.pool.map(evaluate_genomes, chunks) for fitness in chunk]
+
+    def release(self):
+        if self.shared_memory is not None:
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.release()
+
+class Optimizer(abc.ABC):
+    """
+    Interface of the optimizers that choose the new admission times of the patients to replan, selected by name in evolve() (see OPTIMIZERS).
+    All of them minimize the same fitness function per patient, over the admission times between the patient's min_replan_time
+    and 7 days after its first admission.
+    """
+    batch_evaluation = False # whether the optimizer evaluates whole generations, which a FitnessPool can then evaluate in parallel
 
-class Evolution():
     def __init__(self, patients_to_replan, replanned_patients, resources, max_capacities, current_time):
         # patients_to_replan and replanned patients are dictionaries with disjoint keys
         self.patients_to_replan = patients_to_replan # key: cid, value: {diagnosis, sent_home_counter, first_admission_time, new_admission_time}
+        if not isinstance(replanned_patients, ReplannedPatients): # index plain dictionaries once for the window queries of the fitness function
+            replanned_patients = ReplannedPatients(replanned_patients)
         self.replanned_patients = replanned_patients # key: cid, value: {diagnosis, sent_home_counter, first_admission_time, new_admission_time}
         self.resources = Resources(max_capacities) # initialize resources
         self.resources.populate_resources(resources) # add current resource utilization to resources
         self.patient_types = load_patient_types(PATIENT_CONFIG_PATH)
         # evaluate arrival_rate func: arrival_rate_func = eval(f"lambda: {arrival_rate_func_str}") # see patient_generator.py
         self.current_time = current_time
+        self.fitness_pool = None # FitnessPool that evaluates the generations, None to evaluate them serially
+
+    @abc.abstractmethod
+    def optimize(self, population_size=10, iterations=10, warm_start=None, history=None):
+        """
+        Chooses the new admission times of the patients to replan.
+
+        :param: population_size (int): candidates per patient and iteration, population_size * iterations is the budget of fitness evaluations per patient
+        :param: iterations (int): maximum number of iterations
+        :param: warm_start (WarmStartArchive, optional): archive of recent replans to seed the search with
+        :param: history (list, optional): if given, the best score of each iteration is appended to it
+
+        :return: dictionary: {case_id: new admission time (datetime)}
+        """
+
+    def fitness_function(self, genome):
+        """
+        Function to calculate the fitness function score for a given genome.
+        
+        :param: genome (tuple list): (case_id, {diagnosis, sent_home_counter, first_admission_time, new_admission_time})
+        
+        :return: Double: fitness_value
+        """
+        return calculate_fitness(genome, self.resources.queues, self.replanned_patients)
+
+    def fitness_at(self, cid, admission_time):
+        """
+        :return: float: fitness of admitting the patient to replan with the given cid at admission_time
+        """
+        return self.fitness_function((cid, None, dict(self.patients_to_replan[cid], new_admission_time=admission_time)))
+
+    def score(self, replan_times):
+        """
+        :param: replan_times (dict): {case_id: new admission time} of the patients to replan
+        :return: float: average fitness of the patients to replan
+        """
+        return sum(self.fitness_at(cid, admission_time) for cid, admission_time in replan_times.items()) / len(replan_times)
+
+    def evaluate(self, genomes):
+        """
+        :return: list of float: fitness of each genome, computed by the fitness pool if one is set
+        """
+        if self.fitness_pool is not None:
+            return self.fitness_pool.evaluate(genomes)
+        return [self.fitness_function(genome) for genome in genomes]
+
+    def admission_interval(self, content):
+        """
+        :param: content (dict): patient to replan
+        :return: tuple (earliest, latest) admission time of the patient. The latest is one minute before the deadline, 7 days after
+                 the first admission, as the fitness function divides by the time until the deadline.
+        """
+        earliest = content["min_replan_time"]
+        latest = content["first_admission_time"] + timedelta(days=7) - timedelta(minutes=1)
+        return earliest, max(earliest, latest)
+
+class Evolution(Optimizer):
+    """
+    Genetic algorithm: averaging crossover of the better half of the population and mutation of the admission hour.
+    """
+    batch_evaluation = True
+
+    def __init__(self, patients_to_replan, replanned_patients, resources, max_capacities, current_time):
+        super().__init__(patients_to_replan, replanned_patients, resources, max_capacities, current_time)
         self.population = [] # (case_id, fitness_score, {diagnosis, sent_home_counter, first_admission_time, new_admission_time})
+        self.best_score = None # best fitness score of the last evaluated generation
         
     def get_best_genome_with_cid(self, cid):
         for _, genome in enumerate(self.population):
@@ -186,88 +675,6 @@ class Evolution():
             result[cid] = self.get_best_genome_with_cid(cid)[2]["new_admission_time"]
         return result
     
-    def fitness_function(self, genome):
-        """
-        Function to calculate the fitness function score for a given genome.
-        
-        :param: genome (tuple list): (case_id, {diagnosis, sent_home_counter, first_admission_time, new_admission_time})
-        
-        :return: Double: fitness_value
-        """
-        pen_sent_home = 0
-        average_intake_time = 1.125
-        pen_er_treatment = 0
-        pen_processed = 0
-        
-        er_treatment_duration_factor = 10
-        sent_home_factor = 10
-        processed_factor = 10
-        
-        # ----- er treatment waiting time -----        
-        # Penality for patients that wait longer than 4 hours after ER treatment until they get processed with Nursing/Surgery
-        # only patients A2, A3, A4, B3, B4 need surgery
-        # er_diagnosis takes 2,5 hours on average
-        # waiting time determined by:
-        # queue length for surgery and nursing + average time left for nursing and surgery
-        replan_delta = genome[2]["new_admission_time"] - genome[2]["last_replan_time"]
-        if (replan_delta < timedelta(hours=36)):
-            if self.resources.queues["ER_PRACTITIONER"] > 0:
-                if genome[2]["diagnosis"] in ["A2", "A3"]:
-                    pen_er_treatment += 2
-                if genome[2]["diagnosis"] in ["A4", "B3", "B4"]:
-                    pen_er_treatment += 2
-                else:
-                    pen_er_treatment += 1
-            if self.resources.queues["OR"] > 0:
-                if genome[2]["diagnosis"] in ["A2", "A3"]:
-                    pen_er_treatment += 1
-                if genome[2]["diagnosis"] in ["A4", "B3", "B4"]:
-                    pen_er_treatment += 2
-            if self.resources.queues[genome[2]["diagnosis"][0] + "_BED"] > 0: # A_BED or B_BED
-                if genome[2]["diagnosis"] == "A1":
-                    pen_er_treatment += 1
-                if genome[2]["diagnosis"] in ["A2", "B1"]:
-                    pen_er_treatment += 2
-                if genome[2]["diagnosis"] in ["A3", "A4", "B2", "B3", "B4"]:
-                    pen_er_treatment += 3
-                # avg_nursing_start_time = self.resources.average_nursing_start_time[genome[2]["diagnosis"][0] + "_BED"]
-                # if avg_nursing_start_time is not None:
-                #     # if the average nursing start time is less than 5 hours from the current time, add a penalty
-                #     # -> avg nursing time left is > 5 hours
-                #     if (genome[2]["new_admission_time"] - avg_nursing_start_time) > timedelta(hours=5):
-                #         pen_er_treatment += 1
-        pen_er_treatment *= er_treatment_duration_factor
-        
-        # ----- patients sent home -----
-        # intake takes norm(1, 0.125) hours
-        # check if at new_admission_time there are already other patients rescheduled or up to 1 hour before
-        for patient in self.replanned_patients.values():
-            if is_within_time_interval(genome[2]["new_admission_time"], datetime.fromisoformat(patient["new_admission_time"]), timedelta(hours=average_intake_time)):
-                # if self.resources.queues["INTAKE"] > 0 or self.resources.queues["OR"] > 0 or self.resources.queues["A_BED"] > 0 or self.resources.queues["B_BED"] > 0:
-                #     pen_sent_home += 2
-                # else:
-                pen_sent_home += 1
-        # check if the new_admission_time is within working hours
-        if not is_working_time(genome[2]["new_admission_time"]):
-            pen_sent_home += 2
-        pen_sent_home *= sent_home_factor
-
-        # ----- patients processed -----        
-        # Penality for patients if their replan_time is not within the time interval 7 days after first_admission_time
-        if not is_within_time_interval(genome[2]["new_admission_time"], genome[2]["first_admission_time"], timedelta(days=7)):
-            pen_processed += 4
-        # Penalty for each hour that the replan_time gets closer to the last_possible_time
-        hours_until_deadline = ((genome[2]["first_admission_time"] + timedelta(days=7)) - genome[2]["new_admission_time"]).total_seconds() / 3600
-        days_until_deadline = hours_until_deadline / 24 # TODO: add abs()?
-        pen_processed += (1 / days_until_deadline) # the smaller the days_until_deadline, the higher the penalty
-        # if hours_until_deadline < 36:
-        #     pen_processed += 1
-        
-        pen_processed *= processed_factor
-        
-        fitness = (pen_er_treatment + pen_sent_home + pen_processed) / 3
-        return fitness
-    
     def mutate_genome(self, genome, mutation_probability=0.01, time_variation=4):
         """
         Mutates the genome with a given probability.
@@ -339,13 +746,15 @@ class Evolution():
         """
         # Evaluation: Calculate the fitness of each genome
         avg_score = 0
+        genom_scores = self.evaluate(self.population)
         for idx, genome in enumerate(self.population):
-            genom_score = self.fitness_function(genome)
+            genom_score = genom_scores[idx]
             self.population[idx] = (genome[0], genom_score, genome[2])
             avg_score += genom_score
         avg_score /= len(self.population)
         # Selection for Reproduction: Sort the population based on fitness and select the top 50%
         self.population = sorted(self.population, key=lambda x: x[1], reverse=False) # sort by fitness in ascending order
+        self.best_score = self.population[0][1]
         if len(self.population) > 1:
             selected_population = self.population[:len(self.population) // 2]
             selected_population = sorted(selected_population, key=lambda x: x[2]["new_admission_time"]) # sort by replanning time
@@ -362,9 +771,11 @@ class Evolution():
         self.population = new_population
         return avg_score, 
     
-    def initialize_population(self, pop_size=10):
+    def initialize_population(self, pop_size=10, warm_start=None):
         """
         creates the initial population of genomes with random replanning times
+        if a warm_start archive is given, part of the random replanning times is replaced by the patient's previous plan
+        and the elites of recent replans
 
         :return: list: population of genomes in format (case_id, score, content dictionary)
         """
@@ -373,39 +784,236 @@ class Evolution():
                                                                     now=content["new_admission_time"], 
                                                                     current_time=self.current_time,
                                                                     num_times=pop_size)
+            if warm_start is not None:
+                num_seeds = int(len(new_admission_times) * warm_start.seed_ratio)
+                seed_times = warm_start.get_seed_times(content, self.current_time, num_seeds)
+                new_admission_times[:len(seed_times)] = seed_times
             for new_admission_time in new_admission_times:
                 content_with_new_time = content.copy()
                 content_with_new_time["new_admission_time"] = new_admission_time
                 self.population.append((cid, 9999, content_with_new_time)) # worst score is 9999
 
-def evolve(patients_to_replan, replanned_patients, resources, max_capacities, current_time):
+    def optimize(self, population_size=10, iterations=10, warm_start=None, history=None):
+        """
+        Evolves the population for the given number of iterations, or until the best score has not improved for warm_start.patience iterations.
+        """
+        self.initialize_population(pop_size=population_size, warm_start=warm_start)
+        best_score = None
+        iterations_without_improvement = 0
+        for i in range(iterations):
+            score = self.perform_evolution_cycle()
+            scores = [round(pop[1], 2) for pop in self.population]
+            current_best_score = self.best_score
+            print(f"           Running iteration {i+1}, AVG Score: {score}, Best Score: {current_best_score} top 5 scores: {scores[0:5]}")
+            if history is not None:
+                history.append(current_best_score)
+            if best_score is None or current_best_score < best_score:
+                best_score = current_best_score
+                iterations_without_improvement = 0
+            else:
+                iterations_without_improvement += 1
+            if warm_start is not None and iterations_without_improvement >= warm_start.patience:
+                break
+        return self.get_results()
+
+class GreedyOptimizer(Optimizer):
+    """
+    Slot filling: every patient gets the earliest slot within working time without an intake collision, i.e. without another admission
+    during the average intake time before it. If every slot collides, the slot with the fewest collisions is taken.
+    The patients are filled in one after the other, so the slots chosen for the earlier patients count as collisions for the later ones.
+    """
+    SLOT_LENGTH = timedelta(minutes=15) # distance between the slots of a working day
+
+    def slots(self, earliest, latest):
+        """
+        :return: generator of datetime: the slots within working time between earliest and latest
+        """
+        for span_start, span_end, _ in get_working_time_spans(earliest, latest):
+            slot = span_start
+            while slot < span_end and slot <= latest:
+                yield slot
+                slot += self.SLOT_LENGTH
+
+    def optimize(self, population_size=10, iterations=10, warm_start=None, history=None):
+        """
+        Fills in the patients in a single pass, population_size, iterations and warm_start are not needed.
+        """
+        chosen_hours = [] # sorted admission hours chosen in this call
+        replan_times = {}
+        for cid, content in self.patients_to_replan.items():
+            earliest, latest = self.admission_interval(content)
+            best = (math.inf, earliest) # (collisions, slot), the earliest admission time if no slot is within working time
+            for slot in self.slots(earliest, latest):
+                hour = convert_to_hours(slot)
+                collisions = (self.replanned_patients.count_in_window(hour - AVERAGE_INTAKE_TIME, hour)
+                              + bisect_right(chosen_hours, hour) - bisect_left(chosen_hours, hour - AVERAGE_INTAKE_TIME))
+                if collisions < best[0]:
+                    best = (collisions, slot)
+                    if collisions == 0:
+                        break
+            insort(chosen_hours, convert_to_hours(best[1]))
+            replan_times[cid] = best[1]
+        if history is not None:
+            history.append(self.score(replan_times))
+        return replan_times
+
+class SimulatedAnnealing(Optimizer):
+    """
+    Simulated annealing of the admission time of every patient: a neighbour shifts the admission time by up to TIME_VARIATION hours,
+    a worse neighbour is accepted with probability exp(-fitness difference / temperature), and the temperature falls geometrically
+    from INITIAL_TEMPERATURE to FINAL_TEMPERATURE. Each iteration makes population_size steps per patient, the same number of
+    fitness evaluations as a generation of the genetic algorithm.
+    """
+    TIME_VARIATION = 24 # hours, so that a neighbour can reach the same time of day on the next or previous day
+    INITIAL_TEMPERATURE = 5.0
+    FINAL_TEMPERATURE = 0.05
+
+    def optimize(self, population_size=10, iterations=10, warm_start=None, history=None):
+        """
+        Starts from the patient's previous plan or the most recent elite if a warm_start archive is given, otherwise from the earliest admission time.
+        """
+        states = {} # cid -> [current time, current fitness, best time, best fitness]
+        for cid, content in self.patients_to_replan.items():
+            earliest, latest = self.admission_interval(content)
+            seed_times = warm_start.get_seed_times(content, self.current_time, 1) if warm_start is not None else []
+            start = min(max(seed_times[0], earliest), latest) if len(seed_times) > 0 else earliest
+            fitness = self.fitness_at(cid, start)
+            states[cid] = [start, fitness, start, fitness]
+        steps = population_size * iterations
+        cooling = (self.FINAL_TEMPERATURE / self.INITIAL_TEMPERATURE) ** (1 / max(steps - 1, 1))
+        temperature = self.INITIAL_TEMPERATURE
+        for i in range(iterations):
+            for _ in range(population_size):
+                for cid, state in states.items():
+                    earliest, latest = self.admission_interval(self.patients_to_replan[cid])
+                    candidate = min(max(state[0] + timedelta(hours=random.uniform(-self.TIME_VARIATION, self.TIME_VARIATION)), earliest), latest)
+                    candidate_fitness = self.fitness_at(cid, candidate)
+                    difference = candidate_fitness - state[1]
+                    if difference <= 0 or random.random() < math.exp(-difference / temperature):
+                        state[0], state[1] = candidate, candidate_fitness
+                        if candidate_fitness < state[3]:
+                            state[2], state[3] = candidate, candidate_fitness
+                temperature *= cooling
+            if history is not None:
+                history.append(sum(state[3] for state in states.values()) / len(states))
+        return {cid: state[2] for cid, state in states.items()}
+
+class CMAES(Optimizer):
+    """
+    CMA-ES over the admission hours of all patients to replan, each scaled to [0, 1] over the patient's admission interval.
+    The covariance matrix is kept diagonal (separable CMA-ES), as the fitness is a sum of independent terms per patient,
+    which also needs no eigendecomposition. Each iteration samples a generation of population_size candidates.
+    Candidates outside the admission intervals are evaluated at the nearest bound.
+    """
+    batch_evaluation = True
+    INITIAL_SIGMA = 0.3 # initial step size, in units of the admission interval
+
+    def admission_time(self, cid, x):
+        earliest, latest = self.admission_interval(self.patients_to_replan[cid])
+        return earliest + (latest - earliest) * min(max(x, 0.0), 1.0)
+
+    def optimize(self, population_size=10, iterations=10, warm_start=None, history=None):
+        """
+        Starts at the middle of the admission intervals, or at the previous plans and most recent elites if a warm_start archive is given.
+        """
+        cids = list(self.patients_to_replan.keys())
+        n = len(cids)
+        mean = []
+        for cid in cids:
+            content = self.patients_to_replan[cid]
+            earliest, latest = self.admission_interval(content)
+            seed_times = warm_start.get_seed_times(content, self.current_time, 1) if warm_start is not None else []
+            if len(seed_times) > 0 and latest > earliest:
+                mean.append(min(max((seed_times[0] - earliest) / (latest - earliest), 0.0), 1.0))
+            else:
+                mean.append(0.5)
+        # strategy parameters as in Hansen's CMA-ES tutorial, with the learning rates of the separable variant
+        offspring = max(population_size, 2)
+        parents = offspring // 2
+        weights = [math.log(parents + 0.5) - math.log(i + 1) for i in range(parents)]
+        weights = [weight / sum(weights) for weight in weights]
+        mu_eff = 1 / sum(weight ** 2 for weight in weights)
+        c_sigma = (mu_eff + 2) / (n + mu_eff + 5)
+        d_sigma = 1 + 2 * max(0, math.sqrt((mu_eff - 1) / (n + 1)) - 1) + c_sigma
+        c_c = (4 + mu_eff / n) / (n + 4 + 2 * mu_eff / n)
+        c_1 = 2 / ((n + 1.3) ** 2 + mu_eff) * (n + 2) / 3
+        c_mu = min(1 - c_1, 2 * (mu_eff - 2 + 1 / mu_eff) / ((n + 2) ** 2 + mu_eff) * (n + 2) / 3)
+        chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+        sigma = self.INITIAL_SIGMA
+        variances = [1.0] * n # diagonal of the covariance matrix
+        p_sigma = [0.0] * n # evolution path of the step size
+        p_c = [0.0] * n # evolution path of the covariance matrix
+        best = (math.inf, mean) # (fitness, candidate)
+        for generation in range(iterations):
+            samples = [] # (z, y, candidate) with candidate = mean + sigma * y and y = sqrt(variances) * z
+            for _ in range(offspring):
+                z = [random.gauss(0, 1) for _ in range(n)]
+                y = [math.sqrt(variances[i]) * z[i] for i in range(n)]
+                samples.append((z, y, [mean[i] + sigma * y[i] for i in range(n)]))
+            genomes = [(cid, None, dict(self.patients_to_replan[cid], new_admission_time=self.admission_time(cid, candidate[i])))
+                       for _, _, candidate in samples for i, cid in enumerate(cids)]
+            scores = self.evaluate(genomes)
+            fitness = [sum(scores[k * n:(k + 1) * n]) for k in range(offspring)]
+            order = sorted(range(offspring), key=lambda k: fitness[k])[:parents]
+            if fitness[order[0]] < best[0]:
+                best = (fitness[order[0]], samples[order[0]][2])
+            z_w = [sum(weights[j] * samples[k][0][i] for j, k in enumerate(order)) for i in range(n)]
+            y_w = [sum(weights[j] * samples[k][1][i] for j, k in enumerate(order)) for i in range(n)]
+            mean = [mean[i] + sigma * y_w[i] for i in range(n)]
+            p_sigma = [(1 - c_sigma) * p_sigma[i] + math.sqrt(c_sigma * (2 - c_sigma) * mu_eff) * z_w[i] for i in range(n)]
+            p_sigma_norm = math.sqrt(sum(value ** 2 for value in p_sigma))
+            h_sigma = p_sigma_norm / math.sqrt(1 - (1 - c_sigma) ** (2 * (generation + 1))) < (1.4 + 2 / (n + 1)) * chi_n
+            p_c = [(1 - c_c) * p_c[i] + h_sigma * math.sqrt(c_c * (2 - c_c) * mu_eff) * y_w[i] for i in range(n)]
+            variances = [(1 - c_1 - c_mu) * variances[i]
+                         + c_1 * (p_c[i] ** 2 + (not h_sigma) * c_c * (2 - c_c) * variances[i])
+                         + c_mu * sum(weights[j] * samples[k][1][i] ** 2 for j, k in enumerate(order)) for i in range(n)]
+            sigma *= math.exp(c_sigma / d_sigma * (p_sigma_norm / chi_n - 1))
+            if history is not None:
+                history.append(best[0] / n)
+        return {cid: self.admission_time(cid, best[1][i]) for i, cid in enumerate(cids)}
+
+OPTIMIZERS = {
+    "ga": Evolution,
+    "greedy": GreedyOptimizer,
+    "annealing": SimulatedAnnealing,
+    "cma_es": CMAES,
+}
+
+def evolve(patients_to_replan, replanned_patients, resources, max_capacities, current_time, warm_start=None, history=None,
+           population_size=10, iterations=10, fitness_pool=None, optimizer="ga"):
     """
     Function to evolve the replanning times of patients. Also takes into account the patients
     that are already replanned as well as the current resource sitution.
 
     :param: patients_to_replan (dict): patients to be replanned in format {case_id: {diagnoisis, sent_home_counter, first_admission_time, new_admission_time}}
     :param: replanned_patients (dict): patients that are already replanned in format {case_id: {diagnosis, sent_home_counter, first_admission_time, new_admission_time}}
-    :param: resources (list): list of resources in format [{"cid", "task", "start", "info", "wait"}]
+    :param: resources (ResourceSnapshot or list): snapshot or list of resources in format [{"cid", "task", "start", "info", "wait"}], start in ISO 8601 or hours since 01.01.2018 0:00
     :param: current_time (datetime): point in time at which replanning is performed
-    :param: iterations (int, optional): _description_. Defaults to 10.
+    :param: warm_start (WarmStartArchive, optional): archive of recent replans used to seed the population and stop early. Defaults to None (cold start).
+    :param: history (list, optional): if given, the best score of each iteration is appended to it (convergence curve).
+    :param: population_size (int, optional): number of genomes per patient to replan. Defaults to 10.
+    :param: iterations (int, optional): maximum number of evolution cycles. Defaults to 10.
+    :param: fitness_pool (FitnessPool, optional): worker pool that evaluates the generations in parallel if the population has at least
+            fitness_pool.min_population genomes. Defaults to None (serial evaluation).
+    :param: optimizer (str, optional): name of the optimizer in OPTIMIZERS. Defaults to "ga", the genetic algorithm.
 
     :return: dictionary: dictionray with case_id as key and content as value - compatible with replanned_patients in planner.py
     """
-    population_size=10
-    iterations = 10
-    
     cids = list(patients_to_replan.keys())
-    evolution = Evolution(patients_to_replan, replanned_patients, resources, max_capacities, current_time)
-    evolution.initialize_population(pop_size=population_size)
-    for i in range(iterations): # potentially add stopping criteria based on score
-        score = evolution.perform_evolution_cycle()
-        scores = [round(pop[1], 2) for pop in evolution.population]
-        current_best_score = evolution.population[0][1]
-        print(f"           Running iteration {i+1}, AVG Score: {score}, Best Score: {current_best_score} top 5 scores: {scores[0:5]}")
-
-        
-    replan_times = evolution.get_results()
+    if optimizer not in OPTIMIZERS:
+        raise ValueError("Unknown optimizer", optimizer)
+    backend = OPTIMIZERS[optimizer](patients_to_replan, replanned_patients, resources, max_capacities, current_time)
+    if fitness_pool is not None and backend.batch_evaluation and population_size * len(patients_to_replan) >= fitness_pool.min_population:
+        fitness_pool.share(backend.resources.queues, backend.replanned_patients)
+        backend.fitness_pool = fitness_pool
+    try:
+        replan_times = backend.optimize(population_size=population_size, iterations=iterations, warm_start=warm_start, history=history)
+    finally: # the shared memory of this replan must be released also if the optimization fails
+        if backend.fitness_pool is not None:
+            fitness_pool.release()
     for cid in cids:
+        if warm_start is not None:
+            warm_start.add(patients_to_replan[cid]["diagnosis"], current_time, replan_times[cid])
         patients_to_replan[cid]["new_admission_time"] = replan_times[cid].isoformat()
         patients_to_replan[cid]["last_replan_time"] = replan_times[cid].isoformat()
         patients_to_replan[cid]["first_admission_time"] = patients_to_replan[cid]["first_admission_time"].isoformat()
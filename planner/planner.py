@@ -1,10 +1,14 @@
 
 import bottle
+import os
 import requests
 import json
+import sys
+sys.path.append('../')
 from datetime import datetime, timedelta
-from evolution import evolve
+from evolution import evolve, WarmStartArchive, ReplannedPatients, ResourceSnapshot, FitnessPool, OPTIMIZERS
 from helpers import convert_to_hours_since_2018, load_max_capacities, convert_from_my_resources
+from common.wire_format import PACKED, ENCODINGS, ENCODING_HEADER, ACCEPT_HEADER, decode_form_field
 
 RESOURCE_CONFIG_PATH = "../db/resources/resource_config.json"
 
@@ -14,7 +18,14 @@ def replan_patient():
     cid = req.forms.cid # Case ID
     current_time = datetime.fromisoformat(req.forms.time) # Current Time (ISO 8601, XML Schema DataTime format)
     info = json.loads(req.forms.get('info')) # json hash - can contain arbitrary keys e.g. "diagnosis"
-    resources = json.loads(req.forms.resources) # list of json hashes - fixed structure [("cid", "task", "start", "info", "wait")]
+    if req.headers.get(ENCODING_HEADER) == PACKED: # packed records, start in hours since 01.01.2018 0:00
+        resources = decode_form_field(req.forms.resources)
+    else:
+        resources = json.loads(req.forms.resources) # list of json hashes - fixed structure [("cid", "task", "start", "info", "wait")]
+    bottle.response.set_header(ACCEPT_HEADER, ", ".join(ENCODINGS)) # lets the simulator switch to the packed encoding
+    optimizer = req.forms.get('optimizer') or planner.optimizer # optimizer of this request, see OPTIMIZERS in evolution.py
+    if optimizer not in OPTIMIZERS:
+        return bottle.HTTPResponse(json.dumps({'error': f"Unknown optimizer {optimizer}"}), status=400, headers={'content-type': 'application/json'})
     # callback_url = req.headers['CPEE-CALLBACK']
     # planner.plan_patient(cid, current_time, info, resources, callback_url)
     # return bottle.HTTPResponse(
@@ -22,24 +33,32 @@ def replan_patient():
     #     status=202,
     #     headers={'content-type': 'application/json', 'CPEE-CALLBACK': 'true'}
     #     )
-    return planner.plan_patient(cid, current_time, info, resources)
+    return planner.plan_patient(cid, current_time, info, resources, optimizer=optimizer)
 
 
 class Planner:
     def __init__(self):
         self.super = super()
-        self.replanned_patients = {}
+        self.replanned_patients = ReplannedPatients()
         self.patients_to_replan = {}
         self.max_capacities = load_max_capacities(RESOURCE_CONFIG_PATH) 
+        # warm-start mode, off by default: seeds the evolution with recent replans and stops it early
+        self.warm_start = WarmStartArchive() if os.environ.get("PLANNER_WARM_START") else None
+        self.resource_snapshot = ResourceSnapshot() # resource situation of the last replan request, unchanged entries are not parsed again
+        self.population_size = int(os.environ.get("PLANNER_POPULATION_SIZE", 10)) # genomes per patient to replan
+        self.optimizer = os.environ.get("PLANNER_OPTIMIZER", "ga") # optimizer of the requests that do not choose one
+        # worker processes that evaluate large generations in parallel, started once and kept for all replans
+        self.fitness_pool = FitnessPool(int(os.environ["PLANNER_FITNESS_WORKERS"])) if os.environ.get("PLANNER_FITNESS_WORKERS") else None
     
-    def plan_patient(self, cid, current_time, info, resources, callback_url=None):
+    def plan_patient(self, cid, current_time, info, resources, callback_url=None, optimizer="ga"):
         """
         Function to plan the patient
         
         :param: cid (Integer): Case ID
         :param: time (String): current time in ISO 8601, XML Schema DataTime format
         :param: info (dictionary): json hash - can contain arbitrary keys e.g. "diagnosis"
-        :param: resources (list): list of json hashes - fixed structure {"cid", "task", "start", "info", "wait"}
+        :param: resources (list): list of json hashes - fixed structure {"cid", "task", "start", "info", "wait"}, start in ISO 8601 or hours since 01.01.2018 0:00
+        :param: optimizer (String): name of the optimizer in OPTIMIZERS that chooses the admission time
         
         :return: String: replan_time_iso: ISO 8601, XML Schema DataTime format
         """
@@ -50,12 +69,8 @@ class Planner:
         for resource in resources:
             resource['task'] = convert_from_my_resources['task']
         
-        # clean up replanned_patients dictionary
-        for cid_replanned in list(self.replanned_patients.keys()):
-            replan_time = convert_to_hours_since_2018(self.replanned_patients[cid_replanned]["new_admission_time"])
-            current_time_rel = convert_to_hours_since_2018(current_time)
-            if (replan_time <= current_time_rel) and (cid_replanned != cid):
-                del self.replanned_patients[cid_replanned]
+        # clean up replanned_patients: patients whose admission time has passed are no longer relevant for replanning
+        self.replanned_patients.expire(convert_to_hours_since_2018(current_time), keep=(cid,))
         
         # update the replanned_patients dictionary
         if cid in self.replanned_patients.keys(): 
@@ -80,7 +95,9 @@ class Planner:
         }
         
         # Evolutionary Algorithm
-        replanned_patients = evolve(self.patients_to_replan, self.replanned_patients, resources, self.max_capacities, current_time)
+        self.resource_snapshot.update(resources)
+        replanned_patients = evolve(self.patients_to_replan, self.replanned_patients, self.resource_snapshot, self.max_capacities, current_time, warm_start=self.warm_start,
+                                    population_size=self.population_size, fitness_pool=self.fitness_pool, optimizer=optimizer)
         replan_time_iso = replanned_patients[cid]["new_admission_time"]
         replan_time_rel = convert_to_hours_since_2018(replan_time_iso)
         
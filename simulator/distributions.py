@@ -0,0 +1,107 @@
+import random
+from bisect import bisect
+from itertools import accumulate
+
+DIAGNOSE_PROBABILITIES = { # patient_type: (diagnoses, probabilities)
+    "A": (["A1", "A2", "A3", "A4"], [0.5, 0.25, 0.125, 0.125]),
+    "B": (["B1", "B2", "B3", "B4"], [0.5, 0.25, 0.125, 0.125]),
+    "EM": (["ER"], [1.0]),
+}
+DIAGNOSE_CUMULATIVE_PROBABILITIES = {patient_type: (diagnoses, list(accumulate(probabilities))) for patient_type, (diagnoses, probabilities) in DIAGNOSE_PROBABILITIES.items()}
+DIAGNOSIS_INDEPENDENT_DURATIONS = { # resource_type: (mean, std) for resources whose duration does not depend on the diagnosis
+    "er_treatment": (2, 0.5),
+    "intake": (1, 0.125),
+}
+
+def normalize_diagnosis(patient_type):
+    """
+    Removes the ER prefix of patient types like "ER_B3", as they are treated like the diagnosis itself.
+    """
+    if patient_type.startswith("ER"):
+        return patient_type[-2:]
+    return patient_type
+
+def sample_patient_diagnose(patient_type):
+    """
+    Samples a diagnose of the given patient type ("A", "B" or "EM").
+    """
+    if patient_type not in DIAGNOSE_CUMULATIVE_PROBABILITIES:
+        raise Exception("Invalid patient type")
+    diagnoses, cumulative_probabilities = DIAGNOSE_CUMULATIVE_PROBABILITIES[patient_type]
+    return diagnoses[bisect(cumulative_probabilities, random.uniform(0, 1))]
+
+class DistributionTable:
+    """
+    The distributions of patient_types.json compiled once into lookup tables:
+    - durations: {(diagnosis, resource_type): (mean, std)} of the normally distributed task durations
+    - complication_probabilities: {diagnosis: probability of a complication after nursing}
+    Single samples are drawn with the random module, batches with NumPy.
+    """
+    def __init__(self, patient_types_config):
+        self.durations = {}
+        self.complication_probabilities = {}
+        for pt in patient_types_config:
+            diagnosis = pt['diagnosis']
+            for resource_type, (mean, std) in DIAGNOSIS_INDEPENDENT_DURATIONS.items():
+                self.durations[(diagnosis, resource_type)] = (mean, std)
+            if pt['operation_time_mean'] is not None:
+                self.durations[(diagnosis, "surgery")] = (pt['operation_time_mean'], pt['operation_time_std'])
+            if pt['nursing_time_mean'] is not None:
+                for resource_type in ["nursing_a", "nursing_b"]:
+                    self.durations[(diagnosis, resource_type)] = (pt['nursing_time_mean'], pt['nursing_time_std'])
+            if pt['complication_prob'] is not None:
+                self.complication_probabilities[diagnosis] = pt['complication_prob']
+
+    def get_duration_distribution(self, patient_type, resource_type):
+        if resource_type in DIAGNOSIS_INDEPENDENT_DURATIONS: # also for diagnoses like ER_phantom_pain that are not in the config
+            return DIAGNOSIS_INDEPENDENT_DURATIONS[resource_type]
+        key = (normalize_diagnosis(patient_type), resource_type)
+        if key not in self.durations:
+            raise Exception("Invalid resource type")
+        return self.durations[key]
+
+    def sample_duration(self, patient_type, resource_type):
+        mean, std = self.get_duration_distribution(patient_type, resource_type)
+        return max(0.0, random.normalvariate(mean, std))
+
+    def sample_durations(self, patient_type, resource_type, size, rng=None):
+        """
+        Draws size durations at once.
+
+        :return: numpy array of durations
+        """
+        import numpy as np # only needed for batches, so that the server starts without loading numpy
+        rng = rng if rng is not None else np.random.default_rng()
+        mean, std = self.get_duration_distribution(patient_type, resource_type)
+        return np.maximum(0.0, rng.normal(mean, std, size))
+
+    def get_complication_probability(self, patient_type):
+        diagnosis = normalize_diagnosis(patient_type)
+        if diagnosis not in self.complication_probabilities:
+            raise Exception("Invalid patient type")
+        return self.complication_probabilities[diagnosis]
+
+    def sample_complication(self, patient_type):
+        random_value = random.uniform(0, 1)
+        return random_value < self.get_complication_probability(patient_type)
+
+    def sample_complications(self, patient_type, size, rng=None):
+        """
+        Draws size complications at once.
+
+        :return: numpy array of booleans
+        """
+        import numpy as np
+        rng = rng if rng is not None else np.random.default_rng()
+        return rng.random(size) < self.get_complication_probability(patient_type)
+
+    def sample_diagnoses(self, patient_type, size, rng=None):
+        """
+        Draws size diagnoses of the given patient type at once.
+
+        :return: numpy array of diagnoses
+        """
+        import numpy as np
+        rng = rng if rng is not None else np.random.default_rng()
+        diagnoses, probabilities = DIAGNOSE_PROBABILITIES[patient_type]
+        return rng.choice(diagnoses, size=size, p=probabilities)
@@ -1,3 +1,4 @@
+import sys
 from enum import Enum, auto
 
 class EventType(Enum):
@@ -10,6 +11,8 @@ class EventType(Enum):
     REPLAN_PATIENT = auto()
 
 class Event:
+    __slots__ = ("event_type", "event_start", "event_end", "event_resource", "event_callback_url", "event_callback_content", "patient_id", "patient_type")
+
     def __init__(self, event_type, event_start, event_end=None, event_resource=None, event_callback_url=None, event_callback_content=None, patient_id=None, patient_type=None):
         self.event_type = event_type
         self.event_start = event_start
@@ -18,7 +21,7 @@ class Event:
         self.event_callback_url = event_callback_url
         self.event_callback_content = event_callback_content
         self.patient_id = patient_id
-        self.patient_type = patient_type
+        self.patient_type = sys.intern(patient_type) if isinstance(patient_type, str) else patient_type # patient types arrive as new strings with every request
         
     def __lt__(self, other):
         if self.event_start == other.event_start:
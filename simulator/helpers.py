@@ -1,9 +1,9 @@
 import random
 import json
-import requests
 import sys
 sys.path.append('../')
 from db.db_util import get_db, DATABASE_RESOURCES
+from distributions import sample_patient_diagnose
  
 def load_patient_types(path):
     with open(path, 'r') as file:
@@ -22,6 +22,7 @@ def create_cpee_instance(patient_type, arrival_time, patient_id=None, xml_url="h
     else: # patient coming from initial creation
         # init_data = "{\"patient_type\": \"" + patient_type + "\", \"arrival_time\": \"" + str(arrival_time) + "\"}"
         init_data = json.dumps({"patient_type": patient_type, "arrival_time": arrival_time})
+    import requests # loaded on first use, not at startup
     data = {"behavior": "fork_running",
             "url": xml_url,
             "init": init_data,
@@ -55,6 +56,21 @@ def get_queue_length(resource_type):
     conn.close()
     return result
 
+def get_resource_usage(current_time):
+    """
+    Returns the queue length, number of busy and total number of resources per resource type.
+
+    :return: dict: resource_type -> (queue_length, busy, total)
+    """
+    conn = get_db(DATABASE_RESOURCES)
+    cursor = conn.cursor()
+    cursor.execute("SELECT resource_type, COUNT(*) AS total, SUM(available_at > ?) AS busy FROM Resources GROUP BY resource_type", (current_time,))
+    resources = {row['resource_type']: (row['busy'], row['total']) for row in cursor.fetchall()}
+    cursor.execute("SELECT resource_type, COUNT(*) FROM queue GROUP BY resource_type")
+    queue_lengths = {row[0]: row[1] for row in cursor.fetchall()}
+    conn.close()
+    return {resource_type: (queue_lengths.get(resource_type, 0),) + resources.get(resource_type, (0, 0)) for resource_type in set(resources) | set(queue_lengths)}
+
 def pop_queue(resource_type):
     conn = get_db(DATABASE_RESOURCES)
     cursor = conn.cursor()
@@ -68,29 +84,7 @@ def pop_queue(resource_type):
     return row
 
 def get_patient_diagnose(patient_type):
-    random_value = random.uniform(0, 1)
-    if patient_type == "A":
-        if random_value < 0.5:
-            return "A1"
-        elif random_value < 0.75:
-            return "A2"
-        elif random_value < 0.875:
-            return "A3"
-        else:
-            return "A4"
-    elif patient_type == "B":
-        if random_value < 0.5:
-            return "B1"
-        elif random_value < 0.75:
-            return "B2"
-        elif random_value < 0.875:
-            return "B3"
-        else:
-            return "B4"
-    elif patient_type == "EM":
-        return "ER"
-    else:
-        raise Exception("Invalid patient type")
+    return sample_patient_diagnose(patient_type)
         
 def get_random_patient():
     patient = random.choice(['ER', 'A', 'B'])
@@ -107,42 +101,13 @@ def get_ER_diagnose():
         res = "ER_" + get_patient_diagnose("B")
         return res
 
-def get_complications(patient_type):
-    random_value = random.uniform(0, 1)
-    complications = "False"
-    if patient_type.startswith("ER"):
-        patient_type = patient_type[-2:]
-    if patient_type in ["A1", "A2", "B2"]:
-        if random_value < 0.01:
-            complications = "True"
-    elif patient_type in ["A3", "A4", "B3", "B4"]:
-        if random_value < 0.02:
-            complications = "True"
-    elif patient_type == "B1":
-        if random_value < 0.001:
-            complications = "True"
-    else: 
-        raise Exception("Invalid patient type")
-    return complications
+def get_complications(distribution_table, patient_type):
+    return "True" if distribution_table.sample_complication(patient_type) else "False"
 
-def get_task_duration(patient_types_config, patient_type, resource_type):
-    if resource_type == "er_treatment":
-        return max(0.0, random.normalvariate(2, 0.5))
-    elif resource_type == "intake":
-        return max(0.0, random.normalvariate(1, 0.125))
-    else:
-        if patient_type.startswith("ER"):
-            patient_type = patient_type[-2:]
-        for pt in patient_types_config:
-            if pt['diagnosis'] == patient_type:
-                if resource_type == "surgery":
-                    return max(0.0, random.normalvariate(pt['operation_time_mean'], pt['operation_time_std']))
-                elif resource_type.startswith("nursing"):
-                    return max(0.0, random.normalvariate(pt['nursing_time_mean'], pt['nursing_time_std']))
-                else:
-                    raise Exception("Invalid resource type")
+def get_task_duration(distribution_table, patient_type, resource_type):
+    return distribution_table.sample_duration(patient_type, resource_type)
 
-def generate_response_text(finish_time, patient_type, resource_type):
+def generate_response_text(distribution_table, finish_time, patient_type, resource_type):
     if resource_type == "er_treatment":
         er_patient_type = get_ER_diagnose()
         return {"patient_type": er_patient_type, "finish_time": finish_time}  
@@ -151,7 +116,7 @@ def generate_response_text(finish_time, patient_type, resource_type):
     elif resource_type == "surgery":
         return {"finish_time": finish_time}
     elif resource_type.startswith("nursing"):
-        complication = get_complications(patient_type)
+        complication = get_complications(distribution_table, patient_type)
         return {"complication": complication, "finish_time": finish_time}
     else: 
         raise Exception("Invalid resource type")
\ No newline at end of file
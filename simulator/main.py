@@ -2,18 +2,44 @@ import bottle
 import sys
 import os
 import threading
+import time
 import datetime
 from state import State
-from route_handler import admit_patient, request_resource, release_patient, replan_patient, send_system_state
+from route_handler import admit_patient, request_resource, release_patient, replan_patient, send_system_state, send_metrics_series, send_prometheus_metrics
 from logging_util import setup_logging
+from request_trace import TraceRecorder
 
+trace_recorder = None # records inbound requests if a trace file is given
 
 
+def run_simulation():
+    state.start_metrics(interval=1.0) # loads numpy, so it is done in the simulation thread while the server already accepts requests
+    state.run()
+
 def get_unique_log_file_name():
     # Generate a unique log file name based on the current timestamp
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    if os.environ.get("SIMULATOR_HOSPITAL"): # one log per hospital in the sharded mode
+        return os.path.join("logs", f"process_log_{timestamp}_hospital_{os.environ['SIMULATOR_HOSPITAL']}.log")
     return os.path.join("logs", f"process_log_{timestamp}.log")
 
+@bottle.hook('before_request')
+def record_request():
+    if trace_recorder is not None:
+        trace_recorder.record(bottle.request, state.time)
+
+@bottle.hook('before_request')
+def start_request_timer():
+    bottle.request.environ['simulator.request_start'] = time.perf_counter()
+
+@bottle.hook('after_request')
+def observe_request(): # request latency per route for /metrics
+    start = bottle.request.environ.get('simulator.request_start')
+    if start is None:
+        return
+    route = bottle.request.environ.get('bottle.route')
+    state.server_metrics.request_duration.observe(time.perf_counter() - start, route.rule if route is not None else "unmatched", bottle.request.method, bottle.response.status_code)
+
 @bottle.route('/admit-patient', method='POST')
 def handle_admit_patient():
     return admit_patient(state)
@@ -34,15 +60,28 @@ def handle_replan_patient():
 def handle_get_system_state():
     return send_system_state(state)
 
+@bottle.route('/metrics-series', method='GET')
+def handle_get_metrics_series(): # time series of queue lengths, utilization and patient counts as csv
+    return send_metrics_series(state)
+
+@bottle.route('/metrics', method='GET')
+def handle_get_metrics(): # Prometheus text format: request and outbound call latency, event queue depth, occupancy and queue length per resource type
+    return send_prometheus_metrics(state)
+
 if __name__ == '__main__':
     setup_logging(get_unique_log_file_name())
-    if len(sys.argv) == 3:
+    if len(sys.argv) >= 3:
         runtime = float(sys.argv[1])
         test_run = sys.argv[2]
     else: 
         runtime = 10.0
         test_run = False
-    state = State(running_time=runtime, test=test_run) # start simulator with parameters from the discord photo
-    simulation_thread = threading.Thread(target=state.run)
+    if len(sys.argv) == 4: # record all inbound requests for replay with request_trace.py
+        trace_recorder = TraceRecorder(sys.argv[3])
+    state = State(running_time=runtime, test=test_run) # start simulator with parameters from the discord photo, initial patients are generated on demand
+    if os.environ.get("SIMULATOR_PROFILE"): # per event type timing, "cprofile" or "pyinstrument" also capture the simulation thread
+        profile = os.environ["SIMULATOR_PROFILE"]
+        state.enable_profiling(capture=profile if profile in ["cprofile", "pyinstrument"] else None)
+    simulation_thread = threading.Thread(target=run_simulation)
     simulation_thread.start()
-    bottle.run(host='::0', port=12790)
+    bottle.run(host='::0', port=int(os.environ.get("SIMULATOR_PORT", 12790))) # hospitals of the sharded mode get their own port
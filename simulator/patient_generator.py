@@ -1,13 +1,84 @@
 from helpers import float_range, load_patient_types, get_patient_diagnose
+from distributions import DistributionTable
+import ast
+import math
 import random
+import numpy as np
+
+def compile_arrival_rate(arrival_rate_str):
+    """
+    Compiles an arrival rate expression of patient_types.json into a function (rng, size) -> numpy array of samples.
+    Calls of random.uniform, random.expovariate, random.normalvariate and random.gauss with constant arguments are drawn
+    with NumPy at once, any other expression is compiled once and evaluated per sample.
+    """
+    expression = ast.parse(arrival_rate_str, mode='eval').body
+    if isinstance(expression, ast.Call) and isinstance(expression.func, ast.Attribute) \
+            and isinstance(expression.func.value, ast.Name) and expression.func.value.id == "random":
+        try:
+            args = [ast.literal_eval(arg) for arg in expression.args]
+        except ValueError: # arguments are not constant
+            args = None
+        if args is not None:
+            if expression.func.attr == "uniform":
+                return lambda rng, size: rng.uniform(args[0], args[1], size)
+            elif expression.func.attr == "expovariate":
+                return lambda rng, size: rng.exponential(1 / args[0], size)
+            elif expression.func.attr in ["normalvariate", "gauss"]:
+                return lambda rng, size: rng.normal(args[0], args[1], size)
+    code = compile(arrival_rate_str, "<arrival_rate>", "eval")
+    return lambda rng, size: np.array([eval(code, {"random": random}) for _ in range(size)])
 
 class Patient_Generator():
-    def __init__(self, runtime):
+    def __init__(self, runtime, seed=None):
         self.runtime = runtime
         self.patient_types = load_patient_types('../patient_types.json')
-        
-    
+        if seed is None: # derived from the random module, so that random.seed still makes the generated patients reproducible
+            seed = random.getrandbits(64)
+        self.rng = np.random.default_rng(seed)
+        self.distribution_table = DistributionTable(self.patient_types)
+        self.arrival_samplers = {} # {patient_type: compiled arrival rate}
+        for pt in self.patient_types:
+            if pt["type"] not in self.arrival_samplers.keys():
+                self.arrival_samplers[pt["type"]] = compile_arrival_rate(pt["arrival_rate"])
+
+
     def generate_patients(self):
+        return list(self.iter_patients())
+
+    def iter_patients(self, chunk_size=1000):
+        """
+        Lazily generates the patients in the same order as generate_patients_scalar, one arrival per patient type and time unit.
+        Arrival times and diagnoses are drawn with NumPy for chunk_size time units at once, so that also very long
+        (or infinite) runtimes can be streamed without materializing all patients.
+
+        :param chunk_size (int): number of time units drawn at once
+        :return: generator of tuples (arrival_time, patient_diagnose)
+        """
+        for time_unit, patients in self.iter_time_units(chunk_size):
+            yield from patients
+
+    def iter_time_units(self, chunk_size=1000):
+        """
+        Like iter_patients, but grouped by time unit. All patients of time unit t arrive at t or later, so a consumer
+        only has to draw the time units up to the time of its next event.
+
+        :return: generator of tuples (time_unit, [(arrival_time, patient_diagnose)])
+        """
+        patient_types = list(self.arrival_samplers.keys())
+        start = 0
+        while start < self.runtime:
+            size = chunk_size if self.runtime - start >= chunk_size else math.ceil(self.runtime - start)
+            time_units = np.arange(start, start + size, dtype=float)
+            arrival_times = np.empty((size, len(patient_types)))
+            diagnoses = np.empty((size, len(patient_types)), dtype=object)
+            for j, patient_type in enumerate(patient_types):
+                arrival_times[:, j] = time_units + self.arrival_samplers[patient_type](self.rng, size)
+                diagnoses[:, j] = self.distribution_table.sample_diagnoses(patient_type, size, rng=self.rng)
+            for i, time_unit in enumerate(time_units.tolist()):
+                yield time_unit, list(zip(arrival_times[i].tolist(), diagnoses[i].tolist()))
+            start += size
+
+    def generate_patients_scalar(self):
         # patient_arrival_rate_dict = {pt["type"]: pt["arrival_rate"] for pt in self.patient_types}
         patient_arrival_rate_dict = {}
         for pt in self.patient_types:
@@ -22,4 +93,4 @@ class Patient_Generator():
                 arrival_time_point = i + arrival_rate_func()
                 patient_diagnose = get_patient_diagnose(patient_type)
                 patients.append((arrival_time_point, patient_diagnose))  # Store the arrival time and patient type
-        return patients
\ No newline at end of file
+        return patients
@@ -0,0 +1,148 @@
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds, the Prometheus client defaults
+
+def format_labels(label_names, label_values, extra=""):
+    pairs = [name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Metric:
+    """
+    A metric family in the Prometheus text format with one value per combination of label values.
+    Values are updated under a lock, as the bottle handlers and the simulation thread update them concurrently.
+    """
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {} # label values -> value
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+class CounterMetric(Metric):
+    metric_type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class GaugeMetric(Metric):
+    """
+    A gauge that is either set and incremented by the caller, or read from function at scrape time, which must be cheap.
+    """
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), function=None):
+        super().__init__(name, documentation, label_names)
+        self.function = function
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self):
+        if self.function is not None:
+            self.set(self.function())
+        return super().render()
+
+class HistogramMetric(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            if label_values not in self.values:
+                self.values[label_values] = ([0] * len(self.buckets), [0.0])
+            bucket_counts, total = self.values[label_values]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1 # counts are per bucket, they are accumulated when rendering
+                    break
+            total[0] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for label_values, (bucket_counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, bucket_counts):
+                    cumulative += count
+                    bucket_label = 'le="' + format_value(bound) + '"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_names, label_values, bucket_label)} {cumulative}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {format_value(total[0])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class ServerMetrics:
+    """
+    The metrics of the /metrics endpoint. All values are maintained incrementally when requests are handled, events are
+    processed or resources are taken and released, so that a scrape only renders them.
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, state):
+        self.request_duration = HistogramMetric("simulator_request_duration_seconds", "Wall time of handled HTTP requests.", ["route", "method", "status"])
+        self.cpee_call_duration = HistogramMetric("simulator_cpee_call_duration_seconds", "Wall time of outbound calls to the CPEE and the planner.", ["call"])
+        self.events = CounterMetric("simulator_events_total", "Handled simulation events.", ["event_type"])
+        self.event_queue_depth = GaugeMetric("simulator_event_queue_depth", "Events waiting in the event queue.", function=state.events.qsize)
+        self.callbacks_awaiting = GaugeMetric("simulator_callbacks_awaiting", "CPEE callbacks that are still expected.", function=lambda: state.callbacks_awaiting)
+        self.patients_in_system = GaugeMetric("simulator_patients_in_system", "Admitted patients that are not yet released or replanned.", function=lambda: state.patients_in_system)
+        self.resources_busy = GaugeMetric("simulator_resources_busy", "Resources that are assigned to a patient.", ["resource_type"])
+        self.resources_total = GaugeMetric("simulator_resources_total", "Resources per resource type.", ["resource_type"])
+        self.queue_length = GaugeMetric("simulator_queue_length", "Patients waiting for a resource.", ["resource_type"])
+        self.metrics = [self.request_duration, self.cpee_call_duration, self.events, self.event_queue_depth, self.callbacks_awaiting,
+                        self.patients_in_system, self.resources_busy, self.resources_total, self.queue_length]
+
+    def reset_resources(self, capacities):
+        """
+        :param capacities: dict: resource_type -> number of resources
+        """
+        for resource_type, capacity in capacities.items():
+            self.resources_total.set(capacity, resource_type)
+            self.resources_busy.set(0, resource_type)
+            self.queue_length.set(0, resource_type)
+
+    def timed_call(self, call, function, *args, **kwargs):
+        """
+        Calls function and records its wall time as outbound call.
+
+        :return: the result of the function
+        """
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.cpee_call_duration.observe(time.perf_counter() - start, call)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,111 @@
+import bottle
+import io
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+from route_handler import admit_patient, request_resource, release_patient, replan_patient, send_system_state
+
+ROUTES = { # route: (method, handler)
+    '/admit-patient': ('POST', admit_patient),
+    '/request-resource': ('POST', request_resource),
+    '/release-patient': ('POST', release_patient),
+    '/replan-patient': ('POST', replan_patient),
+    '/get-system-state': ('GET', send_system_state),
+}
+RECORDED_HEADERS = ['CPEE-CALLBACK']
+
+class TraceRecorder:
+    """
+    Records every inbound request of the simulator as one line of JSON:
+    {"t": wall clock seconds since start of recording, "vt": virtual time of the simulator, "route", "forms", "headers"}
+    """
+    def __init__(self, trace_file):
+        self.trace_file = open(trace_file, 'a')
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def record(self, request, virtual_time):
+        if request.path not in ROUTES:
+            return
+        entry = {"t": round(time.perf_counter() - self.start, 6),
+                 "vt": virtual_time,
+                 "route": request.path,
+                 "forms": dict(request.forms.decode()),
+                 "headers": {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers}}
+        with self.lock:
+            self.trace_file.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            self.trace_file.flush()
+
+    def close(self):
+        self.trace_file.close()
+
+def read_trace(trace_file):
+    with open(trace_file, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def issue_request(state, entry):
+    """
+    Issues a recorded request directly to its route handler, without going through the http server.
+    """
+    method, handler = ROUTES[entry["route"]]
+    body = urlencode(entry["forms"]).encode()
+    environ = {'REQUEST_METHOD': method,
+               'PATH_INFO': entry["route"],
+               'QUERY_STRING': '',
+               'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+               'CONTENT_LENGTH': str(len(body)),
+               'wsgi.input': io.BytesIO(body)}
+    for name, value in entry["headers"].items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    bottle.request.bind(environ)
+    return handler(state)
+
+def replay_trace(trace_file, state, speed=None):
+    """
+    Replays a recorded trace against a state whose simulation is running.
+
+    :param trace_file (str): path to the trace
+    :param state (State): fresh simulator state, should be offline so that no cpee instances are called
+    :param speed (float): None for full speed, otherwise the factor by which the recorded wall clock gaps are shortened (2.0 = twice as fast)
+    :return: int: number of replayed requests
+    """
+    start = time.perf_counter()
+    replayed = 0
+    for entry in read_trace(trace_file):
+        if speed is not None:
+            delay = entry["t"] / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        while state.callbacks_awaiting > 0:
+            time.sleep(0.0001)
+        issue_request(state, entry)
+        replayed += 1
+    return replayed
+
+def wait_until_idle(state, poll_interval=0.01):
+    while state.events.qsize() > 0 or state.callbacks_awaiting > 0:
+        time.sleep(poll_interval)
+    time.sleep(poll_interval) # let the simulation thread finish the last event
+
+if __name__ == '__main__':
+    # usage: python3 request_trace.py trace_file [speed]
+    from state import State
+    trace_file = sys.argv[1]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    state = State(test=False, offline=True)
+    if os.environ.get("SIMULATOR_PROFILE"): # per event type timing of the replay
+        state.enable_profiling()
+    simulation_thread = threading.Thread(target=state.run, daemon=True)
+    simulation_thread.start()
+    start = time.perf_counter()
+    replayed = replay_trace(trace_file, state, speed=speed)
+    wait_until_idle(state)
+    duration = time.perf_counter() - start
+    print(f"replayed {replayed} requests in {duration:.3f}s ({replayed / duration:.1f} requests/s), final virtual time {state.time}")
+    if state.profiler is not None:
+        print(state.profiler.summary())
@@ -3,12 +3,13 @@ from state import EventType, Event
 from helpers import get_task_duration, get_db, generate_response_text, get_queue_length
 from logging_util import log_event
 import bottle
+import io
 import json
-import requests
 import sys
 sys.path.append('../')
 from datetime import timedelta, datetime
-from db.db_util import DATABASE_PATIENTS, DATABASE_RESOURCES, get_db
+from db.db_util import DATABASE_PATIENTS, DATABASE_RESOURCES, get_db, insert_patient
+from common.wire_format import PACKED, ENCODING_HEADER, ACCEPT_HEADER, encode_form_field
 
 def convert_to_iso8601(simulation_time):
     """
@@ -32,10 +33,7 @@ def admit_patient(state):
     cursor = conn_p.cursor()
     
     if (patient_id == None) or (patient_id == ""): # patient_id is not given
-        cursor.execute(
-            "INSERT INTO Patient (patient_type, diagnosis, admission_time) VALUES (?, ?, ?)",
-            (patient_type, patient_type , admission_time)
-        )
+        patient_id = insert_patient(cursor, patient_type, admission_time)
     else: # patient_id is given
         patient_id = int(patient_id)
         cursor.execute("SELECT * FROM Patient WHERE id = ?", (patient_id,))
@@ -44,11 +42,7 @@ def admit_patient(state):
             assert patient_id == row['id']
             html_status = 200
         else: # invalid patient_id
-            cursor.execute(
-                "INSERT INTO Patient (patient_type, diagnosis, admission_time) VALUES (?, ?, ?)",
-                (patient_type, patient_type , admission_time)
-            )
-    patient_id = cursor.lastrowid
+            patient_id = insert_patient(cursor, patient_type, admission_time)
     conn_p.commit()
     conn_p.close()
     
@@ -102,7 +96,7 @@ def request_resource(state): # for resources intake, er_treatment, surgery, nurs
         else:
             raise Exception("Invalid patient type")
         
-    task_duration = get_task_duration(patient_types_config=state.get_patient_types_config(), patient_type=patient_type, resource_type=resource_type)
+    task_duration = get_task_duration(distribution_table=state.distribution_table, patient_type=patient_type, resource_type=resource_type)
     end_time = request_time + task_duration
     
     cursor.execute(f"SELECT resource_name FROM Resources WHERE resource_type = ? and available_at <= ? LIMIT 1", (resource_type, request_time,))
@@ -117,6 +111,7 @@ def request_resource(state): # for resources intake, er_treatment, surgery, nurs
         )
         conn_r.commit()
         conn_r.close()
+        state.server_metrics.queue_length.inc(resource_type)
         state.events.put((request_time, Event(event_type=EventType.ENTER_QUEUE, 
                                               event_start=request_time, 
                                               event_resource=resource_type, 
@@ -129,8 +124,9 @@ def request_resource(state): # for resources intake, er_treatment, surgery, nurs
         cursor.execute(f"UPDATE Resources SET available_at = ? WHERE resource_name = ?", (end_time, resource_name,))
         conn_r.commit()
         conn_r.close()
-        state.patient_states[patient_id] = {"task": resource_type, "start": request_time, "info": {"diagnosis": patient_type}, "wait": False}
-        response_json = generate_response_text(end_time, patient_type, resource_type)
+        state.server_metrics.resources_busy.inc(resource_type)
+        state.system_state.set(patient_id, resource_type, request_time, patient_type, wait=False)
+        response_json = generate_response_text(state.distribution_table, end_time, patient_type, resource_type)
         log_event(virtual_time=request_time, 
                       patient_id=patient_id, 
                       patient_type=patient_type, 
@@ -161,7 +157,9 @@ def release_patient(state):
     # now = now + 0.00001
     conn_r = get_db(DATABASE_RESOURCES)
     cursor = conn_r.cursor()
-    cursor.execute("DELETE FROM Queue WHERE patient_id = ?", (patient_id,))
+    cursor.execute("DELETE FROM Queue WHERE patient_id = ? RETURNING resource_type", (patient_id,))
+    for row in cursor.fetchall(): # normally empty, unless the patient is released while waiting
+        state.server_metrics.queue_length.dec(row['resource_type'])
     conn_r.commit()
     conn_r.close()
     
@@ -187,19 +185,34 @@ def replan_patient(state):
     print("all forms: ", req.forms)
     print("\nSYTEM STATE TYPE: ", type(req.forms.system_state))
     print("system state content: ", req.forms.system_state)
-    print("system state loaded with json loads: ", json.loads(req.forms.system_state))
     system_state = json.loads(req.forms.system_state)
-    for item in system_state: # [{"cid", "task", "start", "info", "wait"}]
-        item["start"] = convert_to_iso8601(item["start"])
-        # resource_item = {"cid": key, "task": value["task"], "start": start_time_iso, "info": value["info"], "wait": value["wait"]}
+    print("system state loaded with json loads: ", system_state)
+    headers = {}
+    resources = None
+    if state.planner_resources_encoding == PACKED: # start times stay in hours, no ISO 8601 conversion on both sides
+        try:
+            resources = encode_form_field(system_state)
+            headers[ENCODING_HEADER] = PACKED
+        except ValueError: # e.g. a case id that is not an integer
+            resources = None
+    if resources is None:
+        for item in system_state: # [{"cid", "task", "start", "info", "wait"}]
+            item["start"] = convert_to_iso8601(item["start"])
+            # resource_item = {"cid": key, "task": value["task"], "start": start_time_iso, "info": value["info"], "wait": value["wait"]}
+        resources = json.dumps(system_state)
         
     url = "https://lehre.bpm.in.tum.de/ports/12791/replan_patient"
     body = {"cid": str(patient_id),
             "time": replan_time_iso,
             "info": json.dumps({"diagnosis": patient_type}),
-            "resources": json.dumps(system_state),
+            "resources": resources,
             }
-    response = requests.post(url, data=body)
+    if state.offline: # no planner is contacted, e.g. when replaying a trace
+        return
+    import requests # loaded on first use, not at startup
+    response = state.server_metrics.timed_call("replan", requests.post, url, data=body, headers=headers)
+    if PACKED in response.headers.get(ACCEPT_HEADER, ""): # the planner announces that it accepts the packed encoding
+        state.planner_resources_encoding = PACKED
     if response.status_code == 200:
         replan_time = response.json().get(str(patient_id))
     else:
@@ -233,10 +246,37 @@ def replan_patient(state):
     #         )
     
 def send_system_state(state):
-    system_state = state.get_system_state()
-    response_content = json.dumps({"state": system_state})
+    since = bottle.request.query.since
+    response_content = None
+    if since != "": # only the changes since the version the client already has, if they are still kept
+        try:
+            since = int(since)
+        except ValueError:
+            return bottle.HTTPResponse("since must be a version number", status=400)
+        diff = state.system_state.diff(since)
+        if diff is not None:
+            response_content = json.dumps(diff)
+    if response_content is None:
+        response_content = state.system_state.to_json()
     return bottle.HTTPResponse(
             response_content,
             status=200,
             headers = { 'content-type': 'application/json'}
-            )
\ No newline at end of file
+            )
+def send_prometheus_metrics(state):
+    return bottle.HTTPResponse(
+            state.server_metrics.render(),
+            status=200,
+            headers = { 'content-type': state.server_metrics.CONTENT_TYPE}
+            )
+
+def send_metrics_series(state):
+    if state.metrics is None:
+        return bottle.HTTPResponse("metrics are not sampled", status=404)
+    csv_file = io.StringIO()
+    state.metrics.to_csv(csv_file)
+    return bottle.HTTPResponse(
+            csv_file.getvalue(),
+            status=200,
+            headers = { 'content-type': 'text/csv'}
+            )
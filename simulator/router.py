@@ -0,0 +1,297 @@
+import atexit
+import bottle
+import json
+import os
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
+sys.path.append('../')
+from db.db_util import DATABASE_RESOURCES, DATABASE_PATIENTS
+
+class Router:
+    """
+    Sharded mode: every hospital of a regional network runs its own simulator (main.py) with its own State, resource
+    and patient db in a separate process, and the router dispatches the requests of the simulator endpoints to them.
+    Patient ids are global: each hospital issues the ids that are its index modulo the number of hospitals (see
+    db_util.insert_patient), so every request about a known patient goes to its hospital, also if it comes from a process
+    instance that the hospital started itself. New patients are distributed round robin, unless a hospital is given.
+    """
+    def __init__(self, hospitals, base_port=12800):
+        self.hospitals = hospitals
+        self.base_port = base_port
+        self.processes = []
+        self.directory = None # temporary directory with the dbs of the hospitals
+        self.next_hospital = 0 # hospital of the next new patient
+        self.lock = threading.Lock()
+        self.sessions = threading.local() # one requests session per router thread, it keeps the connections to the hospitals open
+
+    def url(self, hospital, path):
+        return f"http://localhost:{self.base_port + hospital}{path}"
+
+    def hospital_of(self, patient_id):
+        return int(patient_id) % self.hospitals
+
+    def choose_hospital(self, hospital=None):
+        if hospital is not None and hospital != "":
+            hospital = int(hospital)
+            if not 0 <= hospital < self.hospitals:
+                raise ValueError("Unknown hospital", hospital)
+            return hospital
+        with self.lock:
+            hospital = self.next_hospital
+            self.next_hospital = (self.next_hospital + 1) % self.hospitals
+        return hospital
+
+    def start_hospitals(self, arguments=(), timeout=60.0):
+        """
+        Starts one simulator process per hospital, each with copies of the resource and patient db, and waits until all answer.
+
+        :param arguments (list): command line arguments of main.py, e.g. ["1000", "True"]
+        """
+        self.directory = tempfile.mkdtemp(prefix="hospitals_")
+        atexit.register(self.stop_hospitals)
+        for hospital in range(self.hospitals):
+            resources_db = os.path.join(self.directory, f"resources_{hospital}.db")
+            patients_db = os.path.join(self.directory, f"patient_{hospital}.db")
+            shutil.copy(DATABASE_RESOURCES, resources_db)
+            shutil.copy(DATABASE_PATIENTS, patients_db)
+            environment = dict(os.environ,
+                               SIMULATOR_PORT=str(self.base_port + hospital),
+                               SIMULATOR_HOSPITAL=str(hospital),
+                               SIMULATOR_HOSPITALS=str(self.hospitals),
+                               SIMULATOR_RESOURCES_DB=resources_db,
+                               SIMULATOR_PATIENTS_DB=patients_db)
+            self.processes.append(subprocess.Popen([sys.executable, "main.py", *arguments], env=environment, stdout=subprocess.DEVNULL))
+        start = time.perf_counter()
+        for hospital in range(self.hospitals):
+            while True:
+                try:
+                    self.session().get(self.url(hospital, "/get-system-state"), timeout=1)
+                    break
+                except OSError: # not yet listening, requests' ConnectionError is an OSError
+                    if self.processes[hospital].poll() is not None or time.perf_counter() - start > timeout:
+                        raise Exception(f"Hospital {hospital} did not start")
+                    time.sleep(0.01)
+
+    def stop_hospitals(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+        self.processes = []
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def session(self):
+        if not hasattr(self.sessions, "session"):
+            import requests
+            self.sessions.session = requests.Session()
+        return self.sessions.session
+
+    def forward(self, hospital, path, forms=None, headers=None, method="POST"):
+        """
+        Forwards a request to a hospital.
+
+        :return: requests.Response
+        """
+        if method == "GET":
+            return self.session().get(self.url(hospital, path), headers=headers)
+        return self.session().post(self.url(hospital, path), data=forms, headers=headers)
+
+    def gather(self, path, queries=None):
+        """
+        GETs path from all hospitals in parallel.
+
+        :param queries (list, optional): query string per hospital, appended to path
+        :return: list of requests.Response, one per hospital
+        """
+        responses = [None] * self.hospitals
+        def get(hospital):
+            responses[hospital] = self.forward(hospital, path if queries is None else f"{path}?{queries[hospital]}", method="GET")
+        threads = [threading.Thread(target=get, args=(hospital,)) for hospital in range(self.hospitals)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def get_system_state(self, since=None):
+        """
+        The version of the merged state is the versions of the hospitals joined by ".", e.g. "12.7.30" for three hospitals.
+
+        :param since (str, optional): merged version the client already has, to get only the changes since then
+        :return: dict: {"state", "version"} of all hospitals, or {"version", "since", "updated", "removed"} if since is given
+                 and all hospitals still keep their changes since then
+        :raise ValueError: if since is not a merged version of these hospitals
+        """
+        if since is not None:
+            versions = [int(version) for version in since.split(".")]
+            if len(versions) != self.hospitals:
+                raise ValueError("Expected one version per hospital", since)
+            contents = [response.json() for response in self.gather("/get-system-state", [f"since={version}" for version in versions])]
+            if all("updated" in content for content in contents):
+                return {"version": ".".join(str(content["version"]) for content in contents),
+                        "since": since,
+                        "updated": [item for content in contents for item in content["updated"]],
+                        "removed": [patient_id for content in contents for patient_id in content["removed"]]}
+            # a hospital no longer keeps the changes since its version, so the client gets the full state
+        contents = [response.json() for response in self.gather("/get-system-state")]
+        return {"state": [item for content in contents for item in content["state"]],
+                "version": ".".join(str(content["version"]) for content in contents)}
+
+    def get_metrics(self):
+        """
+        :return: str: the Prometheus metrics of all hospitals, with a hospital label added to each sample
+        """
+        families = {} # name -> (HELP and TYPE lines, samples of all hospitals), samples of a family have to be consecutive
+        for hospital, response in enumerate(self.gather("/metrics")):
+            family = None
+            for line in response.text.splitlines():
+                if line.startswith("#"): # the HELP and TYPE lines precede the samples of their family
+                    family = line.split(" ")[2]
+                    if family not in families:
+                        families[family] = ([], [])
+                    if hospital == 0:
+                        families[family][0].append(line)
+                    continue
+                name, value = line.rsplit(" ", 1)
+                if name.endswith("}"):
+                    name = name[:-1] + f',hospital="{hospital}"}}'
+                else:
+                    name = name + f'{{hospital="{hospital}"}}'
+                families[family][1].append(f"{name} {value}")
+        lines = []
+        for comments, samples in families.values():
+            lines += comments + samples
+        return "\n".join(lines) + "\n"
+
+    def get_metrics_series(self):
+        """
+        :return: str: the metric time series of all hospitals as one CSV with a leading hospital column
+        """
+        lines = []
+        for hospital, response in enumerate(self.gather("/metrics-series")):
+            if response.status_code != 200:
+                continue
+            rows = response.text.splitlines()
+            if len(lines) == 0:
+                lines.append("hospital," + rows[0])
+            lines += [f"{hospital},{row}" for row in rows[1:]]
+        return "\n".join(lines) + "\n"
+
+class ThreadingWSGIRefServer(bottle.ServerAdapter):
+    """
+    The wsgiref server of bottle, but with a thread per request, so that the router can wait for several hospitals at once.
+    """
+    def run(self, app):
+        class Server(socketserver.ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+            address_family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(*args, **kwargs):
+                pass
+        make_server(self.host, self.port, app, Server, QuietHandler).serve_forever()
+
+router = None
+
+def to_bottle_response(response, content=None):
+    return bottle.HTTPResponse(
+            response.content if content is None else content,
+            status=response.status_code,
+            headers={key: value for key, value in response.headers.items() if key.lower() in ["content-type", "cpee-callback"]}
+            )
+
+def forward_patient_request(path, hospital=None):
+    """
+    Forwards the current request to the hospital of its patient_id (or a chosen hospital for new patients).
+
+    :raise ValueError: if the patient_id or the hospital is not a number
+    """
+    forms = dict(bottle.request.forms)
+    if forms.get("patient_id"):
+        hospital = router.hospital_of(forms["patient_id"])
+    else:
+        hospital = router.choose_hospital(hospital)
+    headers = {"CPEE-CALLBACK": bottle.request.headers["CPEE-CALLBACK"]} if "CPEE-CALLBACK" in bottle.request.headers else None
+    return hospital, forms, router.forward(hospital, path, forms, headers)
+
+def invalid_patient_id():
+    return bottle.HTTPResponse("patient_id must be a number and hospital the index of a hospital", status=400)
+
+def with_hospital(hospital, response):
+    if response.status_code >= 300 or not response.content:
+        return to_bottle_response(response)
+    content = response.json()
+    content["hospital"] = hospital
+    return to_bottle_response(response, json.dumps(content))
+
+@bottle.route('/admit-patient', method='POST')
+def handle_admit_patient():
+    try:
+        hospital, forms, response = forward_patient_request('/admit-patient', bottle.request.forms.get("hospital"))
+    except ValueError:
+        return invalid_patient_id()
+    return with_hospital(hospital, response)
+
+@bottle.route('/request-resource', method='POST')
+def handle_request_resource():
+    try:
+        hospital, forms, response = forward_patient_request('/request-resource')
+    except ValueError:
+        return invalid_patient_id()
+    return to_bottle_response(response)
+
+@bottle.route('/release-patient', method='POST')
+def handle_release_patient():
+    try:
+        hospital, forms, response = forward_patient_request('/release-patient')
+    except ValueError:
+        return invalid_patient_id()
+    return with_hospital(hospital, response)
+
+@bottle.route('/replan-patient', method='POST')
+def handle_replan_patient():
+    forms = dict(bottle.request.forms)
+    try:
+        hospital = router.hospital_of(forms["patient_id"])
+        if forms.get("system_state"): # the planner of a hospital only sees the patients of that hospital
+            system_state = json.loads(forms["system_state"])
+            forms["system_state"] = json.dumps([item for item in system_state if router.hospital_of(item["cid"]) == hospital])
+    except (KeyError, TypeError, ValueError): # no or no numeric patient_id, or a system_state that is no list of entries with numeric cids
+        return bottle.HTTPResponse("replan-patient needs a numeric patient_id and a system_state of entries with numeric cids", status=400)
+    return to_bottle_response(router.forward(hospital, '/replan-patient', forms))
+
+@bottle.route('/get-system-state', method='GET')
+def handle_get_system_state():
+    since = bottle.request.query.since
+    try:
+        content = router.get_system_state(since if since != "" else None)
+    except ValueError:
+        return bottle.HTTPResponse("since must be a version of /get-system-state, i.e. one number per hospital joined by '.'", status=400)
+    return bottle.HTTPResponse(json.dumps(content), status=200, headers={'content-type': 'application/json'})
+
+@bottle.route('/metrics', method='GET')
+def handle_get_metrics():
+    return bottle.HTTPResponse(router.get_metrics(), status=200, headers={'content-type': "text/plain; version=0.0.4; charset=utf-8"})
+
+@bottle.route('/metrics-series', method='GET')
+def handle_get_metrics_series():
+    return bottle.HTTPResponse(router.get_metrics_series(), status=200, headers={'content-type': 'text/csv'})
+
+if __name__ == '__main__':
+    # usage: python3 router.py hospitals [runtime TestMode], serves the endpoints of main.py for all hospitals on port 12790
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # stop the hospitals also when the router is terminated
+    router = Router(int(sys.argv[1]))
+    router.start_hospitals(sys.argv[2:])
+    try:
+        bottle.run(host='::0', port=12790, server=ThreadingWSGIRefServer)
+    finally:
+        router.stop_hospitals()
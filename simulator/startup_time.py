@@ -0,0 +1,33 @@
+import subprocess
+import sys
+import time
+import urllib.request
+
+def measure_time_to_first_request(arguments=(), url="http://localhost:12790/get-system-state", timeout=60.0, poll_interval=0.005):
+    """
+    Starts the simulator server (main.py) and measures the wall time until it answers its first request.
+
+    :param arguments (list): command line arguments of main.py, e.g. ["1000", "True"]
+    :return: float: seconds from starting the process until the first successful response
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py", *arguments], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except OSError: # not yet listening
+                if process.poll() is not None:
+                    raise Exception("Simulator exited before answering a request")
+                time.sleep(poll_interval)
+        raise Exception("Simulator did not answer within the timeout")
+    finally:
+        process.terminate()
+        process.wait()
+
+if __name__ == '__main__':
+    # usage: python3 startup_time.py [runtime TestMode] (the arguments of main.py)
+    durations = [measure_time_to_first_request(sys.argv[1:]) for _ in range(5)]
+    print(f"time to first request: {min(durations) * 1000:.0f} ms (best of 5), {sum(durations) / len(durations) * 1000:.0f} ms on average")
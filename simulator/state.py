@@ -1,16 +1,21 @@
+import json
 import queue
-import requests
 import time
 import sys
+from collections import Counter
 sys.path.append('../')
 from db.db_util import get_db, initialize_resources, DATABASE_RESOURCES
 from event import Event, EventType
-from helpers import load_patient_types, create_cpee_instance, get_next_available_resource, generate_response_text, get_task_duration, get_queue_length, pop_queue
+from helpers import load_patient_types, create_cpee_instance, get_next_available_resource, generate_response_text, get_task_duration, get_queue_length, pop_queue, get_resource_usage
 from logging_util import log_event
-from patient_generator import Patient_Generator
+from distributions import DistributionTable
+from common.profiling import EventProfiler, timed
+from prometheus import ServerMetrics
+from system_state import SystemStateSnapshot
+from common.wire_format import JSON
 
 class State:
-    def __init__(self, running_time=10, test=False, patient_types_path='../patient_types.json', resources_config='../db/resources/resource_config.json'):
+    def __init__(self, running_time=10, test=False, patient_types_path='../patient_types.json', resources_config='../db/resources/resource_config.json', offline=False):
         self.RESOURCES_CONFIG = resources_config
         self.CALLBACK_HEADER = {
                 'content-type': 'application/json',
@@ -20,27 +25,79 @@ class State:
         self.time = 0.0
         self.callbacks_awaiting = 0 # number of callbacks that are still expected
         self.patients_in_system = 0
-        self.patient_states = {}
+        self.system_state = SystemStateSnapshot() # task per patient waiting for or using a resource
+        self.planner_resources_encoding = JSON # encoding of the resources sent to the planner, PACKED once the planner accepts it
         self.events = queue.PriorityQueue()
+        self.server_metrics = ServerMetrics(self) # counters and histograms of the /metrics endpoint
         self.init_resources()
         self.test = test
+        self.offline = offline # if True, no cpee instances are created and no callbacks are sent (e.g. when replaying a trace)
+        self.patient_types_config = load_patient_types(patient_types_path)
+        self.distribution_table = DistributionTable(self.patient_types_config) # task durations and complication probabilities per diagnosis
+        self.event_counts = Counter() # number of handled events per event type
+        self.metrics = None # MetricsBuffer with the samples of sample_metrics, None if metrics are not sampled
+        self.metrics_interval = None # virtual time between two metric samples
+        self.next_metrics_sample = None # virtual time of the next metric sample
+        self.profiler = None # EventProfiler if profiling is enabled
+        self.initial_time_units = None # generator of the initial patients per time unit in test mode, drawn on demand by feed_initial_events
+        self.next_initial_time_unit = None # (time_unit, patients) that is not yet in the event queue, None if all are
         if test:
+            from patient_generator import Patient_Generator # imports numpy, only needed in test mode
             patient_generator = Patient_Generator(runtime=running_time)
-            patient_list = patient_generator.generate_patients()
-            self.patient_types_config = load_patient_types(patient_types_path)
-            self.populate_initial_events(patient_list)
+            self.initial_time_units = patient_generator.iter_time_units()
+            self.next_initial_time_unit = next(self.initial_time_units, None)
         
     def get_system_state(self):
-        states_list = []
-        for patient_id, patient_state in self.patient_states.items():
-            states_list.append({"cid": patient_id, "task": patient_state["task"], "start": patient_state["start"], "info": patient_state["info"], "wait": patient_state["wait"]})
-        return states_list
+        return self.system_state.to_list()
     
     def get_patient_types_config(self):
         return self.patient_types_config
     
+    def start_metrics(self, interval=1.0, capacity=24*365):
+        """
+        Starts sampling metrics every interval units of virtual time into a ring buffer of the given capacity, which is available as self.metrics.
+        A sample at time t shows the state after all events before t. The columns are:
+        time, patients_in_system, queue_<resource type> and utilization_<resource type> for each resource type, and the number of admissions, replans and releases so far.
+        """
+        from common.metrics import MetricsBuffer # imports numpy, so it is only loaded once metrics are sampled
+        with open(self.RESOURCES_CONFIG, 'r') as file:
+            self.resource_types = [resource['resource_type'] for resource in json.load(file)['resources']]
+        columns = ["time", "patients_in_system"]
+        columns += ["queue_" + resource_type for resource_type in self.resource_types]
+        columns += ["utilization_" + resource_type for resource_type in self.resource_types]
+        columns += ["admissions", "replans", "releases"]
+        self.metrics = MetricsBuffer(columns, capacity)
+        self.metrics_interval = interval
+        self.next_metrics_sample = self.time
+
+    def sample_metrics_before(self, moment):
+        """
+        Takes the metric samples that are due before the given virtual time.
+        """
+        if self.metrics is None:
+            return
+        while self.next_metrics_sample < moment:
+            usage = get_resource_usage(self.next_metrics_sample)
+            queue_lengths = [usage.get(resource_type, (0, 0, 0))[0] for resource_type in self.resource_types]
+            utilization = []
+            for resource_type in self.resource_types:
+                queue_length, busy, total = usage.get(resource_type, (0, 0, 0))
+                utilization.append(busy / total if total > 0 else None)
+            counts = [self.event_counts[EventType.ADMISSION], self.event_counts[EventType.REPLAN_PATIENT], self.event_counts[EventType.RELEASE_PATIENT]]
+            self.metrics.append([self.next_metrics_sample, self.patients_in_system] + queue_lengths + utilization + counts)
+            self.next_metrics_sample += self.metrics_interval
+
+    def enable_profiling(self, capture=None):
+        """
+        Records the wall time and number of calls per event type in run, available as self.profiler.summary().
+        In test mode the summary is printed when the simulation is finished.
+        A capture ("cprofile" or "pyinstrument") profiles the simulation thread from the start of run and is only complete in test mode.
+        """
+        self.profiler = EventProfiler(capture)
+
     def init_resources(self):
         initialize_resources(config_file=self.RESOURCES_CONFIG, db_file=DATABASE_RESOURCES)
+        self.server_metrics.reset_resources({resource_type: total for resource_type, (queue_length, busy, total) in get_resource_usage(self.time).items()})
             
     def populate_initial_events(self, patient_list): # test method
         for p in patient_list: # create number of patients into queue
@@ -51,32 +108,58 @@ class State:
                       status="success",
                       message="Initial Creation event representing 1 patient put into the queue")
             self.events.put((arrival_time, Event(event_type=EventType.CREATION, event_start=arrival_time, patient_id=None, patient_type=patient_type)))
+
+    def feed_initial_events(self): # test method
+        """
+        Puts the initial patients into the event queue, time unit by time unit, until the earliest queued event is before
+        the next time unit. As no patient of a later time unit can arrive before its time unit, the next event is then
+        the same as if all initial patients had been queued at the start, but the server starts without generating them first.
+        """
+        while self.next_initial_time_unit is not None:
+            with self.events.mutex:
+                earliest_event_time = self.events.queue[0][0] if len(self.events.queue) > 0 else None
+            if earliest_event_time is not None and earliest_event_time < self.next_initial_time_unit[0]:
+                return
+            self.populate_initial_events(self.next_initial_time_unit[1])
+            self.next_initial_time_unit = next(self.initial_time_units, None)
     
     def run(self):
+        if self.profiler is not None:
+            self.profiler.start_capture() # in the simulation thread, as cProfile only profiles the thread it is enabled in
         # while self.time <= self.running_time:
         if self.test:
-            while (self.events.qsize() > 0) or (self.patients_in_system > 0): # event in queue or cpee instances still running but currently no event in queue (e.g. between end of nursing and release patient)
+            while (self.events.qsize() > 0) or (self.patients_in_system > 0) or (self.next_initial_time_unit is not None): # event in queue or cpee instances still running but currently no event in queue (e.g. between end of nursing and release patient)
                 # wait until self.callbacks_awaiting == 0 and only then continue with next line:
                 while self.callbacks_awaiting > 0:
                     time.sleep(0.0001)
-                (self.time, event) = self.events.get() # wait for all patients that arrive at the exact same time, only continue when the next admission is greater than the next event
+                self.feed_initial_events()
+                (event_time, event) = self.events.get() # wait for all patients that arrive at the exact same time, only continue when the next admission is greater than the next event
+                self.sample_metrics_before(event_time)
+                self.time = event_time
                 # check that  all the patients that arrive are matching with the expected patients
-                self.handle_event(event)
+                timed(self.profiler, event.event_type.name, self.handle_event, event)
             print("\n-------------------\nSIMULATION FINISHED\n-------------------\n")
+            if self.profiler is not None:
+                self.profiler.stop_capture()
+                print(self.profiler.summary())
         else:
             while True:
                 while self.callbacks_awaiting > 0:
                     time.sleep(0.001)
-                (self.time, event) = self.events.get()
-                self.handle_event(event)
+                (event_time, event) = self.events.get()
+                self.sample_metrics_before(event_time)
+                self.time = event_time
+                timed(self.profiler, event.event_type.name, self.handle_event, event)
         return
         
     def handle_event(self, event):
-        print("\nsystem state: ", self.get_system_state())
+        self.event_counts[event.event_type] += 1
+        self.server_metrics.events.inc(event.event_type.name)
         if event.event_type == EventType.CREATION: # triggered by replan endpoint or initial creation
             self.callbacks_awaiting += 1
             try:
-                process_id = create_cpee_instance(patient_type=event.patient_type, arrival_time=event.event_start, patient_id=event.patient_id)
+                if not self.offline:
+                    process_id = self.server_metrics.timed_call("create_instance", create_cpee_instance, patient_type=event.patient_type, arrival_time=event.event_start, patient_id=event.patient_id)
                 log_event(virtual_time=event.event_start, 
                         patient_id=event.patient_id, 
                         patient_type=event.patient_type, 
@@ -98,22 +181,23 @@ class State:
                       )
             
         elif event.event_type == EventType.ENTER_QUEUE:
-            self.patient_states[event.patient_id] = {"task": event.event_resource, "start": event.event_start, "info": {"diagnosis": event.patient_type}, "wait": True}
+            self.system_state.set(event.patient_id, event.event_resource, event.event_start, event.patient_type, wait=True)
         
         elif event.event_type == EventType.REQUEST_RESOURCE: # coming from queue - resource now available -> take resource
             patient_type = event.patient_type
             resource_type = event.event_resource
             request_time = event.event_start
             available_at, resource_name = get_next_available_resource(resource_type, request_time)
-            self.patient_states[event.patient_id] = {"task": resource_type, "start": event.event_start, "info": {"diagnosis": event.patient_type}, "wait": False}
-            task_duration = get_task_duration(patient_types_config=self.get_patient_types_config(), patient_type=patient_type, resource_type=resource_type)
+            self.system_state.set(event.patient_id, resource_type, event.event_start, event.patient_type, wait=False)
+            task_duration = get_task_duration(distribution_table=self.distribution_table, patient_type=patient_type, resource_type=resource_type)
             end_time = request_time + task_duration
-            response_json = generate_response_text(finish_time=end_time, patient_type=patient_type, resource_type=resource_type)
+            response_json = generate_response_text(distribution_table=self.distribution_table, finish_time=end_time, patient_type=patient_type, resource_type=resource_type)
             conn_r = get_db(DATABASE_RESOURCES)
             cursor = conn_r.cursor() 
             cursor.execute(f"UPDATE Resources SET available_at = ? WHERE resource_name = ?", (end_time, resource_name,))
             conn_r.commit()
             conn_r.close()
+            self.server_metrics.resources_busy.inc(resource_type)
             log_event(virtual_time=request_time, 
                       patient_id=event.patient_id, 
                       patient_type=event.patient_type, 
@@ -130,7 +214,8 @@ class State:
                                                     patient_id=event.patient_id,)))
             
         elif event.event_type == EventType.RELEASE_RESOURCE: # resource consumed -> send final callback to cpee
-            del self.patient_states[event.patient_id]
+            self.system_state.remove(event.patient_id)
+            self.server_metrics.resources_busy.dec(event.event_resource)
             log_event(virtual_time=event.event_end, 
                       patient_id=event.patient_id, 
                       patient_type=event.patient_type, 
@@ -140,6 +225,7 @@ class State:
                       )
             if get_queue_length(event.event_resource) > 0: # resource gets available -> take next patient from queue
                 id, priority, request_time, callback_url, patient_id, patient_type, resource_type = pop_queue(event.event_resource) # returns (priority, request_time, callback_url, patient_id, patient_type, resource_type)
+                self.server_metrics.queue_length.dec(resource_type)
                 new_request_time = event.event_end
                 self.events.put((new_request_time, Event(event_type=EventType.REQUEST_RESOURCE, 
                                                   event_start=new_request_time, 
@@ -147,7 +233,9 @@ class State:
                                                   event_callback_url=callback_url,
                                                   patient_id=patient_id, 
                                                   patient_type=patient_type)))
-            reponse = requests.put(event.event_callback_url, headers=self.CALLBACK_HEADER, json=event.event_callback_content)
+            if not self.offline:
+                import requests # loaded on first use, not at startup
+                reponse = self.server_metrics.timed_call("callback", requests.put, event.event_callback_url, headers=self.CALLBACK_HEADER, json=event.event_callback_content)
             
         elif event.event_type == EventType.RELEASE_PATIENT:
             log_event(virtual_time=event.event_start, 
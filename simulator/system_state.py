@@ -0,0 +1,87 @@
+import json
+import threading
+from collections import deque
+
+class SystemStateSnapshot:
+    """
+    The system state of /get-system-state, i.e. the task of each patient that waits for or uses a resource.
+    It is updated incrementally on every change and versioned, so that the list and its JSON form are only rebuilt
+    after a change and clients can ask for the changes since a version they already have.
+    """
+    def __init__(self, max_changes=10000):
+        self.entries = {} # patient_id -> {"cid", "task", "start", "info", "wait"}, entries are replaced, never modified
+        self.version = 0 # incremented on every change
+        self.changes = deque(maxlen=max_changes) # (version, patient_id, entry or None if removed), oldest first
+        self.lock = threading.Lock() # the bottle handlers and the simulation thread update the state concurrently
+        self.cached_list = None # (version, list of entries)
+        self.cached_json = None # (version, json string)
+
+    def set(self, patient_id, task, start, diagnosis, wait):
+        entry = {"cid": patient_id, "task": task, "start": start, "info": {"diagnosis": diagnosis}, "wait": wait}
+        with self.lock:
+            self.entries[patient_id] = entry
+            self.version += 1
+            self.changes.append((self.version, patient_id, entry))
+
+    def remove(self, patient_id):
+        with self.lock:
+            del self.entries[patient_id]
+            self.version += 1
+            self.changes.append((self.version, patient_id, None))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def to_list(self):
+        """
+        :return: list of the entries, rebuilt only if the state changed since the last call. It must not be modified.
+        """
+        with self.lock:
+            return self.current_list()
+
+    def current_list(self):
+        """
+        Like to_list, but the caller must hold the lock.
+        """
+        if self.cached_list is None or self.cached_list[0] != self.version:
+            self.cached_list = (self.version, list(self.entries.values()))
+        return self.cached_list[1]
+
+    def to_json(self):
+        """
+        :return: str: {"state": [entries], "version": version}, serialized only if the state changed since the last call
+        """
+        with self.lock: # the list and the version must be taken together, or the version may not match the list
+            version = self.version
+            if self.cached_json is not None and self.cached_json[0] == version:
+                return self.cached_json[1]
+            entries = self.current_list()
+        content = json.dumps({"state": entries, "version": version}) # the list is never modified, so outside the lock
+        with self.lock:
+            if self.version == version:
+                self.cached_json = (version, content)
+        return content
+
+    def diff(self, since):
+        """
+        Returns the changes after the given version: the current entries of the changed patients and the ids of the removed ones.
+
+        :param since (int): version the client already has
+        :return: dict {"version", "since", "updated", "removed"}, None if the changes since that version are no longer kept
+        """
+        with self.lock:
+            if since > self.version:
+                return None
+            oldest_kept = self.changes[0][0] if len(self.changes) > 0 else self.version + 1
+            if since < self.version and since + 1 < oldest_kept:
+                return None
+            changed = {} # patient_id -> entry or None, only the last change per patient
+            for version, patient_id, entry in reversed(self.changes):
+                if version <= since:
+                    break
+                if patient_id not in changed:
+                    changed[patient_id] = entry
+            return {"version": self.version,
+                    "since": since,
+                    "updated": [entry for entry in changed.values() if entry is not None],
+                    "removed": [patient_id for patient_id, entry in changed.items() if entry is None]}